@@ -0,0 +1,283 @@
+"""
+Benchmark timetable building, reading and queries on synthetic networks.
+
+Every benchmark is timed over a number of repetitions and the minimum, median,
+p90, p99 and maximum latency and peak memory (traced with tracemalloc in a
+separate run) are written as JSON. Queries are timed over 100 queries by default,
+so p99 is not just the slowest query. Results can be compared with a baseline
+JSON of an earlier run, which fails when the median latency got slower than the
+threshold.
+
+Run from the root of the repository with the package on the path, e.g. with
+`poetry run` or:
+
+    PYTHONPATH=. python benchmarks/benchmark.py -s small medium -o benchmarks/baseline.json
+    PYTHONPATH=. python benchmarks/benchmark.py -s small medium -b benchmarks/baseline.json
+"""
+import sys
+import json
+import argparse
+import platform
+import tempfile
+import tracemalloc
+from time import perf_counter
+from typing import Callable, Dict, List
+
+import numpy as np
+from loguru import logger
+
+from pyraptor import __version__
+from pyraptor.dao import read_timetable, write_timetable
+from pyraptor.gtfs.generator import generate_gtfs, to_gtfs_timetable
+from pyraptor.gtfs.timetable import gtfs_to_pyraptor_timetable
+from pyraptor.query_raptor import run_raptor
+from pyraptor.query_range_raptor import run_range_raptor
+from pyraptor.query_mcraptor import run_mcraptor
+from pyraptor.query_range_mcraptor import run_range_mcraptor
+from pyraptor.od_matrix import od_matrix
+
+NETWORKS = dict(
+    small=dict(stations=200, routes=20, stops_per_route=10, trips_per_route=20),
+    medium=dict(stations=2000, routes=200, stops_per_route=15, trips_per_route=40),
+    large=dict(stations=20000, routes=2000, stops_per_route=20, trips_per_route=50),
+)
+PERCENTILES = [90, 99]
+STATISTICS = ["mean", "min", "median"] + [f"p{p}" for p in PERCENTILES] + ["max"]
+ROUNDS = 5
+FIRST_DEPARTURE = 7 * 3600
+RANGE_WINDOW = 30 * 60
+
+
+def parse_arguments():
+    """Parse arguments"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-s",
+        "--sizes",
+        nargs="+",
+        default=["small", "medium"],
+        choices=list(NETWORKS),
+        help="Sizes of the generated networks",
+    )
+    parser.add_argument(
+        "-q",
+        "--queries",
+        type=int,
+        default=100,
+        help="Number of queries per query benchmark, at least 100 for a meaningful p99",
+    )
+    parser.add_argument(
+        "-r",
+        "--repeat",
+        type=int,
+        default=3,
+        help="Number of repetitions of the timetable benchmarks",
+    )
+    parser.add_argument(
+        "-o", "--output", type=str, default=None, help="Write results to JSON file"
+    )
+    parser.add_argument(
+        "-b",
+        "--baseline",
+        type=str,
+        default=None,
+        help="Compare results with baseline JSON file",
+    )
+    parser.add_argument(
+        "-t",
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="Allowed relative slowdown of median latency compared to baseline",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the networks")
+    arguments = parser.parse_args()
+    return arguments
+
+
+def main(sizes, queries, repeat, output, baseline, threshold, seed) -> int:
+    """Run benchmarks and return exit code, 1 if there are regressions"""
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+
+    results = dict(
+        meta=dict(
+            pyraptor=__version__,
+            python=platform.python_version(),
+            platform=platform.platform(),
+            seed=seed,
+        ),
+        results={size: run_benchmarks(size, queries, repeat, seed) for size in sizes},
+    )
+    print_results(results["results"])
+
+    if output is not None:
+        with open(output, "w") as handle:
+            json.dump(results, handle, indent=2)
+
+    if baseline is not None:
+        with open(baseline, "r") as handle:
+            baseline_results = json.load(handle)["results"]
+        regressions = compare(baseline_results, results["results"], threshold)
+        return 1 if regressions else 0
+    return 0
+
+
+def run_benchmarks(size: str, queries: int, repeat: int, seed: int) -> Dict[str, Dict]:
+    """Run all benchmarks on generated network of size"""
+    print(f"Network {size}: {NETWORKS[size]}")
+    gtfs = generate_gtfs(seed=seed, **NETWORKS[size])
+    gtfs_timetable = to_gtfs_timetable(gtfs)
+    timetable = gtfs_to_pyraptor_timetable(gtfs_timetable)
+
+    rng = np.random.default_rng(seed)
+    stations = sorted(station.name for station in timetable.stations)
+    origins = rng.choice(stations, size=queries).tolist()
+    dep_secs = (FIRST_DEPARTURE + 60 * rng.integers(0, 120, size=queries)).tolist()
+    query_args = list(zip(origins, dep_secs))
+
+    results = dict()
+    with tempfile.TemporaryDirectory() as folder:
+        write_timetable(folder, timetable, compiled=True)
+
+        results["gtfs_to_pyraptor_timetable"] = benchmark(
+            lambda: gtfs_to_pyraptor_timetable(gtfs_timetable), repeat
+        )
+        results["read_timetable"] = benchmark(lambda: read_timetable(folder), repeat)
+        results["read_compiled_timetable"] = benchmark(
+            lambda: read_timetable(folder, compiled=True), repeat
+        )
+
+    # Compile once, so queries are not timed with compiling the timetable
+    run_raptor(timetable, origins[0], dep_secs[0], ROUNDS)
+
+    for backend in ["python", "numpy"]:
+        results[f"run_raptor[{backend}]"] = benchmark_queries(
+            lambda o, d: run_raptor(timetable, o, d, ROUNDS, backend), query_args
+        )
+        results[f"run_range_raptor[{backend}]"] = benchmark_queries(
+            lambda o, d: run_range_raptor(
+                timetable, o, d, d + RANGE_WINDOW, ROUNDS, backend
+            ),
+            query_args,
+        )
+    results["run_raptor[csa]"] = benchmark_queries(
+        lambda o, d: run_raptor(timetable, o, d, ROUNDS, engine="csa"), query_args
+    )
+    results["run_mcraptor"] = benchmark_queries(
+        lambda o, d: run_mcraptor(timetable, o, d, ROUNDS), query_args
+    )
+    results["run_range_mcraptor"] = benchmark_queries(
+        lambda o, d: run_range_mcraptor(timetable, o, d, d + RANGE_WINDOW, ROUNDS),
+        query_args[: max(len(query_args) // 5, 1)],
+    )
+    results["od_matrix"] = benchmark(
+        lambda: od_matrix(timetable, origins, dep_secs[0], ROUNDS), repeat
+    )
+
+    return results
+
+
+def benchmark(function: Callable, repeat: int) -> Dict[str, float]:
+    """Latencies and peak memory of calling function repeatedly"""
+    latencies = [timed(function) for _ in range(repeat)]
+    return summarize(latencies, peak_memory(function))
+
+
+def benchmark_queries(function: Callable, query_args: List) -> Dict[str, float]:
+    """Latencies and peak memory of function called with every query arguments"""
+    latencies = [timed(lambda args=args: function(*args)) for args in query_args]
+    return summarize(latencies, peak_memory(lambda: function(*query_args[0])))
+
+
+def timed(function: Callable) -> float:
+    """Seconds it takes to call function"""
+    start = perf_counter()
+    function()
+    return perf_counter() - start
+
+
+def peak_memory(function: Callable) -> float:
+    """Peak memory in MB allocated while calling function"""
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / 2 ** 20
+
+
+def summarize(latencies: List[float], peak_memory_mb: float) -> Dict[str, float]:
+    """Summary of latencies in seconds and peak memory"""
+    summary = dict(
+        n=len(latencies),
+        mean=float(np.mean(latencies)),
+        min=float(np.min(latencies)),
+        median=float(np.median(latencies)),
+        **{
+            f"p{percentile}": float(np.percentile(latencies, percentile))
+            for percentile in PERCENTILES
+        },
+        max=float(np.max(latencies)),
+        peak_memory_mb=peak_memory_mb,
+    )
+    print(f"  {len(latencies)} runs, median {summary['median']:.4f}s", flush=True)
+    return summary
+
+
+def compare(baseline: Dict, results: Dict, threshold: float) -> List[str]:
+    """Benchmarks with median latency above baseline by more than threshold"""
+    regressions = []
+    print(f"\n{'benchmark':<50} {'baseline':>10} {'current':>10} {'change':>8}")
+    for size, size_results in results.items():
+        for name, result in size_results.items():
+            expected = baseline.get(size, {}).get(name)
+            if expected is None:
+                continue
+
+            change = result["median"] / expected["median"] - 1
+            regressed = change > threshold
+            print(
+                f"{size + '/' + name:<50} {expected['median']:>10.4f}"
+                f" {result['median']:>10.4f}"
+                f" {change:>+8.1%}{'  REGRESSION' if regressed else ''}"
+            )
+            if regressed:
+                regressions.append(f"{size}/{name}")
+
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) above {threshold:.0%}: {regressions}")
+    return regressions
+
+
+def print_results(results: Dict) -> None:
+    """Print table of results"""
+    columns = STATISTICS
+    print(
+        f"\n{'benchmark':<50} {'n':>4}"
+        + "".join(f" {c:>10}" for c in columns)
+        + f" {'peak MB':>10}"
+    )
+    for size, size_results in results.items():
+        for name, result in size_results.items():
+            print(
+                f"{size + '/' + name:<50} {result['n']:>4}"
+                + "".join(f" {result[c]:>10.4f}" for c in columns)
+                + f" {result['peak_memory_mb']:>10.1f}"
+            )
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    sys.exit(
+        main(
+            args.sizes,
+            args.queries,
+            args.repeat,
+            args.output,
+            args.baseline,
+            args.threshold,
+            args.seed,
+        )
+    )
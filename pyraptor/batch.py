@@ -0,0 +1,214 @@
+"""Run batches of RAPTOR queries in worker processes sharing the timetable"""
+from __future__ import annotations
+import os
+import math
+from typing import Dict, List, Tuple, Union
+from multiprocessing.shared_memory import SharedMemory
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from loguru import logger
+
+from pyraptor.dao.timetable import (
+    compiled_arrays,
+    compiled_tables,
+    compiled_to_timetable,
+)
+from pyraptor.model.structures import Timetable
+from pyraptor.model.compiled import compile_timetable
+from pyraptor.model.raptor import RaptorAlgorithm
+from pyraptor.query_raptor import run_raptor
+from pyraptor.util import LARGE_NUMBER
+
+ALIGNMENT = 64  # Byte alignment of arrays in shared memory
+
+_timetable = None  # Timetable of worker process
+
+
+class SharedTimetable:
+    """
+    Compiled timetable in shared memory.
+
+    The arrays of the compiled timetable are copied once into a block of shared
+    memory. Pickling a shared timetable only pickles the name of the block, the
+    layout of the arrays and the string tables, so a process attaches to the
+    arrays with attach instead of receiving a copy.
+    The creating process owns the block and frees it with close.
+    """
+
+    def __init__(self, timetable: Timetable):
+        compiled = compile_timetable(timetable)
+        arrays = compiled_arrays(compiled)
+
+        # Offset, dtype and shape of every array in the block
+        self.layout = {}
+        size = 0
+        for name, values in arrays.items():
+            offset = math.ceil(size / ALIGNMENT) * ALIGNMENT
+            self.layout[name] = (offset, values.dtype.str, values.shape)
+            size = offset + values.nbytes
+
+        self.memory = SharedMemory(create=True, size=max(size, 1))
+        for name, values in arrays.items():
+            self._array(name)[...] = values
+
+        self.tables = compiled_tables(compiled)
+        self.version = timetable.version
+        self.owner = True
+
+        logger.debug(f"Shared compiled timetable of {size} bytes in {self.memory.name}")
+
+    def __getstate__(self):
+        return dict(
+            name=self.memory.name,
+            layout=self.layout,
+            tables=self.tables,
+            version=self.version,
+        )
+
+    def __setstate__(self, state):
+        self.memory = SharedMemory(name=state["name"])
+        self.layout = state["layout"]
+        self.tables = state["tables"]
+        self.version = state["version"]
+        self.owner = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _array(self, name: str) -> np.ndarray:
+        offset, dtype, shape = self.layout[name]
+        return np.ndarray(shape, dtype=dtype, buffer=self.memory.buf, offset=offset)
+
+    def attach(self) -> Timetable:
+        """Timetable on the read-only arrays in shared memory"""
+        arrays = {}
+        for name in self.layout:
+            arrays[name] = self._array(name)
+            arrays[name].flags.writeable = False
+        return compiled_to_timetable(arrays, self.tables, self.version)
+
+    def close(self) -> None:
+        """Free shared memory, only by the creating process"""
+        if self.owner:
+            self.memory.close()
+            self.memory.unlink()
+            self.owner = False
+
+
+class BatchQueries:
+    """
+    Run batches of RAPTOR queries from (origin station, departure time) in a pool
+    of worker processes.
+
+    The workers attach to the compiled timetable in shared memory once, so the
+    timetable is not copied to every worker. Queries are sent to the workers in
+    chunks. The timetable should not be modified while the batch runs.
+    """
+
+    def __init__(self, timetable: Timetable, workers: int = None):
+        self.timetable = timetable
+        self.workers = workers or os.cpu_count() or 1
+        self.shared = SharedTimetable(timetable)
+        self.pool = ProcessPoolExecutor(
+            max_workers=self.workers, initializer=_init_worker, initargs=(self.shared,)
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self) -> None:
+        """Shut down workers and free shared memory"""
+        self.pool.shutdown()
+        self.shared.close()
+
+    def run(
+        self,
+        queries: List[Tuple[str, int]],
+        rounds: int,
+        backend: str = "python",
+        date: str = None,
+        overnight: bool = False,
+        journeys: bool = False,
+        chunksize: int = None,
+    ) -> List[Dict[str, Union[int, List[Dict]]]]:
+        """
+        Run RAPTOR for every (origin station, departure time in seconds).
+
+        :return: result per query in order of queries, i.e. the earliest arrival
+            time per reachable destination station, or with journeys the journey to
+            every destination station as list of legs
+        """
+        for origin_station, _ in queries:
+            if self.timetable.stations.get(origin_station) is None:
+                raise ValueError(f"Unknown station '{origin_station}'")
+        if len(queries) == 0:
+            return []
+
+        if chunksize is None:
+            chunksize = math.ceil(len(queries) / (4 * self.workers))
+        tasks = [
+            (origin_station, dep_secs, rounds, backend, date, overnight, journeys)
+            for origin_station, dep_secs in queries
+        ]
+        return list(self.pool.map(_run_query, tasks, chunksize=chunksize))
+
+
+def run_batch(
+    timetable: Timetable,
+    queries: List[Tuple[str, int]],
+    rounds: int,
+    backend: str = "python",
+    date: str = None,
+    overnight: bool = False,
+    journeys: bool = False,
+    workers: int = None,
+) -> List[Dict[str, Union[int, List[Dict]]]]:
+    """Run batch of RAPTOR queries in a new pool of workers, see BatchQueries.run"""
+    with BatchQueries(timetable, workers) as batch:
+        return batch.run(queries, rounds, backend, date, overnight, journeys)
+
+
+def _init_worker(shared: SharedTimetable) -> None:
+    """Attach to timetable in shared memory once in worker process"""
+    global _timetable  # pylint: disable=global-statement
+    _timetable = shared.attach()
+
+
+def _run_query(task: Tuple) -> Dict[str, Union[int, List[Dict]]]:
+    """Run query on timetable of worker process"""
+    origin_station, dep_secs, rounds, backend, date, overnight, journeys = task
+    timetable = _timetable
+
+    if journeys:
+        journey_to_destinations = run_raptor(
+            timetable,
+            origin_station,
+            dep_secs,
+            rounds,
+            backend,
+            date=date,
+            overnight=overnight,
+        )
+        return {
+            station: journey.to_list()
+            for station, journey in journey_to_destinations.items()
+        }
+
+    raptor = RaptorAlgorithm(timetable, backend, date, overnight)
+    raptor.run(timetable.stations.get(origin_station).stops, dep_secs, rounds)
+    arrival_times = raptor.station_arrival_times()[rounds]
+
+    return {
+        station.name: arrival_time
+        for station, arrival_time in zip(
+            raptor.compiled.stations, arrival_times.tolist()
+        )
+        if arrival_time < LARGE_NUMBER and station.name != origin_station
+    }
@@ -0,0 +1,204 @@
+"""Cache of query results"""
+import os
+import uuid
+import shutil
+import hashlib
+import threading
+from pathlib import Path
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Tuple
+
+import joblib
+from loguru import logger
+
+from pyraptor.model.structures import Timetable
+from pyraptor.model.compiled import compile_timetable
+from pyraptor.util import mkdir_if_not_exists, SECONDS_PER_DAY
+
+
+class QueryCache:
+    """
+    Cache of query results with least-recently-used eviction.
+
+    Results are keyed on the timetable version, the query function, the origin
+    station, the departure time, the number of rounds and the other query
+    arguments. A query is run at the first departure from the origin station at
+    or after its departure time, or at the end of its departure time bucket if
+    there is no departure in the bucket. Nothing can be reached from the origin
+    before its next departure, so the result is exact and is shared by all
+    departure times in the bucket up to the same departure.
+
+    At most `max_size` results are kept in memory. If a folder is given, results
+    are also written to disk and read from disk when evicted from memory. A
+    timetable gets a new version every time it is written, so results of
+    earlier versions of the timetable are not used anymore. Results on disk of
+    other versions are removed when the first result of a version is written.
+
+    Results are shared between queries and should not be modified.
+    """
+
+    def __init__(self, max_size: int = 1024, folder: str = None, bucket_secs: int = 60):
+        if max_size < 1:
+            raise ValueError("Cache should hold at least one result")
+        if bucket_secs < 1:
+            raise ValueError("Departure time bucket should be at least one second")
+
+        self.max_size = max_size
+        self.folder = folder
+        self.bucket_secs = bucket_secs
+        self.results = OrderedDict()
+        self.disk_version = None  # timetable version of results written to disk
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.results)
+
+    def query(
+        self,
+        function: Callable,
+        timetable: Timetable,
+        origin_station: str,
+        dep_secs: int,
+        rounds: int,
+        *args,
+        **kwargs,
+    ) -> Any:
+        """
+        Result of query function, e.g. run_raptor or run_mcraptor, with the
+        departure time rounded up to the end of its bucket.
+        """
+        run_dep_secs = self.departure_time(timetable, origin_station, dep_secs)
+        key = (
+            self.version(timetable),
+            f"{function.__module__}.{function.__qualname__}",
+            origin_station,
+            run_dep_secs,
+            rounds,
+            args,
+            tuple(sorted(kwargs.items())),
+        )
+
+        found, result = self.get(key)
+        if found:
+            return result
+
+        result = function(
+            timetable, origin_station, run_dep_secs, rounds, *args, **kwargs
+        )
+        self.put(key, result)
+        return result
+
+    def bucket(self, dep_secs: int) -> int:
+        """Departure time at end of bucket of departure time"""
+        return -(-dep_secs // self.bucket_secs) * self.bucket_secs
+
+    def departure_time(
+        self, timetable: Timetable, origin_station: str, dep_secs: int
+    ) -> int:
+        """
+        Departure time to run the query of dep_secs at, i.e. the first departure
+        from the origin station at or after dep_secs, also of trips on the next
+        day, or the end of the bucket of dep_secs if there is none before it
+        """
+        dep_bucket = self.bucket(dep_secs)
+        station = timetable.stations.get(origin_station)
+        if station is None:
+            return dep_bucket
+
+        compiled = compile_timetable(timetable)
+        departures = [dep_bucket]
+        for offset in [0, SECONDS_PER_DAY]:
+            departures.extend(
+                departure + offset
+                for departure in compiled.departures_in_range(
+                    station.stops, dep_secs - offset, dep_bucket - offset
+                )
+            )
+        return min(departures)
+
+    @staticmethod
+    def version(timetable: Timetable) -> str:
+        """
+        Version of timetable. Timetables that are not written get a version when
+        first queried, so their results are only shared within this process.
+        """
+        if timetable.version is None:
+            timetable.version = uuid.uuid4().hex
+        return timetable.version
+
+    def get(self, key: Tuple[Hashable, ...]) -> Tuple[bool, Any]:
+        """Whether the result of key is cached and the result"""
+        with self.lock:
+            if key in self.results:
+                self.results.move_to_end(key)
+                self.hits += 1
+                return True, self.results[key]
+
+        filename = self.filename(key)
+        if filename is not None and os.path.exists(filename):
+            logger.debug(f"Loading cached result '{filename}'")
+            try:
+                with open(filename, "rb") as handle:
+                    result = joblib.load(handle)
+            except FileNotFoundError:
+                # Removed by another cache writing a newer timetable version
+                pass
+            else:
+                with self.lock:
+                    self.hits += 1
+                    self._add(key, result)
+                return True, result
+
+        with self.lock:
+            self.misses += 1
+        return False, None
+
+    def put(self, key: Tuple[Hashable, ...], result: Any) -> None:
+        """Cache result of key"""
+        filename = self.filename(key)
+        if filename is not None:
+            if key[0] != self.disk_version:
+                self.prune(key[0])
+            mkdir_if_not_exists(filename.parent)
+            with open(filename, "wb") as handle:
+                joblib.dump(result, handle)
+
+        with self.lock:
+            self._add(key, result)
+
+    def _add(self, key, result) -> None:
+        """Add result in memory and evict least recently used results"""
+        self.results[key] = result
+        self.results.move_to_end(key)
+        while len(self.results) > self.max_size:
+            self.results.popitem(last=False)
+
+    def filename(self, key: Tuple[Hashable, ...]) -> Path:
+        """File of result on disk, results are grouped per timetable version"""
+        if self.folder is None:
+            return None
+        digest = hashlib.sha1(repr(key[1:]).encode("utf-8")).hexdigest()
+        return Path(self.folder, key[0], f"{digest}.pcl")
+
+    def prune(self, version: str) -> None:
+        """Remove results on disk of other timetable versions than version"""
+        self.disk_version = version
+        for path in Path(self.folder).glob("*"):
+            if path.is_dir() and path.name != version:
+                logger.debug(f"Removing cached results '{path}'")
+                shutil.rmtree(path, ignore_errors=True)
+
+    def clear(self) -> None:
+        """Remove results from memory, results on disk are kept"""
+        with self.lock:
+            self.results.clear()
+            self.hits = 0
+            self.misses = 0
+
+    @property
+    def hit_rate(self) -> float:
+        """Fraction of queries answered from cache"""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
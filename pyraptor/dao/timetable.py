@@ -1,17 +1,30 @@
 """Data access object for timetable"""
 import os
+import json
+import uuid
 from pathlib import Path
+from dataclasses import fields, replace
 
 from loguru import logger
 import joblib
+import numpy as np
 
-from pyraptor.model.structures import Timetable
+from pyraptor.model.structures import Timetable, Stop, Stops, Station, Stations
+from pyraptor.model.compiled import CompiledTimetable, CompiledTrips, compile_timetable
 from pyraptor.util import mkdir_if_not_exists
 
+COMPILED_FOLDER = "compiled"
+COMPILED_FORMAT = "pyraptor-compiled-timetable"
+COMPILED_VERSION = 2
 
-def read_timetable(input_folder: str) -> Timetable:
+
+def read_timetable(input_folder: str, compiled: bool = False) -> Timetable:
     """
     Read the timetable data from the cache directory
+
+    :param input_folder: cache directory
+    :param compiled: read memory-mapped compiled timetable instead of pickle,
+        which only supports the RAPTOR algorithm
     """
 
     def load_joblib(name):
@@ -25,6 +38,9 @@ def read_timetable(input_folder: str) -> Timetable:
             " first to create timetable from GTFS files."
         )
 
+    if compiled:
+        return read_compiled_timetable(input_folder)
+
     logger.debug("Using cached datastructures")
 
     timetable: Timetable = load_joblib("timetable")
@@ -32,9 +48,18 @@ def read_timetable(input_folder: str) -> Timetable:
     return timetable
 
 
-def write_timetable(output_folder: str, timetable: Timetable) -> None:
+def write_timetable(
+    output_folder: str, timetable: Timetable, compiled: bool = False
+) -> None:
     """
-    Write the timetable to output directory
+    Write the timetable to output directory.
+
+    Every write gives the timetable a new version, which invalidates cached query
+    results of earlier versions.
+
+    :param output_folder: output directory
+    :param timetable: timetable
+    :param compiled: also write the compiled timetable as memory-mappable arrays
     """
 
     def write_joblib(state, name):
@@ -43,5 +68,160 @@ def write_timetable(output_folder: str, timetable: Timetable) -> None:
 
     logger.info("Write PyRaptor timetable to output directory")
 
+    timetable.version = uuid.uuid4().hex
+
     mkdir_if_not_exists(output_folder)
-    write_joblib(timetable, "timetable")
+    # The compiled timetable is a cache, it is compiled again after reading
+    write_joblib(replace(timetable, compiled=None), "timetable")
+
+    if compiled:
+        write_compiled_timetable(output_folder, timetable)
+
+
+def write_compiled_timetable(output_folder: str, timetable: Timetable) -> None:
+    """
+    Write the compiled timetable to output directory.
+
+    Every array is written as .npy file, so it can be memory-mapped when reading.
+    Identifiers and names of stops, stations and trips are written as string tables.
+    A manifest with the format version and the arrays is written last.
+    """
+    logger.info("Write compiled PyRaptor timetable to output directory")
+
+    compiled = compile_timetable(timetable)
+    folder = Path(output_folder, COMPILED_FOLDER)
+    mkdir_if_not_exists(folder)
+
+    arrays = {}
+    for name, values in compiled_arrays(compiled).items():
+        np.save(Path(folder, f"{name}.npy"), values)
+        arrays[name] = dict(dtype=values.dtype.str, shape=list(values.shape))
+
+    tables = compiled_tables(compiled)
+    with open(Path(folder, "tables.json"), "w") as handle:
+        json.dump(tables, handle, default=_to_builtin)
+
+    manifest = dict(
+        format=COMPILED_FORMAT,
+        version=COMPILED_VERSION,
+        timetable_version=timetable.version,
+        arrays=arrays,
+        tables=list(tables.keys()),
+    )
+    with open(Path(folder, "manifest.json"), "w") as handle:
+        json.dump(manifest, handle, indent=2)
+
+
+def read_compiled_timetable(input_folder: str) -> Timetable:
+    """
+    Read the compiled timetable from the cache directory.
+
+    The arrays are memory-mapped read-only, so loading does not read the arrays and
+    processes reading the same timetable share the pages. Stops and stations are
+    created when reading, trips are only created when accessed. The timetable has
+    no routes, trip stop times and transfers other than in the compiled arrays.
+    """
+    folder = Path(input_folder, COMPILED_FOLDER)
+    if not os.path.exists(Path(folder, "manifest.json")):
+        raise IOError(
+            "Compiled PyRaptor timetable not found. Run `python pyraptor/gtfs/timetable.py"
+            " --compiled` first to create compiled timetable from GTFS files."
+        )
+
+    with open(Path(folder, "manifest.json"), "r") as handle:
+        manifest = json.load(handle)
+    if (
+        manifest.get("format") != COMPILED_FORMAT
+        or manifest.get("version") != COMPILED_VERSION
+    ):
+        raise ValueError(
+            f"Compiled timetable has format {manifest.get('format')} version "
+            f"{manifest.get('version')}, expected {COMPILED_FORMAT} version "
+            f"{COMPILED_VERSION}. Write the timetable again."
+        )
+
+    logger.debug("Using memory-mapped compiled timetable")
+
+    arrays = {
+        name: np.load(Path(folder, f"{name}.npy"), mmap_mode="r")
+        for name in manifest["arrays"]
+    }
+    with open(Path(folder, "tables.json"), "r") as handle:
+        tables = json.load(handle)
+
+    return compiled_to_timetable(arrays, tables, manifest.get("timetable_version"))
+
+
+def compiled_to_timetable(arrays, tables, version: str = None) -> Timetable:
+    """
+    Timetable of compiled arrays and string tables, i.e. compiled_arrays and
+    compiled_tables of a compiled timetable. The arrays are used as is, so they can
+    be memory-mapped or in shared memory.
+    """
+    stations = Stations()
+    for station_id, station_name in zip(tables["station_id"], tables["station_name"]):
+        stations.add(Station(station_id, station_name))
+    station_list = list(stations)
+
+    stops = Stops()
+    for stop_id, stop_name, platform_code, station in zip(
+        tables["stop_id"],
+        tables["stop_name"],
+        tables["stop_platform_code"],
+        arrays["stop_station"].tolist(),
+    ):
+        stop = Stop(stop_id, stop_name, station_list[station], platform_code)
+        station_list[station].add_stop(stop)
+        stops.add(stop)
+
+    trips = CompiledTrips(
+        tables["trip_id"], tables["trip_hint"], tables["trip_long_name"]
+    )
+    compiled = CompiledTimetable(
+        stops=list(stops),
+        stations=station_list,
+        trips=trips,
+        service_dates=tables["service_date"],
+        **arrays,
+    )
+    trips.compiled = compiled
+
+    return Timetable(
+        stations=stations,
+        stops=stops,
+        trips=trips,
+        service_dates=compiled.service_dates or None,
+        version=version,
+        compiled=compiled,
+    )
+
+
+def compiled_arrays(compiled: CompiledTimetable):
+    """Arrays of compiled timetable by name"""
+    return {
+        f.name: getattr(compiled, f.name)
+        for f in fields(compiled)
+        if f.init and isinstance(getattr(compiled, f.name), np.ndarray)
+    }
+
+
+def compiled_tables(compiled: CompiledTimetable):
+    """Identifiers and names of stops, stations and trips of compiled timetable"""
+    return dict(
+        stop_id=[stop.id for stop in compiled.stops],
+        stop_name=[stop.name for stop in compiled.stops],
+        stop_platform_code=[stop.platform_code for stop in compiled.stops],
+        station_id=[station.id for station in compiled.stations],
+        station_name=[station.name for station in compiled.stations],
+        trip_id=[trip.id for trip in compiled.trips],
+        trip_hint=[trip.hint for trip in compiled.trips],
+        trip_long_name=[trip.long_name for trip in compiled.trips],
+        service_date=compiled.service_dates,
+    )
+
+
+def _to_builtin(value):
+    """Convert numpy scalars in string tables to builtin types"""
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Cannot write {type(value)} to string table")
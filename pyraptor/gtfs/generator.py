@@ -0,0 +1,346 @@
+"""Generate synthetic GTFS timetables"""
+import os
+import argparse
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+from pyraptor.gtfs.timetable import GtfsTimetable, gtfs_to_pyraptor_timetable
+from pyraptor.model.structures import Timetable
+from pyraptor.util import mkdir_if_not_exists, sec2str_series
+
+AGENCY_ID = "SYN"
+SERVICE_ID = 1
+DWELL_TIME = 60  # Seconds between arrival and departure at intermediate stops
+SECONDS_PER_CELL = 120  # Running time between neighbouring stations on the grid
+
+NEIGHBOURS = np.array(
+    [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1) if (dx, dy) != (0, 0)]
+)
+
+
+def parse_arguments():
+    """Parse arguments"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        default="data/input/synthetic-gtfs",
+        help="Output directory",
+    )
+    parser.add_argument(
+        "-d", "--date", type=str, default="20211201", help="First date (yyyymmdd)"
+    )
+    parser.add_argument(
+        "--days", type=int, default=1, help="Number of dates the trips run on"
+    )
+    parser.add_argument("--stations", type=int, default=1000, help="Number of stations")
+    parser.add_argument(
+        "--platforms", type=int, default=2, help="Number of platforms per station"
+    )
+    parser.add_argument("--routes", type=int, default=200, help="Number of routes")
+    parser.add_argument(
+        "--stops-per-route", type=int, default=15, help="Number of stops per route"
+    )
+    parser.add_argument(
+        "--trips-per-route",
+        type=int,
+        default=50,
+        help="Number of trips per route and direction",
+    )
+    parser.add_argument(
+        "--headway", type=int, default=1200, help="Seconds between trips of a route"
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the generator")
+    arguments = parser.parse_args()
+    return arguments
+
+
+def main(
+    output_folder: str,
+    date: str,
+    days: int,
+    stations: int,
+    platforms: int,
+    routes: int,
+    stops_per_route: int,
+    trips_per_route: int,
+    headway: int,
+    seed: int,
+):
+    """Generate synthetic GTFS files"""
+
+    logger.debug("Output directory    : {}", output_folder)
+    logger.debug("Date                : {}", date)
+    logger.debug("Days                : {}", days)
+    logger.debug("Stations            : {}", stations)
+    logger.debug("Platforms           : {}", platforms)
+    logger.debug("Routes              : {}", routes)
+    logger.debug("Stops per route     : {}", stops_per_route)
+    logger.debug("Trips per route     : {}", trips_per_route)
+    logger.debug("Headway             : {}", headway)
+    logger.debug("Seed                : {}", seed)
+
+    gtfs = generate_gtfs(
+        stations=stations,
+        platforms=platforms,
+        routes=routes,
+        stops_per_route=stops_per_route,
+        trips_per_route=trips_per_route,
+        headway=headway,
+        date=date,
+        days=days,
+        seed=seed,
+    )
+    write_gtfs(output_folder, gtfs)
+
+
+def generate_gtfs(
+    stations: int = 100,
+    platforms: int = 2,
+    routes: int = 20,
+    stops_per_route: int = 10,
+    trips_per_route: int = 20,
+    headway: int = 1200,
+    first_departure: int = 6 * 3600,
+    date: str = "20211201",
+    days: int = 1,
+    seed: int = 0,
+) -> Dict[str, pd.DataFrame]:
+    """
+    Generate the GTFS tables of a synthetic network by GTFS file name.
+
+    Stations lie on a square grid and every route is a random walk of at most
+    `stops_per_route` neighbouring stations, starting at stations in random
+    order. Routes run in both directions with `trips_per_route` trips each,
+    `headway` seconds apart. Stop times are in seconds since midnight.
+    The same arguments always give the same tables.
+    """
+    rng = np.random.default_rng(seed)
+
+    logger.info(
+        f"Generate GTFS for {stations} stations and {routes} routes (seed {seed})"
+    )
+
+    # Stations on a grid with jitter, coordinates in cells
+    width = int(np.ceil(np.sqrt(stations)))
+    grid = np.stack([np.arange(stations) % width, np.arange(stations) // width], axis=1)
+    coords = grid + rng.uniform(-0.3, 0.3, size=(stations, 2))
+
+    station_ids = np.array([f"S{i}" for i in range(stations)], dtype=object)
+    station_names = np.array([f"Station {i}" for i in range(stations)], dtype=object)
+    platform_ids = np.char.add(
+        np.repeat(station_ids.astype(str), platforms),
+        np.tile([f"_{p + 1}" for p in range(platforms)], stations),
+    )
+
+    stops = pd.concat(
+        [
+            pd.DataFrame(
+                dict(
+                    stop_id=station_ids,
+                    stop_code=station_ids,
+                    stop_name=station_names,
+                    stop_lat=coords[:, 1],
+                    stop_lon=coords[:, 0],
+                    location_type=1,
+                    parent_station=None,
+                    platform_code=None,
+                )
+            ),
+            pd.DataFrame(
+                dict(
+                    stop_id=platform_ids,
+                    stop_code=np.repeat(station_ids, platforms),
+                    stop_name=np.repeat(station_names, platforms),
+                    stop_lat=np.repeat(coords[:, 1], platforms),
+                    stop_lon=np.repeat(coords[:, 0], platforms),
+                    location_type=0,
+                    parent_station=np.repeat(station_ids, platforms),
+                    platform_code=np.tile(
+                        [str(p + 1) for p in range(platforms)], stations
+                    ),
+                )
+            ),
+        ],
+        ignore_index=True,
+    )
+
+    # Routes as random walks over the grid
+    cell_station = {tuple(cell): station for station, cell in enumerate(grid)}
+    starts = rng.permutation(stations)
+
+    route_rows, trip_frames, stop_time_frames = [], [], []
+    trip_number = 0
+    for route in range(routes):
+        walk = [starts[route % stations]]
+        while len(walk) < stops_per_route:
+            candidates = [
+                cell_station.get(tuple(grid[walk[-1]] + step)) for step in NEIGHBOURS
+            ]
+            candidates = [c for c in candidates if c is not None and c not in walk]
+            if not candidates:
+                break
+            walk.append(candidates[rng.integers(len(candidates))])
+        if len(walk) < 2:
+            continue
+
+        walk = np.array(walk)
+        distances = np.linalg.norm(np.diff(coords[walk], axis=0), axis=1)
+        running_times = np.maximum(
+            np.round(distances * SECONDS_PER_CELL / 60) * 60, 60
+        ).astype(np.int64)
+        route_offset = int(rng.integers(max(headway // 60, 1))) * 60
+        route_rows.append((route, AGENCY_ID, str(route), f"Route {route}", 2))
+
+        for direction in (0, 1):
+            route_stations = walk if direction == 0 else walk[::-1]
+            hops = running_times if direction == 0 else running_times[::-1]
+            n_stops = len(route_stations)
+
+            # Arrival and departure offsets from first departure of trip
+            dwell = np.full(n_stops, DWELL_TIME, dtype=np.int64)
+            dwell[[0, -1]] = 0
+            arr_offsets = np.concatenate([[0], np.cumsum(hops + dwell[:-1])])
+            dep_offsets = arr_offsets + dwell
+
+            departures = first_departure + route_offset + headway * np.arange(
+                trips_per_route
+            )
+            trip_ids = np.array(
+                [f"{route}_{direction}_{i}" for i in range(trips_per_route)],
+                dtype=object,
+            )
+            trip_frames.append(
+                pd.DataFrame(
+                    dict(
+                        route_id=route,
+                        service_id=SERVICE_ID,
+                        trip_id=trip_ids,
+                        trip_short_name=trip_number + np.arange(trips_per_route),
+                        trip_long_name="Synthetic",
+                        direction_id=direction,
+                    )
+                )
+            )
+            trip_number += trips_per_route
+
+            route_platforms = route_stations * platforms + rng.integers(
+                platforms, size=n_stops
+            )
+            stop_time_frames.append(
+                pd.DataFrame(
+                    dict(
+                        trip_id=np.repeat(trip_ids, n_stops),
+                        stop_sequence=np.tile(np.arange(1, n_stops + 1), trips_per_route),
+                        stop_id=np.tile(platform_ids[route_platforms], trips_per_route),
+                        arrival_time=(departures[:, None] + arr_offsets).ravel(),
+                        departure_time=(departures[:, None] + dep_offsets).ravel(),
+                    )
+                )
+            )
+
+    dates = (
+        pd.date_range(pd.to_datetime(date, format="%Y%m%d"), periods=days)
+        .strftime("%Y%m%d")
+        .tolist()
+    )
+
+    gtfs = dict(
+        agency=pd.DataFrame(
+            dict(
+                agency_id=[AGENCY_ID],
+                agency_name=[AGENCY_ID],
+                agency_url=["https://example.com"],
+                agency_timezone=["Europe/Amsterdam"],
+            )
+        ),
+        routes=pd.DataFrame(
+            route_rows,
+            columns=[
+                "route_id",
+                "agency_id",
+                "route_short_name",
+                "route_long_name",
+                "route_type",
+            ],
+        ),
+        trips=pd.concat(trip_frames, ignore_index=True),
+        calendar_dates=pd.DataFrame(
+            dict(service_id=SERVICE_ID, date=dates, exception_type=1)
+        ),
+        stops=stops,
+        stop_times=pd.concat(stop_time_frames, ignore_index=True),
+    )
+
+    logger.info(
+        f"Generated {len(gtfs['trips'])} trips and {len(gtfs['stop_times'])} stop times"
+    )
+
+    return gtfs
+
+
+def write_gtfs(output_folder: str, gtfs: Dict[str, pd.DataFrame]) -> None:
+    """Write generated GTFS tables as GTFS files, readable by read_gtfs_timetable"""
+    logger.info(f"Write GTFS files to {output_folder}")
+
+    mkdir_if_not_exists(output_folder)
+    for name, table in gtfs.items():
+        if name == "stop_times":
+            table = table.assign(
+                arrival_time=sec2str_series(table["arrival_time"]),
+                departure_time=sec2str_series(table["departure_time"]),
+            )
+        table.to_csv(os.path.join(output_folder, f"{name}.txt"), index=False)
+
+
+def generate_timetable(**kwargs) -> Timetable:
+    """
+    Generate timetable of a synthetic network, equal to reading the GTFS files of
+    generate_gtfs with the same arguments. See generate_gtfs for the arguments.
+    """
+    return gtfs_to_pyraptor_timetable(to_gtfs_timetable(generate_gtfs(**kwargs)))
+
+
+def to_gtfs_timetable(gtfs: Dict[str, pd.DataFrame]) -> GtfsTimetable:
+    """Generated GTFS tables as read by read_gtfs_timetable"""
+    dates = gtfs["calendar_dates"].date.tolist()
+
+    stop_times = gtfs["stop_times"]
+    stops = gtfs["stops"]
+    stops = stops.loc[stops.stop_id.isin(stop_times.stop_id.unique())]
+
+    trips = gtfs["trips"][
+        ["route_id", "service_id", "trip_id", "trip_short_name", "trip_long_name"]
+    ].copy()
+    trips["trip_short_name"] = trips["trip_short_name"].astype("Int64")
+
+    gtfs_timetable = GtfsTimetable()
+    gtfs_timetable.trips = trips
+    gtfs_timetable.stop_times = stop_times
+    gtfs_timetable.stops = stops[
+        ["stop_id", "stop_name", "parent_station", "platform_code"]
+    ].copy()
+    gtfs_timetable.service_dates = dates
+    gtfs_timetable.service_days = dict.fromkeys(trips.trip_id, (1 << len(dates)) - 1)
+
+    return gtfs_timetable
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    main(
+        args.output,
+        args.date,
+        args.days,
+        args.stations,
+        args.platforms,
+        args.routes,
+        args.stops_per_route,
+        args.trips_per_route,
+        args.headway,
+        args.seed,
+    )
@@ -5,11 +5,12 @@ from typing import List
 from dataclasses import dataclass
 from collections import defaultdict
 
+import numpy as np
 import pandas as pd
 from loguru import logger
 
 from pyraptor.dao import write_timetable
-from pyraptor.util import mkdir_if_not_exists, str2sec, TRANSFER_COST
+from pyraptor.util import mkdir_if_not_exists, str2sec_series, TRANSFER_COST
 from pyraptor.model.structures import (
     Timetable,
     Stop,
@@ -26,6 +27,23 @@ from pyraptor.model.structures import (
 )
 
 
+STOP_TIMES_COLUMNS = [
+    "trip_id",
+    "stop_sequence",
+    "stop_id",
+    "arrival_time",
+    "departure_time",
+]
+STOP_TIMES_DTYPES = {
+    "trip_id": str,
+    "stop_sequence": np.int32,
+    "stop_id": str,
+    "arrival_time": str,
+    "departure_time": str,
+}
+STOP_TIMES_CHUNKSIZE = 1_000_000
+
+
 @dataclass
 class GtfsTimetable:
     """Gtfs Timetable data"""
@@ -34,6 +52,8 @@ class GtfsTimetable:
     calendar = None
     stop_times = None
     stops = None
+    service_dates = None
+    service_days = None
 
 
 def parse_arguments():
@@ -56,8 +76,19 @@ def parse_arguments():
     parser.add_argument(
         "-d", "--date", type=str, default="20210906", help="Departure date (yyyymmdd)"
     )
+    parser.add_argument(
+        "--days",
+        type=int,
+        default=1,
+        help="Number of departure dates from date to include in timetable",
+    )
     parser.add_argument("-a", "--agencies", nargs="+", default=["NS"])
     parser.add_argument("--icd", action="store_true", help="Add ICD fare(s)")
+    parser.add_argument(
+        "--compiled",
+        action="store_true",
+        help="Also write compiled timetable as memory-mappable arrays",
+    )
     arguments = parser.parse_args()
     return arguments
 
@@ -68,21 +99,27 @@ def main(
     departure_date: str,
     agencies: List[str],
     icd_fix: bool = False,
+    compiled: bool = False,
+    days: int = 1,
 ):
     """Main function"""
 
     logger.info("Parse timetable from GTFS files")
     mkdir_if_not_exists(output_folder)
 
-    gtfs_timetable = read_gtfs_timetable(input_folder, departure_date, agencies)
+    gtfs_timetable = read_gtfs_timetable(input_folder, departure_date, agencies, days)
     timetable = gtfs_to_pyraptor_timetable(gtfs_timetable, icd_fix)
-    write_timetable(output_folder, timetable)
+    write_timetable(output_folder, timetable, compiled)
 
 
 def read_gtfs_timetable(
-    input_folder: str, departure_date: str, agencies: List[str]
+    input_folder: str, departure_date: str, agencies: List[str], days: int = 1
 ) -> GtfsTimetable:
-    """Extract operators from GTFS data"""
+    """
+    Extract operators from GTFS data for the departure dates starting at
+    departure_date. Trips running on multiple dates are included once, with the
+    dates they run on as bitset.
+    """
 
     logger.info("Read GTFS data")
 
@@ -107,7 +144,9 @@ def read_gtfs_timetable(
     # Read trips
     logger.debug("Read Trips")
 
-    trips = pd.read_csv(os.path.join(input_folder, "trips.txt"))
+    trips = pd.read_csv(
+        os.path.join(input_folder, "trips.txt"), dtype={"trip_id": str}
+    )
     trips = trips[trips.route_id.isin(routes.route_id.values)]
     trips = trips[
         [
@@ -128,29 +167,26 @@ def read_gtfs_timetable(
     )
     calendar = calendar[calendar.service_id.isin(trips.service_id.values)]
 
-    # Add date to trips and filter on departure date
+    # Add date to trips and filter on departure dates
+    service_dates = (
+        pd.date_range(pd.to_datetime(departure_date, format="%Y%m%d"), periods=days)
+        .strftime("%Y%m%d")
+        .tolist()
+    )
     trips = trips.merge(calendar[["service_id", "date"]], on="service_id")
-    trips = trips[trips.date == departure_date]
+    trips = trips[trips.date.isin(service_dates)]
+
+    # Service days of trips as bitset of the indices of the dates
+    day_index = {date: day for day, date in enumerate(service_dates)}
+    service_days = defaultdict(int)
+    for trip_id, date in zip(trips.trip_id, trips.date):
+        service_days[trip_id] |= 1 << day_index[date]
+    trips = trips.drop(columns=["date"]).drop_duplicates(subset=["trip_id"])
 
     # Read stop times
     logger.debug("Read Stop Times")
 
-    stop_times = pd.read_csv(
-        os.path.join(input_folder, "stop_times.txt"), dtype={"stop_id": str}
-    )
-    stop_times = stop_times[stop_times.trip_id.isin(trips.trip_id.values)]
-    stop_times = stop_times[
-        [
-            "trip_id",
-            "stop_sequence",
-            "stop_id",
-            "arrival_time",
-            "departure_time",
-        ]
-    ]
-    # Convert times to seconds
-    stop_times["arrival_time"] = stop_times["arrival_time"].apply(str2sec)
-    stop_times["departure_time"] = stop_times["departure_time"].apply(str2sec)
+    stop_times = read_stop_times(input_folder, trips.trip_id.values)
 
     # Read stops (platforms)
     logger.debug("Read Stops")
@@ -185,10 +221,42 @@ def read_gtfs_timetable(
     gtfs_timetable.trips = trips
     gtfs_timetable.stop_times = stop_times
     gtfs_timetable.stops = stops
+    gtfs_timetable.service_dates = service_dates
+    gtfs_timetable.service_days = service_days
 
     return gtfs_timetable
 
 
+def read_stop_times(
+    input_folder: str, trip_ids: List[str], chunksize: int = STOP_TIMES_CHUNKSIZE
+) -> pd.DataFrame:
+    """
+    Read stop times of trips in chunks, so only the stop times of the trips are kept
+    in memory instead of all stop times in the GTFS data.
+    Only the required columns are read and times are converted to seconds per chunk.
+    """
+    trip_ids = set(trip_ids)
+    chunks = []
+    for chunk in pd.read_csv(
+        os.path.join(input_folder, "stop_times.txt"),
+        usecols=STOP_TIMES_COLUMNS,
+        dtype=STOP_TIMES_DTYPES,
+        chunksize=chunksize,
+    ):
+        chunk = chunk[chunk.trip_id.isin(trip_ids)]
+
+        # Convert times to seconds
+        chunk = chunk.assign(
+            arrival_time=str2sec_series(chunk["arrival_time"]),
+            departure_time=str2sec_series(chunk["departure_time"]),
+        )
+        chunks.append(chunk[STOP_TIMES_COLUMNS])
+
+    if not chunks:
+        return pd.DataFrame(columns=STOP_TIMES_COLUMNS)
+    return pd.concat(chunks, ignore_index=True)
+
+
 def gtfs_to_pyraptor_timetable(
     gtfs_timetable: GtfsTimetable, icd_fix: bool = False
 ) -> Timetable:
@@ -230,6 +298,8 @@ def gtfs_to_pyraptor_timetable(
         trip = Trip()
         trip.hint = trip_row.trip_short_name  # i.e. treinnummer
         trip.long_name = trip_row.trip_long_name  # e.g., Sprinter
+        # Trips without service days run on every date
+        trip.service_days = (gtfs_timetable.service_days or {}).get(trip_row.trip_id)
 
         # Iterate over stops
         sort_stop_times = sorted(
@@ -246,13 +316,14 @@ def gtfs_to_pyraptor_timetable(
             # GTFS files do not contain ICD supplement fare, so hard-coded here
             fare = calculate_icd_fare(trip, stop, stations) if icd_fix is True else 0
             trip_stop_time = TripStopTime(trip, stopidx, stop, dts_arr, dts_dep, fare)
-
-            trip_stop_times.add(trip_stop_time)
             trip.add_stop_time(trip_stop_time)
 
-        # Add trip
+        # Add trip, trip stop times are indexed by trip so are added once it has an id
         if trip:
             trips.add(trip)
+        if trip.id is not None:
+            for trip_stop_time in trip.stop_times:
+                trip_stop_times.add(trip_stop_time)
 
     # Routes
     logger.debug("Add routes")
@@ -284,6 +355,7 @@ def gtfs_to_pyraptor_timetable(
         trip_stop_times=trip_stop_times,
         routes=routes,
         transfers=transfers,
+        service_dates=gtfs_timetable.service_dates,
     )
     timetable.counts()
 
@@ -307,4 +379,12 @@ def calculate_icd_fare(trip: Trip, stop: Stop, stations: Stations) -> int:
 
 if __name__ == "__main__":
     args = parse_arguments()
-    main(args.input, args.output, args.date, args.agencies, args.icd)
+    main(
+        args.input,
+        args.output,
+        args.date,
+        args.agencies,
+        args.icd,
+        args.compiled,
+        args.days,
+    )
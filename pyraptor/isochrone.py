@@ -0,0 +1,255 @@
+"""Isochrone of earliest arrival times from an origin station to all stations with RAPTOR"""
+import argparse
+from dataclasses import dataclass
+from time import perf_counter
+from typing import Dict, List
+
+import numpy as np
+from loguru import logger
+
+from pyraptor.dao.timetable import read_timetable
+from pyraptor.model.structures import Timetable
+from pyraptor.model.raptor import RaptorAlgorithm, BACKENDS, first_round_with_arrival
+from pyraptor.util import str2sec, sec2str, LARGE_NUMBER
+
+
+def parse_arguments():
+    """Parse arguments"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-i",
+        "--input",
+        type=str,
+        default="data/output",
+        help="Input directory",
+    )
+    parser.add_argument(
+        "-or",
+        "--origin",
+        type=str,
+        default="Hertogenbosch ('s)",
+        help="Origin station of the isochrone",
+    )
+    parser.add_argument(
+        "-t", "--time", type=str, default="08:35:00", help="Departure time (hh:mm:ss)"
+    )
+    parser.add_argument(
+        "-r",
+        "--rounds",
+        type=int,
+        default=5,
+        help="Number of rounds to execute the RAPTOR algorithm",
+    )
+    parser.add_argument(
+        "-th",
+        "--thresholds",
+        type=int,
+        nargs="+",
+        default=[15, 30, 45, 60],
+        help="Travel time thresholds of the buckets in minutes",
+    )
+    parser.add_argument(
+        "-b",
+        "--backend",
+        type=str,
+        default="python",
+        choices=BACKENDS,
+        help="Backend of the RAPTOR algorithm",
+    )
+    parser.add_argument(
+        "-c",
+        "--compiled",
+        action="store_true",
+        help="Read memory-mapped compiled timetable",
+    )
+    parser.add_argument(
+        "-dt",
+        "--date",
+        type=str,
+        default=None,
+        help="Departure date (yyyymmdd), required for timetables with multiple dates",
+    )
+    parser.add_argument(
+        "--overnight",
+        action="store_true",
+        help="Continue journeys with trips of the next day",
+    )
+    arguments = parser.parse_args()
+    return arguments
+
+
+def main(
+    input_folder: str,
+    origin_station: str,
+    departure_time: str,
+    rounds: int,
+    thresholds: List[int],
+    backend: str = "python",
+    compiled: bool = False,
+    date: str = None,
+    overnight: bool = False,
+):
+    """Run isochrone query and print stations per travel time bucket"""
+
+    logger.debug("Input directory      : {}", input_folder)
+    logger.debug("Origin station       : {}", origin_station)
+    logger.debug("Departure time       : {}", departure_time)
+    logger.debug("Rounds               : {}", str(rounds))
+    logger.debug("Thresholds (minutes) : {}", thresholds)
+    logger.debug("Backend              : {}", backend)
+    logger.debug("Compiled             : {}", compiled)
+    logger.debug("Date                 : {}", date)
+    logger.debug("Overnight            : {}", overnight)
+
+    timetable = read_timetable(input_folder, compiled)
+
+    start = perf_counter()
+    isochrone = run_isochrone(
+        timetable,
+        origin_station,
+        str2sec(departure_time),
+        rounds,
+        backend,
+        date=date,
+        overnight=overnight,
+    )
+    logger.info("Isochrone query time : {}", perf_counter() - start)
+
+    buckets = isochrone.buckets([60 * minutes for minutes in thresholds])
+    for threshold, stations in buckets.items():
+        logger.info(f"Within {sec2str(threshold)}: {len(stations)} stations")
+
+
+@dataclass
+class Isochrone:
+    """
+    Earliest arrival times in seconds from an origin station to all stations,
+    as rounds x stations, i.e. row k has the earliest arrival times with at most
+    k trips. Unreachable stations have arrival time LARGE_NUMBER.
+    """
+
+    origin: str
+    dep_secs: int
+    stations: List[str]
+    round_arrival_times: np.ndarray
+
+    @property
+    def arrival_times(self) -> np.ndarray:
+        """Earliest arrival time per station over all rounds"""
+        return self.round_arrival_times[-1]
+
+    @property
+    def reachable(self) -> np.ndarray:
+        """Mask of reachable stations"""
+        return self.arrival_times < LARGE_NUMBER
+
+    @property
+    def travel_times(self) -> np.ndarray:
+        """Travel time per station in seconds, LARGE_NUMBER if unreachable"""
+        return np.where(
+            self.reachable, self.arrival_times - self.dep_secs, LARGE_NUMBER
+        )
+
+    @property
+    def n_trips(self) -> np.ndarray:
+        """Fewest trips per station with the earliest arrival time, -1 if unreachable"""
+        return first_round_with_arrival(self.round_arrival_times)
+
+    def buckets(self, thresholds: List[int]) -> Dict[int, List[str]]:
+        """Stations per travel time bucket, see bucket_stations"""
+        return bucket_stations(self.stations, self.travel_times, thresholds)
+
+    def to_dict(self, thresholds: List[int] = None) -> Dict:
+        """Arrival times per reachable station, and buckets if thresholds are given"""
+        reachable = self.reachable
+        stations = np.asarray(self.stations, dtype=object)[reachable].tolist()
+        result = dict(
+            origin=self.origin,
+            dep_secs=self.dep_secs,
+            arrival_times=dict(zip(stations, self.arrival_times[reachable].tolist())),
+            n_trips=dict(zip(stations, self.n_trips[reachable].tolist())),
+        )
+        if thresholds is not None:
+            result["buckets"] = self.buckets(thresholds)
+        return result
+
+
+def run_isochrone(
+    timetable: Timetable,
+    origin_station: str,
+    dep_secs: int,
+    rounds: int,
+    backend: str = "python",
+    date: str = None,
+    overnight: bool = False,
+    return_stats: bool = False,
+) -> Isochrone:
+    """
+    Run the Raptor algorithm and read the earliest arrival times per station
+    and round from the labels, so no journeys are reconstructed.
+
+    :param timetable: timetable
+    :param origin_station: Name of origin station
+    :param dep_secs: Time of departure in seconds
+    :param rounds: Number of iterations to perform
+    :param backend: Backend of the RAPTOR algorithm, i.e. python or numpy
+    :param date: Departure date (yyyymmdd), only trips running on date are used
+    :param overnight: Continue journeys with trips of the next day
+    :param return_stats: Return the QueryStats of the query as well, i.e.
+        (isochrone, stats)
+    """
+    station = timetable.stations.get(origin_station)
+    if station is None:
+        raise ValueError(f"Unknown station '{origin_station}'")
+
+    raptor = RaptorAlgorithm(timetable, backend, date, overnight)
+    raptor.run(station.stops, dep_secs, rounds)
+
+    isochrone = Isochrone(
+        origin=origin_station,
+        dep_secs=dep_secs,
+        stations=[station.name for station in raptor.compiled.stations],
+        round_arrival_times=raptor.station_arrival_times(),
+    )
+
+    if return_stats:
+        return isochrone, raptor.stats
+    return isochrone
+
+
+def bucket_stations(
+    stations: List[str], travel_times: np.ndarray, thresholds: List[int]
+) -> Dict[int, List[str]]:
+    """
+    Stations per travel time bucket, i.e. the stations with a travel time above
+    the previous threshold up to and including the threshold.
+    Stations with a travel time above the last threshold are left out.
+
+    :param stations: Names of stations
+    :param travel_times: Travel time per station in seconds
+    :param thresholds: Ascending travel time thresholds in seconds
+    """
+    if np.any(np.diff(thresholds) <= 0):
+        raise ValueError(f"Thresholds {thresholds} are not ascending")
+
+    bucket = np.searchsorted(thresholds, travel_times, side="left")
+    names = np.asarray(stations, dtype=object)
+    return {
+        threshold: names[bucket == index].tolist()
+        for index, threshold in enumerate(thresholds)
+    }
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    main(
+        args.input,
+        args.origin,
+        args.time,
+        args.rounds,
+        args.thresholds,
+        args.backend,
+        args.compiled,
+        args.date,
+        args.overnight,
+    )
@@ -0,0 +1,488 @@
+"""Timetable compiled to contiguous arrays for routing"""
+from __future__ import annotations
+
+from typing import List, Dict, Sequence
+from datetime import datetime, timedelta
+from collections.abc import Sequence as SequenceABC
+from dataclasses import dataclass, field, replace
+
+import numpy as np
+from loguru import logger
+
+from pyraptor.model.structures import (
+    Timetable,
+    Stop,
+    Station,
+    Trip,
+    TripStopTime,
+    day_index,
+)
+from pyraptor.util import LARGE_NUMBER
+
+
+@dataclass
+class CompiledTimetable:
+    """
+    Timetable compiled to contiguous arrays.
+
+    Stops, stations, routes and trips are identified by their index in the arrays.
+    Route relations are stored in CSR format, i.e. the stops of route r are
+    route_stops[route_stops_ptr[r]:route_stops_ptr[r + 1]].
+    The departure and arrival times of route r form a trips x stops matrix that is
+    stored flat in dep and arr starting at route_times_ptr[r].
+    Trips of a route are ordered by departure time at the first stop. Per stop of a
+    route the departure times are also stored sorted in dep_sorted, with the
+    corresponding trip rows in dep_sorted_trip, as a stops x trips matrix.
+    The fare of every stop time is stored in fare, in the same layout as dep.
+    Routes flagged in route_fifo have no overtaking trips, so their trips are
+    ordered by departure and arrival time at every stop.
+    The service days of trip t are a bitset over the indices of service_dates, packed
+    little-endian in the bytes service_days[t]. A compiled timetable with only the
+    trips running on a date is created by for_date.
+    """
+
+    stops: List[Stop]
+    stations: List[Station]
+    trips: Sequence[Trip]
+    service_dates: List[str]
+
+    stop_station: np.ndarray  # station index per stop
+    station_stops_ptr: np.ndarray
+    station_stops: np.ndarray
+
+    route_stops_ptr: np.ndarray
+    route_stops: np.ndarray
+    stop_routes_ptr: np.ndarray
+    stop_routes: np.ndarray
+    stop_routes_pos: np.ndarray  # position of stop in route of stop_routes
+
+    route_trips_ptr: np.ndarray
+    service_days: np.ndarray
+    route_fifo: np.ndarray
+    route_times_ptr: np.ndarray
+    dep: np.ndarray
+    arr: np.ndarray
+    fare: np.ndarray
+    dep_sorted: np.ndarray
+    dep_sorted_trip: np.ndarray
+
+    transfers_ptr: np.ndarray
+    transfers_to: np.ndarray
+    transfers_time: np.ndarray
+
+    stop_index: Dict[Stop, int] = field(init=False, repr=False)
+    station_index: Dict[str, int] = field(init=False, repr=False)
+    date_timetables: Dict[str, CompiledTimetable] = field(init=False, repr=False)
+    connections: Dict[bool, object] = field(init=False, repr=False)
+    departure_keys: np.ndarray = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self.stop_index = {stop: index for index, stop in enumerate(self.stops)}
+        self.station_index = {
+            station.id: index for index, station in enumerate(self.stations)
+        }
+        self.date_timetables = dict()
+        self.connections = dict()  # connections by overnight, compiled by CSA
+        self.departure_keys = None  # sorted departures as search keys, by RAPTOR
+
+    def __repr__(self):
+        return (
+            f"CompiledTimetable(n_stops={self.n_stops}, n_routes={self.n_routes}, "
+            f"n_trips={self.n_trips}, n_stop_times={len(self.dep)})"
+        )
+
+    @property
+    def n_stops(self) -> int:
+        """Number of stops"""
+        return len(self.stop_station)
+
+    @property
+    def n_stations(self) -> int:
+        """Number of stations"""
+        return len(self.station_stops_ptr) - 1
+
+    @property
+    def n_routes(self) -> int:
+        """Number of routes"""
+        return len(self.route_stops_ptr) - 1
+
+    @property
+    def n_trips(self) -> int:
+        """Number of trips"""
+        return int(self.route_trips_ptr[-1])
+
+    def stops_of_route(self, route: int) -> np.ndarray:
+        """Stop indices of route in order of travel"""
+        return self.route_stops[self.route_stops_ptr[route] : self.route_stops_ptr[route + 1]]
+
+    def routes_of_stop(self, stop: int):
+        """Route indices serving stop and position of stop in these routes"""
+        start, end = self.stop_routes_ptr[stop], self.stop_routes_ptr[stop + 1]
+        return self.stop_routes[start:end], self.stop_routes_pos[start:end]
+
+    def stops_of_station(self, station: int) -> np.ndarray:
+        """Stop indices of station"""
+        return self.station_stops[
+            self.station_stops_ptr[station] : self.station_stops_ptr[station + 1]
+        ]
+
+    def transfers_of_stop(self, stop: int):
+        """Transfer destination stops and transfer times from stop"""
+        start, end = self.transfers_ptr[stop], self.transfers_ptr[stop + 1]
+        return self.transfers_to[start:end], self.transfers_time[start:end]
+
+    def route_departures(self, route: int) -> np.ndarray:
+        """Departure times of route as trips x stops matrix"""
+        return self._route_matrix(self.dep, route)
+
+    def route_arrivals(self, route: int) -> np.ndarray:
+        """Arrival times of route as trips x stops matrix"""
+        return self._route_matrix(self.arr, route)
+
+    def route_sorted_departures(self, route: int):
+        """
+        Sorted departure times per stop of route and the trip row of each departure,
+        both as stops x trips matrix
+        """
+        return (
+            self._route_matrix(self.dep_sorted, route, transposed=True),
+            self._route_matrix(self.dep_sorted_trip, route, transposed=True),
+        )
+
+    def _route_matrix(
+        self, times: np.ndarray, route: int, transposed: bool = False
+    ) -> np.ndarray:
+        n_trips = self.route_trips_ptr[route + 1] - self.route_trips_ptr[route]
+        n_stops = self.route_stops_ptr[route + 1] - self.route_stops_ptr[route]
+        start = self.route_times_ptr[route]
+        times = times[start : start + n_trips * n_stops]
+        if transposed:
+            return times.reshape(n_stops, n_trips)
+        return times.reshape(n_trips, n_stops)
+
+    def stop_indices(self, stops: List[Stop]) -> List[int]:
+        """Stop indices of stops"""
+        return [self.stop_index[stop] for stop in stops]
+
+    def day_index(self, date: str) -> int:
+        """Index of service date, None for all trips if no date is given"""
+        return day_index(self.service_dates, date)
+
+    def active_trips(self, date: str) -> np.ndarray:
+        """Mask of trips running on date"""
+        day = self.day_index(date)
+        if day is None:
+            return np.ones(self.n_trips, dtype=bool)
+        return (self.service_days[:, day // 8] >> (day % 8) & 1).astype(bool)
+
+    def for_date(self, date: str) -> CompiledTimetable:
+        """
+        Compiled timetable with only the trips running on date, or all trips if no
+        date is given. The result is cached, so filtering is done once per date.
+        """
+        if self.day_index(date) is None:
+            return self
+        if date not in self.date_timetables:
+            logger.debug(f"Compile timetable for date {date}")
+            self.date_timetables[date] = _filter_trips(self, self.active_trips(date))
+        return self.date_timetables[date]
+
+    def for_next_date(self, date: str) -> CompiledTimetable:
+        """
+        Compiled timetable with only the trips running on the day after date, or None
+        if that day is not in the timetable. Without date all trips run every day.
+        """
+        if self.day_index(date) is None:
+            return self
+        next_date = datetime.strptime(date, "%Y%m%d") + timedelta(days=1)
+        next_date = next_date.strftime("%Y%m%d")
+        if next_date not in self.service_dates:
+            return None
+        return self.for_date(next_date)
+
+    def route_of_trip(self, trip: int) -> int:
+        """Route index of trip"""
+        return int(np.searchsorted(self.route_trips_ptr, trip, side="right") - 1)
+
+    def departures_in_range(
+        self, stops: List[Stop], dep_secs_min: int, dep_secs_max: int
+    ) -> List[int]:
+        """Unique departure times from stops within range, latest first"""
+        departures = set()
+        for stop in self.stop_indices(stops):
+            for route, position in zip(*self.routes_of_stop(stop)):
+                stop_departures = self.route_departures(route)[:, position]
+                departures.update(
+                    stop_departures[
+                        (stop_departures >= dep_secs_min)
+                        & (stop_departures <= dep_secs_max)
+                    ].tolist()
+                )
+        return sorted(departures, reverse=True)
+
+
+class TripsSubset(SequenceABC):
+    """Subset of trips with the given indices"""
+
+    def __init__(self, trips: Sequence[Trip], indices: np.ndarray):
+        self.trips = trips
+        self.indices = indices
+
+    def __repr__(self):
+        return f"TripsSubset(n_trips={len(self)})"
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, index: int) -> Trip:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return self.trips[int(self.indices[index])]
+
+
+class CompiledTrips(SequenceABC):
+    """
+    Trips of a compiled timetable that are created from the arrays when accessed,
+    so a timetable read from disk does not create objects for all trips
+    """
+
+    def __init__(
+        self,
+        ids: List,
+        hints: List,
+        long_names: List,
+        compiled: CompiledTimetable = None,
+    ):
+        self.ids = ids
+        self.hints = hints
+        self.long_names = long_names
+        self.compiled = compiled
+        self.cache: Dict[int, Trip] = dict()
+
+    def __repr__(self):
+        return f"CompiledTrips(n_trips={len(self)})"
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, index: int) -> Trip:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        trip = self.cache.get(index)
+        if trip is None:
+            trip = self.cache[index] = self.create_trip(index)
+        return trip
+
+    def create_trip(self, index: int) -> Trip:
+        """Create trip with its stop times from the arrays"""
+        compiled = self.compiled
+        trip = Trip(
+            id=self.ids[index], hint=self.hints[index], long_name=self.long_names[index]
+        )
+        if compiled.service_dates:
+            trip.service_days = int.from_bytes(
+                compiled.service_days[index].tobytes(), "little"
+            )
+        route = compiled.route_of_trip(index)
+        row = index - compiled.route_trips_ptr[route]
+        stops = compiled.stops_of_route(route)
+        start = compiled.route_times_ptr[route] + row * len(stops)
+        for stopidx, stop in enumerate(stops.tolist()):
+            dts_arr = compiled.arr[start + stopidx]
+            dts_dep = compiled.dep[start + stopidx]
+            trip.add_stop_time(
+                TripStopTime(
+                    trip,
+                    stopidx,
+                    compiled.stops[stop],
+                    int(dts_arr) if dts_arr < LARGE_NUMBER else np.nan,
+                    int(dts_dep) if dts_dep < LARGE_NUMBER else np.nan,
+                    float(compiled.fare[start + stopidx]),
+                )
+            )
+        return trip
+
+
+def compile_timetable(timetable: Timetable) -> CompiledTimetable:
+    """
+    Compile timetable to contiguous arrays.
+
+    The result is cached on the timetable, so compiling is done once per timetable.
+    """
+    if isinstance(timetable, CompiledTimetable):
+        return timetable
+    if timetable.compiled is None:
+        timetable.compiled = _compile(timetable)
+    return timetable.compiled
+
+
+def _as_seconds(values: List[float]) -> np.ndarray:
+    """Convert times to int32 seconds, missing times are never reachable"""
+    values = np.asarray(values, dtype=np.float64)
+    values[~np.isfinite(values)] = LARGE_NUMBER
+    return values.astype(np.int32)
+
+
+def _csr(n_rows: int, rows: np.ndarray, *columns: np.ndarray):
+    """Group columns by rows in CSR format, keeping the original order within a row"""
+    order = np.argsort(rows, kind="stable")
+    ptr = np.zeros(n_rows + 1, dtype=np.int32)
+    np.cumsum(np.bincount(rows, minlength=n_rows), out=ptr[1:])
+    return (ptr,) + tuple(column[order].astype(np.int32) for column in columns)
+
+
+def _compile(timetable: Timetable) -> CompiledTimetable:
+    """Compile timetable"""
+    logger.debug("Compile timetable to arrays")
+
+    stops = list(timetable.stops)
+    stations = list(timetable.stations)
+    stop_index = {stop: index for index, stop in enumerate(stops)}
+    station_index = {station: index for index, station in enumerate(stations)}
+
+    stop_station = np.array(
+        [station_index[stop.station] for stop in stops], dtype=np.int32
+    )
+    station_stops_ptr, station_stops = _csr(
+        len(stations), stop_station, np.arange(len(stops))
+    )
+
+    # Routes with their trips ordered by departure at the first stop
+    trips = []
+    route_stops, route_stops_ptr = [], [0]
+    route_trips_ptr, route_times_ptr = [0], [0]
+    route_fifo = []
+    dep, arr, fare = [], [], []
+    for route in timetable.routes:
+        route_trips = sorted(route.trips, key=lambda trip: trip.stop_times[0].dts_dep)
+        trips.extend(route_trips)
+        route_stops.extend(stop_index[stop] for stop in route.stops)
+        route_stops_ptr.append(len(route_stops))
+        route_trips_ptr.append(len(trips))
+        for trip in route_trips:
+            dep.extend(tst.dts_dep for tst in trip.stop_times)
+            arr.extend(tst.dts_arr for tst in trip.stop_times)
+            fare.extend(tst.fare for tst in trip.stop_times)
+        route_times_ptr.append(len(dep))
+        route_fifo.append(route.fifo)
+    route_stops = np.array(route_stops, dtype=np.int32)
+    route_stops_ptr = np.array(route_stops_ptr, dtype=np.int32)
+    route_trips_ptr = np.array(route_trips_ptr, dtype=np.int32)
+    route_times_ptr = np.array(route_times_ptr, dtype=np.int64)
+    dep, arr = _as_seconds(dep), _as_seconds(arr)
+
+    # Departures sorted per stop of route
+    dep_sorted, dep_sorted_trip = _sort_departures(
+        dep, route_trips_ptr, route_times_ptr
+    )
+
+    # Service days of trips packed in bytes
+    service_dates = list(timetable.service_dates or [])
+    n_bytes = (len(service_dates) + 7) // 8
+    all_days = (1 << len(service_dates)) - 1
+    service_days = np.zeros((len(trips), n_bytes), dtype=np.uint8)
+    for index, trip in enumerate(trips):
+        days = trip.service_days if trip.service_days is not None else all_days
+        service_days[index] = np.frombuffer(
+            days.to_bytes(n_bytes, "little"), dtype=np.uint8
+        )
+
+    # Routes serving stop and position of stop in route
+    route_of_stop = np.repeat(
+        np.arange(len(route_stops_ptr) - 1), np.diff(route_stops_ptr)
+    )
+    position_in_route = np.arange(len(route_stops)) - route_stops_ptr[route_of_stop]
+    stop_routes_ptr, stop_routes, stop_routes_pos = _csr(
+        len(stops), route_stops, route_of_stop, position_in_route
+    )
+
+    # Transfers
+    transfers = list(timetable.transfers) if timetable.transfers is not None else []
+    transfers_from = np.array(
+        [stop_index[t.from_stop] for t in transfers], dtype=np.int32
+    )
+    transfers_ptr, transfers_to, transfers_time = _csr(
+        len(stops),
+        transfers_from,
+        np.array([stop_index[t.to_stop] for t in transfers], dtype=np.int32),
+        np.array([t.layovertime for t in transfers], dtype=np.int32),
+    )
+
+    return CompiledTimetable(
+        stops=stops,
+        stations=stations,
+        trips=trips,
+        service_dates=service_dates,
+        stop_station=stop_station,
+        station_stops_ptr=station_stops_ptr,
+        station_stops=station_stops,
+        route_stops_ptr=route_stops_ptr,
+        route_stops=route_stops,
+        stop_routes_ptr=stop_routes_ptr,
+        stop_routes=stop_routes,
+        stop_routes_pos=stop_routes_pos,
+        route_trips_ptr=route_trips_ptr,
+        service_days=service_days,
+        route_fifo=np.array(route_fifo, dtype=bool),
+        route_times_ptr=route_times_ptr,
+        dep=dep,
+        arr=arr,
+        fare=np.array(fare, dtype=np.float64),
+        dep_sorted=dep_sorted,
+        dep_sorted_trip=dep_sorted_trip,
+        transfers_ptr=transfers_ptr,
+        transfers_to=transfers_to,
+        transfers_time=transfers_time,
+    )
+
+
+def _sort_departures(
+    dep: np.ndarray, route_trips_ptr: np.ndarray, route_times_ptr: np.ndarray
+):
+    """Departures sorted per stop of route and the trip row of each departure"""
+    dep_sorted = np.empty_like(dep)
+    dep_sorted_trip = np.empty_like(dep)
+    for route in range(len(route_trips_ptr) - 1):
+        start, end = route_times_ptr[route], route_times_ptr[route + 1]
+        departures = dep[start:end].reshape(
+            route_trips_ptr[route + 1] - route_trips_ptr[route], -1
+        )
+        order = np.argsort(departures, axis=0, kind="stable")
+        dep_sorted[start:end] = np.take_along_axis(departures, order, axis=0).T.ravel()
+        dep_sorted_trip[start:end] = order.T.ravel()
+    return dep_sorted, dep_sorted_trip
+
+
+def _filter_trips(compiled: CompiledTimetable, active: np.ndarray) -> CompiledTimetable:
+    """Compiled timetable with only the active trips"""
+    n_routes = compiled.n_routes
+    route_n_stops = np.diff(compiled.route_stops_ptr)
+    trip_route = np.repeat(np.arange(n_routes), np.diff(compiled.route_trips_ptr))
+    stop_times_active = np.repeat(active, route_n_stops[trip_route])
+
+    route_trips_ptr = np.zeros(n_routes + 1, dtype=np.int32)
+    np.cumsum(
+        np.bincount(trip_route[active], minlength=n_routes), out=route_trips_ptr[1:]
+    )
+    route_times_ptr = np.zeros(n_routes + 1, dtype=np.int64)
+    np.cumsum(np.diff(route_trips_ptr) * route_n_stops, out=route_times_ptr[1:])
+
+    dep = compiled.dep[stop_times_active]
+    dep_sorted, dep_sorted_trip = _sort_departures(
+        dep, route_trips_ptr, route_times_ptr
+    )
+
+    return replace(
+        compiled,
+        trips=TripsSubset(compiled.trips, np.flatnonzero(active)),
+        route_trips_ptr=route_trips_ptr,
+        service_days=compiled.service_days[active],
+        route_times_ptr=route_times_ptr,
+        dep=dep,
+        arr=compiled.arr[stop_times_active],
+        fare=compiled.fare[stop_times_active],
+        dep_sorted=dep_sorted,
+        dep_sorted_trip=dep_sorted_trip,
+    )
@@ -0,0 +1,230 @@
+"""Connection Scan Algorithm"""
+from __future__ import annotations
+from typing import Iterator, List, Tuple
+from dataclasses import dataclass
+from time import perf_counter
+
+import numpy as np
+from loguru import logger
+
+from pyraptor.dao.timetable import Timetable
+from pyraptor.model.structures import Stop
+from pyraptor.model.compiled import CompiledTimetable, compile_timetable
+from pyraptor.model.raptor import RoundLabels
+from pyraptor.model.stats import QueryStats
+from pyraptor.util import LARGE_NUMBER, SECONDS_PER_DAY
+
+CHUNK_SIZE = 4096  # Connections converted to lists at once while scanning
+
+
+@dataclass
+class Connections:
+    """
+    Elementary connections of all trips, i.e. a trip departing from a stop and
+    arriving at the next stop, sorted by departure time and arrival time.
+    Trip indices from the number of trips of the compiled timetable on are trips
+    on the next day, with their times offset by a day.
+    """
+
+    from_stop: np.ndarray
+    to_stop: np.ndarray
+    dep: np.ndarray
+    arr: np.ndarray
+    trip: np.ndarray
+
+    def __len__(self):
+        return len(self.dep)
+
+    def iter_from(self, first: int) -> Iterator[Tuple[int, int, int, int, int]]:
+        """
+        Connections as (from stop, to stop, dep, arr, trip) from index first,
+        converted to lists in chunks so an early stop does not convert all
+        """
+        for start in range(first, len(self), CHUNK_SIZE):
+            end = start + CHUNK_SIZE
+            yield from zip(
+                self.from_stop[start:end].tolist(),
+                self.to_stop[start:end].tolist(),
+                self.dep[start:end].tolist(),
+                self.arr[start:end].tolist(),
+                self.trip[start:end].tolist(),
+            )
+
+
+def compile_connections(
+    compiled: CompiledTimetable, next_compiled: CompiledTimetable = None
+) -> Connections:
+    """
+    Connections of the trips of compiled and of next_compiled on the next day.
+
+    The result is cached on compiled, so compiling is done once per timetable.
+    """
+    overnight = next_compiled is not None
+    if overnight not in compiled.connections:
+        logger.debug("Compile connections")
+        days = [_route_connections(compiled)]
+        if overnight:
+            days.append(
+                _route_connections(next_compiled, compiled.n_trips, SECONDS_PER_DAY)
+            )
+        from_stop, to_stop, dep, arr, trip = [np.concatenate(c) for c in zip(*days)]
+        order = np.lexsort((arr, dep))
+        compiled.connections[overnight] = Connections(
+            from_stop=from_stop[order],
+            to_stop=to_stop[order],
+            dep=dep[order],
+            arr=arr[order],
+            trip=trip[order],
+        )
+    return compiled.connections[overnight]
+
+
+def _route_connections(compiled: CompiledTimetable, first_trip=0, offset=0):
+    """Connections between consecutive stops of every trip of compiled"""
+    n_route_stops = np.diff(compiled.route_stops_ptr)
+    n_route_trips = np.diff(compiled.route_trips_ptr)
+
+    # Route, trip and position of every stop time, i.e. element of dep and arr
+    route = np.repeat(np.arange(compiled.n_routes), n_route_stops * n_route_trips)
+    element = np.arange(len(compiled.dep)) - compiled.route_times_ptr[route]
+    position = element % n_route_stops[route]
+    trip = compiled.route_trips_ptr[route] + element // n_route_stops[route]
+
+    # Connection from every stop time to the stop time at the next stop
+    departing = np.flatnonzero(position < n_route_stops[route] - 1)
+    dep = compiled.dep[departing].astype(np.int64)
+    arr = compiled.arr[departing + 1].astype(np.int64)
+    stop = compiled.route_stops_ptr[route[departing]] + position[departing]
+    valid = (dep < LARGE_NUMBER) & (arr < LARGE_NUMBER)
+
+    return (
+        compiled.route_stops[stop[valid]],
+        compiled.route_stops[stop[valid] + 1],
+        dep[valid] + offset,
+        arr[valid] + offset,
+        trip[departing][valid] + first_trip,
+    )
+
+
+class ConnectionScanAlgorithm:
+    """
+    Connection Scan Algorithm (CSA) for earliest arrival queries
+
+    The connections of all trips are scanned once in order of departure time from
+    the departure time of the query. A trip is boarded at the first stop that is
+    reached before its departure and the earliest arrival time at every stop is
+    kept in a flat list indexed by stop index, together with the parent pointers
+    to reconstruct the journey like RAPTOR, i.e. the trip and the stop where the
+    trip was boarded or the transfer started. Footpaths are relaxed from every
+    stop improved by a trip.
+
+    The number of trips is not limited, so the arrival times equal those of
+    RAPTOR with enough rounds. With to_stops the scan stops at the first
+    connection departing after the earliest arrival time at the stops.
+
+    For timetables with multiple service dates only the trips running on date are
+    used. With overnight the trips of the next day are used as well.
+    """
+
+    def __init__(
+        self, timetable: Timetable, date: str = None, overnight: bool = False,
+    ):
+        self.timetable = timetable
+        self.compiled = compile_timetable(timetable).for_date(date)
+        self.next_compiled = None
+        if overnight:
+            self.next_compiled = compile_timetable(timetable).for_next_date(date)
+        self.connections = compile_connections(self.compiled, self.next_compiled)
+        self.date = date
+        self.tau = None  # earliest arrival time per stop
+        self.parent_trip = None  # trip index per stop
+        self.parent_stop = None  # boarding or transfer stop index per stop
+        self.stats = None  # statistics of the last run
+
+    def run(self, from_stops, dep_secs, to_stops: List[Stop] = None) -> RoundLabels:
+        """
+        Run Connection Scan Algorithm
+
+        :param from_stops: stops of origin
+        :param dep_secs: Time of departure in seconds
+        :param to_stops: stops of destination, if given the scan stops once no
+            connection can improve the earliest arrival time at these stops
+        :return: labels of all stops
+        """
+        compiled = self.compiled
+        connections = self.connections
+        n_stops = compiled.n_stops
+        self.stats = QueryStats(runs=1)
+        round_stats = self.stats.add_round(1, len(from_stops))
+
+        tau = [LARGE_NUMBER] * n_stops
+        parent_trip = [-1] * n_stops
+        parent_stop = [-1] * n_stops
+        n_trips = compiled.n_trips
+        if self.next_compiled is not None:
+            n_trips += self.next_compiled.n_trips
+        boarding_stop = [-1] * n_trips  # stop index where trip is boarded, per trip
+
+        for from_index in compiled.stop_indices(from_stops):
+            tau[from_index] = dep_secs
+        target_stops = set()
+        if to_stops is not None:
+            target_stops = set(compiled.stop_indices(to_stops))
+        target_time = LARGE_NUMBER
+
+        transfers_ptr = compiled.transfers_ptr.tolist()
+        transfers_to = compiled.transfers_to.tolist()
+        transfers_time = compiled.transfers_time.tolist()
+
+        start = perf_counter()
+        n_evaluations, n_improvements, n_transfers = 0, 0, 0
+        first = int(np.searchsorted(connections.dep, dep_secs))
+        for from_stop, to_stop, dep, arr, trip in connections.iter_from(first):
+            # Connections departing after reaching the target cannot improve it
+            if dep >= target_time:
+                break
+            n_evaluations += 1
+
+            # Trip is boarded already or can be boarded at from_stop
+            boarded_at = boarding_stop[trip]
+            if boarded_at < 0:
+                if tau[from_stop] > dep:
+                    continue
+                boarded_at = boarding_stop[trip] = from_stop
+
+            if arr < tau[to_stop]:
+                tau[to_stop] = arr
+                parent_trip[to_stop] = trip
+                parent_stop[to_stop] = boarded_at
+                n_improvements += 1
+
+                # Add footpath transfers from improved stop
+                for edge in range(transfers_ptr[to_stop], transfers_ptr[to_stop + 1]):
+                    n_transfers += 1
+                    arrive_stop = transfers_to[edge]
+                    new_earliest_arrival = arr + transfers_time[edge]
+                    if new_earliest_arrival < tau[arrive_stop]:
+                        tau[arrive_stop] = new_earliest_arrival
+                        parent_trip[arrive_stop] = -1  # i.e. TRANSFER_TRIP
+                        parent_stop[arrive_stop] = to_stop
+
+                if target_stops:
+                    target_time = min(tau[s] for s in target_stops)
+
+        round_stats.evaluations = n_evaluations
+        round_stats.improvements = n_improvements
+        round_stats.transfers = n_transfers
+        round_stats.traverse_time = perf_counter() - start
+        logger.debug(f"- Evaluations    : {n_evaluations}")
+        logger.debug(f"- Improvements   : {n_improvements}")
+
+        self.tau, self.parent_trip, self.parent_stop = tau, parent_trip, parent_stop
+        return RoundLabels(compiled, tau, parent_trip, parent_stop, self.next_compiled)
+
+    def station_arrival_times(self) -> np.ndarray:
+        """Earliest arrival time per station of the last run"""
+        compiled = self.compiled
+        station_tau = np.full(compiled.n_stations, LARGE_NUMBER, dtype=np.int64)
+        np.minimum.at(station_tau, compiled.stop_station, np.asarray(self.tau))
+        return station_tau
+
@@ -1,4 +1,5 @@
 """McRAPTOR algorithm"""
+import warnings
 from typing import List, Tuple, Dict
 from copy import copy
 from time import perf_counter
@@ -14,13 +15,21 @@ from pyraptor.model.structures import (
     Journey,
     pareto_set,
 )
+from pyraptor.model.stats import QueryStats
 
 
 class McRaptorAlgorithm:
-    """McRAPTOR Algorithm"""
+    """
+    McRAPTOR Algorithm, using only the trips running on date.
+
+    The work done and the time per phase in every round of the last run are kept
+    in stats.
+    """
 
-    def __init__(self, timetable: Timetable):
+    def __init__(self, timetable: Timetable, date: str = None):
         self.timetable = timetable
+        self.day = timetable.day_index(date)
+        self.stats = None  # statistics of the last run
 
     def run(
         self, from_stops: List[Stop], dep_secs: int, rounds: int, previous_run: Dict[int, Bag] = None
@@ -28,6 +37,7 @@ class McRaptorAlgorithm:
         """Run Round-Based Algorithm"""
 
         s = perf_counter()
+        self.stats = QueryStats(runs=1)
 
         # Initialize empty bag, i.e. B_k(p) = [] for every k and p
         bag_round_stop: Dict[int, Dict[Stop, Bag]] = {}
@@ -60,19 +70,27 @@ class McRaptorAlgorithm:
 
             if len(marked_stops) > 0:
                 actual_rounds = k
+                round_stats = self.stats.add_round(k, len(marked_stops))
 
                 # Accumulate routes serving marked stops from previous round
+                start = perf_counter()
                 route_marked_stops = self.accumulate_routes(marked_stops)
+                round_stats.routes = len(route_marked_stops)
+                round_stats.accumulate_time = perf_counter() - start
 
                 # Traverse each route
+                start = perf_counter()
                 bag_round_stop, marked_stops_trips = self.traverse_route(
                     bag_round_stop, k, route_marked_stops
                 )
+                round_stats.traverse_time = perf_counter() - start
 
                 # Now add footpath transfers and update
+                start = perf_counter()
                 bag_round_stop, marked_stops_transfers = self.add_transfer_time(
                     bag_round_stop, k, marked_stops_trips
                 )
+                round_stats.transfers_time = perf_counter() - start
 
                 marked_stops = set(marked_stops_trips).union(marked_stops_transfers)
             else:
@@ -117,6 +135,7 @@ class McRaptorAlgorithm:
         """
 
         new_marked_stops = set()
+        round_stats = self.stats.rounds[-1]
 
         for (marked_route, marked_stop) in route_marked_stops:
             # Traversing through route from marked stop
@@ -125,6 +144,7 @@ class McRaptorAlgorithm:
             # Get all stops after current stop within the current route
             marked_stop_index = marked_route.stop_index(marked_stop)
             remaining_stops_in_route = marked_route.stops[marked_stop_index:]
+            round_stats.evaluations += len(remaining_stops_in_route)
 
             for stop_idx, current_stop in enumerate(remaining_stops_in_route):
 
@@ -156,6 +176,7 @@ class McRaptorAlgorithm:
                 # Mark stop if bag is updated
                 if bag_update:
                     new_marked_stops.add(current_stop)
+                    round_stats.improvements += 1
 
                 # Step 3: merge B_{k-1}(p) into B_r
                 route_bag = route_bag.merge(bag_round_stop[k - 1][current_stop])
@@ -165,7 +186,7 @@ class McRaptorAlgorithm:
                 update_labels = []
                 for label in route_bag.labels:
                     earliest_trip = marked_route.earliest_trip(
-                        label.earliest_arrival_time, current_stop
+                        label.earliest_arrival_time, current_stop, self.day
                     )
                     if earliest_trip is not None:
                         # Update label with earliest trip in route leaving from this station
@@ -191,6 +212,7 @@ class McRaptorAlgorithm:
         # Add in transfers to other platforms
         for stop in marked_stops:
             other_station_stops = [st for st in stop.station.stops if st != stop]
+            self.stats.rounds[-1].transfers += len(other_station_stops)
 
             for other_stop in other_station_stops:
                 # Create temp copy of B_k(p_i)
@@ -231,11 +253,12 @@ class McRaptorAlgorithm:
         return transfers.stop_to_stop_idx[(stop_from, stop_to)].layovertime
 
 
-def best_legs_to_destination_station(
+def best_labels_to_destination_station(
     to_stops: List[Stop], last_round_bag: Dict[Stop, Bag]
-) -> List[Leg]:
+) -> List[Tuple[Stop, Label]]:
     """
-    Find the last legs to destination station that are reached by non-dominated labels.
+    Find the non-dominated labels of the stops of the destination station,
+    as (stop, label).
     """
 
     # Find all labels to target_stops
@@ -243,15 +266,32 @@ def best_legs_to_destination_station(
         (stop, label) for stop in to_stops for label in last_round_bag[stop].labels
     ]
 
-    # TODO Use merge function on Bag
     # Pareto optimal labels
-    pareto_optimal_labels = pareto_set([label for (_, label) in best_labels])
-    pareto_optimal_labels = [
-        (stop, label) for (stop, label) in best_labels if label in pareto_optimal_labels
+    pareto_optimal_labels = {
+        id(label) for label in pareto_set([label for (_, label) in best_labels])
+    }
+    return [
+        (stop, label) for (stop, label) in best_labels if id(label) in pareto_optimal_labels
     ]
 
-    # Label to leg, i.e. add to_stop
-    legs = [
+
+
+def best_legs_to_destination_station(
+    to_stops: List[Stop], last_round_bag: Dict[Stop, Bag]
+) -> List[Leg]:
+    """
+    Find the last legs to destination station that are reached by non-dominated labels.
+
+    Deprecated: use best_labels_to_destination_station, whose labels keep their
+    parents for reconstruct_journeys.
+    """
+    warnings.warn(
+        "best_legs_to_destination_station is deprecated, "
+        "use best_labels_to_destination_station",
+        DeprecationWarning,
+        stacklevel=2,
+    )
+    return [
         Leg(
             label.from_stop,
             to_stop,
@@ -260,57 +300,34 @@ def best_legs_to_destination_station(
             label.fare,
             label.n_trips,
         )
-        for (to_stop, label) in pareto_optimal_labels
+        for (to_stop, label) in best_labels_to_destination_station(
+            to_stops, last_round_bag
+        )
     ]
-    return legs
 
 
-def reconstruct_journeys(
-    from_stops: List[Stop],
-    destination_legs: List[Leg],
-    bag_round_stop: Dict[int, Dict[Stop, Bag]],
-    k: int,
-) -> List[Journey]:
+def reconstruct_journeys(destination_labels: List[Tuple[Stop, Label]]) -> List[Journey]:
     """
-    Construct Journeys for destinations from bags by recursively
-    looping from destination to origin.
+    Construct Journeys for destination labels by following the parent labels from
+    destination to origin, i.e. a leg per parent label until the origin label.
     """
-
-    def loop(
-        bag_round_stop: Dict[int, Dict[Stop, Bag]], k: int, journeys: List[Journey]
-    ):
-        """Create full journey by prepending legs recursively"""
-
-        last_round_bags = bag_round_stop[k]
-
-        for jrny in journeys:
-            current_leg = jrny[0]
-
-            # End of journey if we are at origin stop or journey is not feasible
-            if current_leg.trip is None or current_leg.from_stop in from_stops:
-                jrny = jrny.remove_transfer_legs()
-                if jrny.is_valid() is True:
-                    yield jrny
-                continue
-
-            # Loop trough each new leg
-            labels_to_from_stop = last_round_bags[current_leg.from_stop].labels
-            for new_label in labels_to_from_stop:
-                new_leg = Leg(
-                    new_label.from_stop,
-                    current_leg.from_stop,
-                    new_label.trip,
-                    new_label.earliest_arrival_time,
-                    new_label.fare,
-                    new_label.n_trips,
+    journeys = []
+    for to_stop, label in destination_labels:
+        legs = []
+        while label.trip is not None:
+            legs.append(
+                Leg(
+                    label.from_stop,
+                    to_stop,
+                    label.trip,
+                    label.earliest_arrival_time,
+                    label.fare,
+                    label.n_trips,
                 )
-                # Only add new_leg if compatible before current leg, e.g. earlier arrival time, etc.
-                if new_leg.is_compatible_before(current_leg):
-                    new_jrny = jrny.prepend_leg(new_leg)
-                    for i in loop(bag_round_stop, k, [new_jrny]):
-                        yield i
-
-    journeys = [Journey(legs=[leg]) for leg in destination_legs]
-    journeys = [jrny for jrny in loop(bag_round_stop, k, journeys)]
+            )
+            to_stop, label = label.from_stop, label.parent
+
+        jrny = Journey(legs=legs[::-1]).remove_transfer_legs()
+        journeys.append(jrny)
 
     return journeys
@@ -0,0 +1,320 @@
+"""RAPTOR algorithm for many origins at once"""
+from __future__ import annotations
+from typing import List, Sequence, Tuple, Union
+from time import perf_counter
+
+import numpy as np
+from loguru import logger
+
+from pyraptor.dao.timetable import Timetable
+from pyraptor.model.structures import Stop
+from pyraptor.model.compiled import compile_timetable
+from pyraptor.model.raptor import csr_gather
+from pyraptor.model.stats import QueryStats
+from pyraptor.util import LARGE_NUMBER, SECONDS_PER_DAY
+
+
+class MultiRaptorAlgorithm:
+    """
+    RAPTOR Algorithm for many origins at once
+
+    The earliest arrival times of all origins are kept in an origins x stops array
+    per round. Every round the routes serving a stop marked for any origin are
+    scanned once, for all origins with array operations over the origin axis, and
+    the footpaths are relaxed with a scatter-min over all origins.
+
+    Trips are only boarded at stops marked in the previous round, with the arrival
+    time of the previous round, so the labels of round k are the earliest arrival
+    times with at most k trips. Only arrival times are kept, so no journeys can be
+    reconstructed.
+
+    For timetables with multiple service dates only the trips running on date are
+    used. With overnight the trips of the next day are used as well, with their
+    times offset by a day.
+
+    The work done and the time per phase in every round of the last run are kept
+    in stats, counting a route once per round for all origins.
+    """
+
+    def __init__(
+        self, timetable: Timetable, date: str = None, overnight: bool = False,
+    ):
+        self.timetable = timetable
+        self.compiled = compile_timetable(timetable).for_date(date)
+        self.next_compiled = None
+        if overnight:
+            self.next_compiled = compile_timetable(timetable).for_next_date(date)
+        self.date = date
+        self.tau = None  # earliest arrival time per round per origin per stop
+        self.stats = None  # statistics of the last run
+
+    def run(
+        self,
+        from_stops: List[List[Stop]],
+        dep_secs: Union[int, Sequence[int]],
+        rounds: int,
+    ) -> np.ndarray:
+        """
+        Run Round-Based Algorithm from the stops of every origin
+
+        :param from_stops: Stops per origin
+        :param dep_secs: Time of departure in seconds, for all origins or per origin
+        :param rounds: Number of iterations to perform
+        :return: earliest arrival times as rounds x origins x stops
+        """
+        compiled = self.compiled
+        n_origins = len(from_stops)
+        dep_secs = np.broadcast_to(np.asarray(dep_secs, dtype=np.int32), (n_origins,))
+        self.stats = QueryStats(runs=1)
+
+        # Initialize labels with start node taking DEP_SECS seconds to reach
+        self.tau = np.full(
+            (rounds + 1, n_origins, compiled.n_stops), LARGE_NUMBER, dtype=np.int32
+        )
+        marked = np.zeros((n_origins, compiled.n_stops), dtype=bool)
+        for origin, stops in enumerate(from_stops):
+            stop_indices = compiled.stop_indices(stops)
+            self.tau[0, origin, stop_indices] = dep_secs[origin]
+            marked[origin, stop_indices] = True
+
+        # Run rounds
+        for k in range(1, rounds + 1):
+            logger.info(f"Analyzing possibilities round {k}")
+            self.tau[k] = self.tau[k - 1]
+
+            marked_stops = np.flatnonzero(marked.any(axis=0))
+            logger.debug(f"Stops to evaluate count: {len(marked_stops)}")
+            if len(marked_stops) == 0:
+                continue
+            round_stats = self.stats.add_round(k, len(marked_stops))
+
+            # Get marked route stops
+            start = perf_counter()
+            route_marked_stops = self.accumulate_routes(marked_stops)
+            round_stats.routes = len(route_marked_stops)
+            round_stats.accumulate_time = perf_counter() - start
+
+            # Update time to stops calculated based on stops reachable
+            start = perf_counter()
+            marked_trip = self.traverse_routes(k, route_marked_stops, marked)
+            round_stats.traverse_time = perf_counter() - start
+
+            # Add footpath transfers and update
+            start = perf_counter()
+            marked_transfer = self.add_transfer_time(k, marked_trip)
+            round_stats.transfers_time = perf_counter() - start
+
+            marked = marked_trip | marked_transfer
+
+        logger.info("Finish round-based algorithm for all origins")
+        return self.tau
+
+    def station_arrival_times(self) -> np.ndarray:
+        """
+        Earliest arrival time per round per origin per station of the last run,
+        as rounds x origins x stations
+        """
+        compiled = self.compiled
+        n_rounds, n_origins, _ = self.tau.shape
+        station_tau = np.full(
+            (n_rounds, n_origins, compiled.n_stations), LARGE_NUMBER, dtype=np.int64
+        )
+        np.minimum.at(
+            station_tau.transpose(2, 0, 1),
+            compiled.stop_station,
+            self.tau.transpose(2, 0, 1),
+        )
+        return station_tau
+
+    def accumulate_routes(self, marked_stops: np.ndarray) -> List[Tuple[int, int]]:
+        """
+        Accumulate routes serving stops marked for any origin
+
+        :param marked_stops: indices of marked stops
+        :return: list of (route index, position of first marked stop in route)
+        """
+        compiled = self.compiled
+        edges = csr_gather(compiled.stop_routes_ptr, marked_stops)
+        routes = compiled.stop_routes[edges]
+        positions = compiled.stop_routes_pos[edges]
+
+        unique_routes, inverse = np.unique(routes, return_inverse=True)
+        first_positions = np.full(len(unique_routes), LARGE_NUMBER, dtype=np.int32)
+        np.minimum.at(first_positions, inverse, positions)
+
+        return list(zip(unique_routes.tolist(), first_positions.tolist()))
+
+    def traverse_routes(
+        self, k: int, route_marked_stops: List[Tuple[int, int]], marked: np.ndarray
+    ) -> np.ndarray:
+        """
+        Scan every route once for all origins, boarding trips at the stops marked
+        in the previous round
+
+        :param k: current round
+        :param route_marked_stops: list of marked (route index, stop position)
+        :param marked: mask of marked stops as origins x stops
+        :return: mask of stops with improved earliest arrival time
+        """
+        compiled = self.compiled
+        tau_previous = self.tau[k - 1]
+        tau_k = self.tau[k]
+        improved_stops = np.zeros_like(marked)
+        n_evaluations = 0
+        n_improvements = 0
+
+        for route, position in route_marked_stops:
+            stops = compiled.stops_of_route(route)[position:]
+            n_evaluations += len(stops)
+
+            # Boarding times of origins with a marked stop on the route
+            route_marked = marked[:, stops]
+            origins = np.flatnonzero(route_marked.any(axis=1))
+            boarding_times = np.where(
+                route_marked[origins], tau_previous[origins][:, stops], LARGE_NUMBER
+            )
+
+            if self.next_compiled is not None:
+                arrivals = self.scan_route_overnight(route, position, boarding_times)
+            elif compiled.route_fifo[route]:
+                arrivals = self.scan_route_fifo(route, position, boarding_times)
+            else:
+                arrivals = self.scan_route(
+                    compiled.route_departures(route)[:, position:],
+                    compiled.route_arrivals(route)[:, position:],
+                    boarding_times,
+                )
+
+            current = tau_k[origins][:, stops]
+            improved = arrivals < current
+            if not improved.any():
+                continue
+            n_improvements += int(improved.sum())
+            tau_k[np.ix_(origins, stops)] = np.where(improved, arrivals, current)
+            improved_stops[np.ix_(origins, stops)] |= improved
+
+        logger.debug(f"- Evaluations    : {n_evaluations}")
+        logger.debug(f"- Improvements   : {n_improvements}")
+        self.stats.rounds[-1].evaluations = n_evaluations
+        self.stats.rounds[-1].improvements = n_improvements
+
+        return improved_stops
+
+    def scan_route_fifo(
+        self, route: int, position: int, boarding_times: np.ndarray
+    ) -> np.ndarray:
+        """
+        Arrival times along a FIFO route for every origin, with the earliest trip
+        boarded at any stop before. The earliest trip that can be boarded at a stop
+        follows from a binary search on the sorted departures at the stop.
+
+        :param route: route index
+        :param position: position of first marked stop in route
+        :param boarding_times: boarding time per origin per stop from position
+        :return: arrival time per origin per stop from position
+        """
+        compiled = self.compiled
+        sorted_dep, sorted_trip = compiled.route_sorted_departures(route)
+        sorted_dep = sorted_dep[position:]
+        sorted_trip = sorted_trip[position:]
+        route_arr = compiled.route_arrivals(route)[:, position:]
+        n_stops, n_trips = sorted_dep.shape
+        if n_trips == 0:
+            return np.full(boarding_times.shape, LARGE_NUMBER, dtype=np.int64)
+        positions = np.arange(n_stops)
+
+        # Search all stops at once by offsetting the departures of every stop
+        offsets = positions.astype(np.int64) * (LARGE_NUMBER + 1)
+        keys = (sorted_dep + offsets[:, None]).ravel()
+        index = np.searchsorted(keys, boarding_times + offsets) - positions * n_trips
+
+        # Earliest trip per stop, n_trips if no trip can be boarded
+        boarded = (index < n_trips) & (boarding_times < LARGE_NUMBER)
+        index = np.minimum(index, n_trips - 1)
+        boarded &= sorted_dep[positions, index] < LARGE_NUMBER
+        boarding_trip = np.where(boarded, sorted_trip[positions, index], n_trips)
+
+        # Trip at each stop is the earliest trip boarded at a previous stop
+        trip = np.full(boarding_trip.shape, n_trips, dtype=boarding_trip.dtype)
+        trip[:, 1:] = np.minimum.accumulate(boarding_trip, axis=1)[:, :-1]
+        has_trip = trip < n_trips
+        arrivals = np.full(boarding_times.shape, LARGE_NUMBER, dtype=np.int64)
+        arrivals[has_trip] = route_arr[
+            trip[has_trip], np.broadcast_to(positions, trip.shape)[has_trip]
+        ]
+        return arrivals
+
+    def scan_route_overnight(
+        self, route: int, position: int, boarding_times: np.ndarray
+    ) -> np.ndarray:
+        """Arrival times along a route with the trips of this day and the next day"""
+        route_deps, route_arrs = [], []
+        days = [(self.compiled, 0), (self.next_compiled, SECONDS_PER_DAY)]
+        for compiled, offset in days:
+            for times, route_times in [
+                (compiled.route_departures(route), route_deps),
+                (compiled.route_arrivals(route), route_arrs),
+            ]:
+                times = times[:, position:].astype(np.int64)
+                route_times.append(
+                    np.where(times < LARGE_NUMBER, times + offset, LARGE_NUMBER)
+                )
+        return self.scan_route(
+            np.concatenate(route_deps), np.concatenate(route_arrs), boarding_times
+        )
+
+    @staticmethod
+    def scan_route(
+        route_dep: np.ndarray, route_arr: np.ndarray, boarding_times: np.ndarray
+    ) -> np.ndarray:
+        """
+        Arrival times along a route for every origin, with any trip boarded at a
+        stop before, so trips may overtake each other.
+
+        :param route_dep: departure times as trips x stops
+        :param route_arr: arrival times as trips x stops
+        :param boarding_times: boarding time per origin per stop
+        :return: arrival time per origin per stop
+        """
+        # Trips per origin that can be boarded at a stop, as origins x trips x stops
+        boardable = (route_dep[None, :, :] >= boarding_times[:, None, :]) & (
+            route_dep[None, :, :] < LARGE_NUMBER
+        )
+        boarded = np.zeros_like(boardable)
+        boarded[:, :, 1:] = np.logical_or.accumulate(boardable, axis=2)[:, :, :-1]
+        return np.where(boarded, route_arr[None, :, :], LARGE_NUMBER).min(
+            axis=1, initial=LARGE_NUMBER
+        )
+
+    def add_transfer_time(self, k: int, marked_trip: np.ndarray) -> np.ndarray:
+        """
+        Relax footpaths from the stops improved by trips in this round for all
+        origins with a scatter-min
+
+        :param k: current round
+        :param marked_trip: mask of stops improved by trips as origins x stops
+        :return: mask of stops with improved earliest arrival time
+        """
+        compiled = self.compiled
+        tau_k = self.tau[k]
+        from_stops = np.flatnonzero(marked_trip.any(axis=0))
+        edges = csr_gather(compiled.transfers_ptr, from_stops)
+        self.stats.rounds[-1].transfers = len(edges)
+        if len(edges) == 0:
+            return np.zeros_like(marked_trip)
+        edge_from = np.repeat(from_stops, np.diff(compiled.transfers_ptr)[from_stops])
+        edge_to = compiled.transfers_to[edges]
+
+        # Arrival times via footpath per origin, only from improved stops
+        arrivals = np.where(
+            marked_trip[:, edge_from],
+            tau_k[:, edge_from].astype(np.int64) + compiled.transfers_time[edges],
+            LARGE_NUMBER,
+        )
+        best = np.full((len(tau_k), compiled.n_stops), LARGE_NUMBER, dtype=np.int64)
+        np.minimum.at(best.T, edge_to, arrivals.T)
+
+        # Domination criteria
+        improved = best < tau_k
+        tau_k[improved] = best[improved]
+        return improved
@@ -1,14 +1,20 @@
 """RAPTOR algorithm"""
 from __future__ import annotations
-from typing import List, Tuple, Dict
+from typing import List, Tuple, Dict, Sequence
+from collections.abc import Mapping
 from dataclasses import dataclass
-from copy import deepcopy
+from time import perf_counter
 
+import numpy as np
 from loguru import logger
 
 from pyraptor.dao.timetable import Timetable
-from pyraptor.model.structures import Stop, Trip, Route, Leg, Journey
-from pyraptor.util import LARGE_NUMBER, TRANSFER_TRIP
+from pyraptor.model.structures import Stop, Trip, Leg, Journey
+from pyraptor.model.compiled import CompiledTimetable, compile_timetable
+from pyraptor.model.stats import QueryStats
+from pyraptor.util import LARGE_NUMBER, SECONDS_PER_DAY
+
+BACKENDS = ("python", "numpy")
 
 
 @dataclass
@@ -18,6 +24,7 @@ class Label:
     earliest_arrival_time: int = LARGE_NUMBER
     trip: Trip = None  # trip to take to obtain earliest_arrival_time
     from_stop: Stop = None  # stop at which we hop-on trip with trip
+    day_offset: int = 0  # trip runs on the next day if 1
 
     def update(self, earliest_arrival_time=None, trip=None, from_stop=None):
         """Update"""
@@ -33,222 +40,782 @@ class Label:
         return self.earliest_arrival_time <= other.earliest_arrival_time
 
     def __repr__(self) -> str:
-        return f"Label(earliest_arrival_time={self.earliest_arrival_time}, trip={self.trip}, from_stop={self.from_stop})"
+        return f"Label(earliest_arrival_time={self.earliest_arrival_time}, trip={self.trip}, from_stop={self.from_stop}, day_offset={self.day_offset})"
 
 
-class RaptorAlgorithm:
-    """RAPTOR Algorithm"""
+class RoundLabels(Mapping):
+    """
+    Labels of all stops in a round, i.e. B_k(p) for every p.
 
-    def __init__(self, timetable: Timetable):
-        self.timetable = timetable
-        self.bag_star = None
+    The labels are a view on the flat earliest arrival times and parent pointers
+    (trip index and stop index, -1 if none) of the round, so a Label is only
+    created for stops that are looked up. Trip indices from the number of trips on
+    are trips of next_compiled, i.e. trips on the next day.
+    """
 
-    def run(self, from_stops, dep_secs, rounds) -> Dict[int, Dict[Stop, Label]]:
-        """Run Round-Based Algorithm"""
+    def __init__(
+        self,
+        compiled: CompiledTimetable,
+        earliest_arrival_times: Sequence[int],
+        trips: Sequence[int],
+        from_stops: Sequence[int],
+        next_compiled: CompiledTimetable = None,
+    ):
+        self.compiled = compiled
+        self.earliest_arrival_times = earliest_arrival_times
+        self.trips = trips
+        self.from_stops = from_stops
+        self.next_compiled = next_compiled
+
+    def __getitem__(self, stop: Stop) -> Label:
+        index = self.compiled.stop_index[stop]
+        trip = int(self.trips[index])
+        from_stop = self.from_stops[index]
+        day_offset = 0
+        if trip >= self.compiled.n_trips:
+            trip -= self.compiled.n_trips
+            day_offset = 1
+        trips = self.next_compiled.trips if day_offset else self.compiled.trips
+        return Label(
+            earliest_arrival_time=int(self.earliest_arrival_times[index]),
+            trip=trips[trip] if trip >= 0 else None,
+            from_stop=self.compiled.stops[from_stop] if from_stop >= 0 else None,
+            day_offset=day_offset,
+        )
 
-        # Initialize empty bag of labels, i.e. B_k(p) = Label() for every k and p
-        bag_round_stop: Dict[int, Dict[Stop, Label]] = {}
-        for k in range(0, rounds + 1):
-            bag_round_stop[k] = {}
-            for p in self.timetable.stops:
-                bag_round_stop[k][p] = Label()
+    def __iter__(self):
+        return iter(self.compiled.stops)
+
+    def __len__(self):
+        return self.compiled.n_stops
+
+    def __repr__(self):
+        return f"RoundLabels(n_stops={len(self)})"
+
+
+class RaptorAlgorithm:
+    """
+    RAPTOR Algorithm
+
+    Per round the earliest arrival time at every stop is kept in a flat array indexed
+    by stop index, together with the parent pointers to reconstruct the journey,
+    i.e. the trip and the stop where the trip was boarded or the transfer started.
+    The labels of a round start as a copy of the previous round, so tau_k(p) is also
+    the earliest arrival time over all rounds, i.e. tau*(p), which is used for pruning.
+    Trips are boarded with the labels of the previous round, i.e. tau_{k-1}(p), so
+    the labels of round k are the earliest arrival times with at most k trips and
+    do not depend on the order in which routes are scanned.
+
+    Two backends are available:
+    - python: labels in lists, routes are scanned stop by stop
+    - numpy: labels in int32 arrays, FIFO routes are scanned with array operations
+      over the stops of all routes of a round at once and transfers are relaxed
+      with a vectorised scatter-min
+
+    For timetables with multiple service dates only the trips running on date are
+    used, by routing over the compiled timetable of that date.
+    With overnight the trips of the next day are used as well, with their times
+    offset by a day when read, and routes are scanned stop by stop.
+
+    The work done and the time per phase in every round of the last run are kept
+    in stats.
+    """
 
-        # Initialize bag with earliest arrival tiems
-        self.bag_star = {}
-        for p in self.timetable.stops:
-            self.bag_star[p] = Label()
+    def __init__(
+        self,
+        timetable: Timetable,
+        backend: str = "python",
+        date: str = None,
+        overnight: bool = False,
+    ):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend '{backend}', choose from {BACKENDS}")
+        self.timetable = timetable
+        self.compiled = compile_timetable(timetable).for_date(date)
+        self.next_compiled = None
+        if overnight:
+            self.next_compiled = compile_timetable(timetable).for_next_date(date)
+        self.backend = backend
+        self.date = date
+        self.dep_secs = None  # departure time of the last run
+        self.target_stops = None  # stop indices of destination for target pruning
+        self.target_time = LARGE_NUMBER  # earliest arrival time at target stops
+        self.tau = None  # earliest arrival time per round per stop, i.e. tau_k(p)
+        self.parent_trip = None  # trip index per round per stop
+        self.parent_stop = None  # boarding or transfer stop index per round per stop
+        self.stats = None  # statistics of the last run
+
+    def run(
+        self,
+        from_stops,
+        dep_secs,
+        rounds,
+        keep_labels: bool = False,
+        to_stops: List[Stop] = None,
+    ) -> Dict[int, RoundLabels]:
+        """
+        Run Round-Based Algorithm
+
+        With keep_labels the labels of the previous run are kept, i.e. rRAPTOR.
+        The previous run should be from the same stops with a later departure time,
+        so its labels are valid journeys for this run as well. Only stops that are
+        improved by the earlier departure are explored (self-pruning). As trips are
+        boarded with the labels of the previous round, the labels of every round are
+        equal to those of a new run from dep_secs, also with few rounds.
+
+        With to_stops target pruning is applied: arrival times that are not earlier
+        than the earliest arrival time at any of the stops are not improvements and
+        rounds stop when no marked stop can improve it. Only the labels of to_stops
+        are then guaranteed to be the earliest arrival times.
+        """
 
-        # Initialize bag with start node taking DEP_SECS seconds to reach
+        if keep_labels:
+            if self.tau is None or len(self.tau) != rounds + 1:
+                raise ValueError("Cannot keep labels of run with other rounds")
+            if dep_secs > self.dep_secs:
+                raise ValueError(
+                    "Cannot keep labels of run with earlier departure time"
+                )
+        else:
+            # Initialize empty labels, i.e. tau_k(p) = inf for every k and p
+            self.init_labels(rounds)
+        self.dep_secs = dep_secs
+        self.stats = QueryStats(runs=1)
+        self.target_stops = None
+        self.target_time = LARGE_NUMBER
+        if to_stops is not None:
+            self.target_stops = self.compiled.stop_indices(to_stops)
+            self.update_target_time(rounds)
+
+        # Initialize labels with start node taking DEP_SECS seconds to reach
         logger.debug(f"Starting from Stop IDs: {str(from_stops)}")
         marked_stops = []
         for from_stop in from_stops:
-            bag_round_stop[0][from_stop].update(dep_secs, None, None)
-            self.bag_star[from_stop].update(dep_secs, None, None)
-            marked_stops.append(from_stop)
+            from_index = self.compiled.stop_index[from_stop]
+            self.tau[0][from_index] = dep_secs
+            marked_stops.append(from_index)
+        updated_stops = self.union_stops(marked_stops)
 
         # Run rounds
         for k in range(1, rounds + 1):
             logger.info(f"Analyzing possibilities round {k}")
-            bag_round_stop[k] = deepcopy(bag_round_stop[k - 1])
+
+            # Labels updated in this run are copied from the previous round
+            self.copy_labels(k, updated_stops)
 
             # Get list of stops to evaluate in the process
+            marked_stops = self.prune_stops(k, marked_stops)
             logger.debug(f"Stops to evaluate count: {len(marked_stops)}")
 
             if len(marked_stops) > 0:
+                round_stats = self.stats.add_round(k, len(marked_stops))
+
                 # Get marked route stops
+                start = perf_counter()
                 route_marked_stops = self.accumulate_routes(marked_stops)
+                round_stats.routes = len(route_marked_stops)
+                round_stats.accumulate_time = perf_counter() - start
 
                 # Update time to stops calculated based on stops reachable
-                bag_round_stop, marked_trip_stops = self.traverse_routes(
-                    bag_round_stop, k, route_marked_stops
-                )
+                start = perf_counter()
+                marked_trip_stops = self.traverse_routes(k, route_marked_stops)
+                round_stats.traverse_time = perf_counter() - start
                 logger.debug(f"{len(marked_trip_stops)} reachable stops added")
 
                 # Add footpath transfers and update
-                bag_round_stop, marked_transfer_stops = self.add_transfer_time(
-                    bag_round_stop, k, marked_trip_stops
-                )
+                start = perf_counter()
+                marked_transfer_stops = self.add_transfer_time(k, marked_trip_stops)
+                round_stats.transfers_time = perf_counter() - start
                 logger.debug(f"{len(marked_transfer_stops)} transferable stops added")
 
-                marked_stops = set(marked_trip_stops).union(marked_transfer_stops)
+                marked_stops = self.union_stops(marked_trip_stops, marked_transfer_stops)
+                updated_stops = self.union_stops(updated_stops, marked_stops)
                 logger.debug(f"{len(marked_stops)} stops to evaluate in next round")
-            else:
-                break
 
-        logger.info("Finish round-based algorithm to create bag with best labels")   
+        logger.info("Finish round-based algorithm to create bag with best labels")
+
+        bag_round_stop: Dict[int, RoundLabels] = {}
+        for k in range(0, rounds + 1):
+            bag_round_stop[k] = RoundLabels(
+                self.compiled,
+                self.tau[k],
+                self.parent_trip[k],
+                self.parent_stop[k],
+                self.next_compiled,
+            )
 
         return bag_round_stop
 
-    def accumulate_routes(self, marked_stops: List[Stop]) -> List[Tuple[Route, Stop]]:
-        """Accumulate routes serving marked stops from previous round, i.e. Q"""
+    def station_arrival_times(self) -> np.ndarray:
+        """
+        Earliest arrival time per round per station of the last run, i.e. the
+        earliest arrival time over the stops of the station, as rounds x stations
+        """
+        compiled = self.compiled
+        tau = np.asarray(self.tau)
+        station_tau = np.full(
+            (len(tau), compiled.n_stations), LARGE_NUMBER, dtype=np.int64
+        )
+        np.minimum.at(station_tau.T, compiled.stop_station, tau.T)
+        return station_tau
+
+    def init_labels(self, rounds: int) -> None:
+        """Initialize empty labels for all rounds"""
+        n_stops = self.compiled.n_stops
+        if self.backend == "numpy":
+            self.tau = np.full((rounds + 1, n_stops), LARGE_NUMBER, dtype=np.int32)
+            self.parent_trip = np.full((rounds + 1, n_stops), -1, dtype=np.int32)
+            self.parent_stop = np.full((rounds + 1, n_stops), -1, dtype=np.int32)
+        else:
+            self.tau = [[LARGE_NUMBER] * n_stops for _ in range(rounds + 1)]
+            self.parent_trip = [[-1] * n_stops for _ in range(rounds + 1)]
+            self.parent_stop = [[-1] * n_stops for _ in range(rounds + 1)]
+
+    def copy_labels(self, k: int, stops) -> None:
+        """
+        Copy labels of stops from the previous round if earlier, i.e.
+        tau_k(p) = min(tau_k(p), tau_{k-1}(p)). Kept labels of round k can be earlier
+        than the labels of round k-1 of this run and are then not overwritten.
+        """
+        if self.backend == "numpy":
+            stops = np.asarray(stops, dtype=np.int64)
+            stops = stops[self.tau[k - 1][stops] < self.tau[k][stops]]
+            self.tau[k][stops] = self.tau[k - 1][stops]
+            self.parent_trip[k][stops] = self.parent_trip[k - 1][stops]
+            self.parent_stop[k][stops] = self.parent_stop[k - 1][stops]
+            return
+
+        for stop in stops:
+            if self.tau[k - 1][stop] < self.tau[k][stop]:
+                self.tau[k][stop] = self.tau[k - 1][stop]
+                self.parent_trip[k][stop] = self.parent_trip[k - 1][stop]
+                self.parent_stop[k][stop] = self.parent_stop[k - 1][stop]
+
+    def update_target_time(self, k: int) -> None:
+        """Update earliest arrival time at target stops with labels of round k"""
+        if self.target_stops is not None:
+            self.target_time = min(
+                [self.target_time] + [int(self.tau[k][s]) for s in self.target_stops]
+            )
+
+    def prune_stops(self, k: int, marked_stops):
+        """Marked stops that can still improve the arrival time at the target stops"""
+        if self.target_stops is None:
+            return marked_stops
+        tau_k = self.tau[k]
+        if self.backend == "numpy":
+            marked_stops = np.asarray(marked_stops, dtype=np.int32)
+            return marked_stops[tau_k[marked_stops] < self.target_time]
+        return [stop for stop in marked_stops if tau_k[stop] < self.target_time]
+
+    def union_stops(self, *marked_stops):
+        """Union of marked stops"""
+        if self.backend == "numpy":
+            return np.unique(np.concatenate(marked_stops).astype(np.int32))
+        return set().union(*marked_stops)
+
+    def accumulate_routes(self, marked_stops: List[int]) -> List[Tuple[int, int]]:
+        """
+        Accumulate routes serving marked stops from previous round, i.e. Q
+
+        :param marked_stops: indices of marked stops
+        :return: list of (route index, position of first marked stop in route)
+        """
+        if self.backend == "numpy":
+            return self.accumulate_routes_numpy(marked_stops)
+
         route_marked_stops = {}  # i.e. Q
         for marked_stop in marked_stops:
-            routes_serving_stop = self.timetable.routes.get_routes_of_stop(marked_stop)
-            for route in routes_serving_stop:
+            routes, positions = self.compiled.routes_of_stop(marked_stop)
+            for route, position in zip(routes.tolist(), positions.tolist()):
                 # Check if new_stop is before existing stop in Q
-                current_stop_for_route = route_marked_stops.get(route, None)  # p'
-                if (current_stop_for_route is None) or (
-                    route.stop_index(current_stop_for_route)
-                    > route.stop_index(marked_stop)
-                ):
-                    route_marked_stops[route] = marked_stop
+                current_position = route_marked_stops.get(route, None)  # p'
+                if current_position is None or current_position > position:
+                    route_marked_stops[route] = position
         route_marked_stops = [(r, p) for r, p in route_marked_stops.items()]
 
         return route_marked_stops
 
+    def accumulate_routes_numpy(
+        self, marked_stops: np.ndarray
+    ) -> List[Tuple[int, int]]:
+        """Accumulate routes serving marked stops with array operations"""
+        compiled = self.compiled
+        edges = csr_gather(compiled.stop_routes_ptr, marked_stops)
+        routes = compiled.stop_routes[edges]
+        positions = compiled.stop_routes_pos[edges]
+
+        # First position of a marked stop per route, in order of first occurrence
+        unique_routes, first, inverse = np.unique(
+            routes, return_index=True, return_inverse=True
+        )
+        first_positions = np.full(len(unique_routes), LARGE_NUMBER, dtype=np.int32)
+        np.minimum.at(first_positions, inverse, positions)
+        order = np.argsort(first, kind="stable")
+
+        return list(
+            zip(unique_routes[order].tolist(), first_positions[order].tolist())
+        )
+
     def traverse_routes(
-        self,
-        bag_round_stop: Dict[int, Dict[Stop, Label]],
-        k: int,
-        route_marked_stops: List[Tuple[Route, Stop]],
-    ) -> Tuple:
+        self, k: int, route_marked_stops: List[Tuple[int, int]],
+    ) -> List[int]:
         """
         Iterator through the stops reachable and add all new reachable stops
         by following all trips from the reached stations. Trips are only followed
         in the direction of travel and beyond already added points.
 
-        :param bag_round_stop: Bag per round per stop
         :param k: current round
-        :param route_marked_stops: list of marked (route, stop) for evaluation
+        :param route_marked_stops: list of marked (route index, stop position) for evaluation
+        :return: indices of stops with improved earliest arrival time
         """
         logger.debug(f"Traverse routes for round {k}")
 
-        bag_round_stop = deepcopy(bag_round_stop)
         new_stops = []
         n_evaluations = 0
         n_improvements = 0
 
+        # FIFO routes are scanned at once with array operations
+        if self.backend == "numpy" and self.next_compiled is None:
+            fifo_routes = [
+                (route, position)
+                for route, position in route_marked_stops
+                if self.compiled.route_fifo[route]
+            ]
+            route_marked_stops = [
+                (route, position)
+                for route, position in route_marked_stops
+                if not self.compiled.route_fifo[route]
+            ]
+            if len(fifo_routes) > 0:
+                routes, positions = np.array(fifo_routes, dtype=np.int64).T
+                fifo_new_stops, n_evaluations = self.traverse_routes_numpy(
+                    k, routes, positions
+                )
+                n_improvements += len(fifo_new_stops)
+                new_stops.extend(fifo_new_stops.tolist())
+
         # For each route
-        for (marked_route, marked_stop) in route_marked_stops:
-
-            # Current trip for this marked stop
-            current_trip = None
-
-            # Iterate over all stops after current stop within the current route
-            current_stop_index = marked_route.stop_index(marked_stop)
-            remaining_stops_in_route = marked_route.stops[current_stop_index:]
-            boarding_stop = None
-
-            for current_stop_index, current_stop in enumerate(remaining_stops_in_route):
-                # Can the label be improved in this round?
-                n_evaluations += 1
-
-                # t != _|_
-                if current_trip is not None:
-                    # Arrival time at stop, i.e. arr(current_trip, next_stop)
-                    new_arrival_time = current_trip.get_stop(current_stop).dts_arr
-                    best_arrival_time = self.bag_star[
-                        current_stop
-                    ].earliest_arrival_time
-
-                    if new_arrival_time < best_arrival_time:
-                        # Update arrival by trip, i.e.
-                        #   t_k(next_stop) = t_arr(t, pi)
-                        #   t_star(p_i) = t_arr(t, pi)
-
-                        bag_round_stop[k][current_stop].update(
-                            new_arrival_time, current_trip, boarding_stop
-                        )
-                        self.bag_star[current_stop].update(
-                            new_arrival_time, current_trip, boarding_stop
-                        )
-
-                        # Logging
-                        n_improvements += 1
-                        new_stops.append(current_stop)
-
-                # Can we catch an earlier trip at p_i
-                # if tau_{k-1}(next_stop) <= tau_dep(t, next_stop)
-                previous_earliest_arrival_time = bag_round_stop[k][
-                    current_stop
-                ].earliest_arrival_time
-                earliest_trip_stop_time = marked_route.earliest_trip_stop_time(
-                    previous_earliest_arrival_time, current_stop
+        for (marked_route, marked_position) in route_marked_stops:
+            if self.next_compiled is not None:
+                route_new_stops = self.traverse_route_overnight(
+                    k, marked_route, marked_position
                 )
-                if (
-                    earliest_trip_stop_time is not None
-                    and previous_earliest_arrival_time
-                    <= earliest_trip_stop_time.dts_dep
-                ):
-                    current_trip = earliest_trip_stop_time.trip
-                    boarding_stop = current_stop
+            else:
+                route_new_stops = self.traverse_route(k, marked_route, marked_position)
+            n_evaluations += (
+                len(self.compiled.stops_of_route(marked_route)) - marked_position
+            )
+            n_improvements += len(route_new_stops)
+            if len(route_new_stops) > 0:
+                self.update_target_time(k)
+            new_stops.extend(route_new_stops)
 
         logger.debug(f"- Evaluations    : {n_evaluations}")
         logger.debug(f"- Improvements   : {n_improvements}")
+        self.stats.rounds[-1].evaluations = n_evaluations
+        self.stats.rounds[-1].improvements = n_improvements
 
-        return bag_round_stop, new_stops
+        if self.backend == "numpy":
+            return np.array(new_stops, dtype=np.int32)
+        return new_stops
 
-    def add_transfer_time(
-        self,
-        bag_round_stop: Dict[int, Dict[Stop, Label]],
-        k: int,
-        marked_stops: List[Stop],
-    ) -> Tuple:
+    def traverse_route(self, k: int, route: int, marked_position: int) -> List[int]:
+        """
+        Traverse route stop by stop from the first marked stop
+
+        :param k: current round
+        :param route: route index
+        :param marked_position: position of first marked stop in route
+        :return: indices of stops with improved earliest arrival time
+        """
+        compiled = self.compiled
+        tau_previous = self.tau[k - 1]
+        tau_k = self.tau[k]
+        parent_trip = self.parent_trip[k]
+        parent_stop = self.parent_stop[k]
+        target_time = self.target_time
+        new_stops = []
+
+        route_stops = compiled.stops_of_route(route).tolist()
+        sorted_dep, sorted_trip = compiled.route_sorted_departures(route)
+        route_dep = compiled.route_departures(route)
+        route_arr = compiled.route_arrivals(route)
+        route_trips = int(compiled.route_trips_ptr[route])
+        fifo = compiled.route_fifo[route]
+
+        # Current trip (row in route matrices) for this marked stop
+        current_trip = None
+        current_arrivals = None
+        boarding_stop = None
+
+        # Iterate over all stops after current stop within the current route
+        for position in range(marked_position, len(route_stops)):
+            current_stop = route_stops[position]
+
+            # t != _|_
+            if current_trip is not None:
+                # Arrival time at stop, i.e. arr(current_trip, next_stop)
+                new_arrival_time = current_arrivals[position]
+
+                if new_arrival_time < min(tau_k[current_stop], target_time):
+                    # Update arrival by trip, i.e.
+                    #   t_k(next_stop) = t_arr(t, pi)
+                    tau_k[current_stop] = new_arrival_time
+                    parent_trip[current_stop] = route_trips + current_trip
+                    parent_stop[current_stop] = boarding_stop
+                    new_stops.append(current_stop)
+
+            # Can we catch an earlier trip at p_i
+            # if tau_{k-1}(next_stop) <= tau_dep(t, next_stop)
+            previous_earliest_arrival_time = tau_previous[current_stop]
+            if current_trip is None or not fifo:
+                earliest_trip = earliest_trip_index(
+                    sorted_dep[position],
+                    sorted_trip[position],
+                    previous_earliest_arrival_time,
+                )
+            elif (
+                previous_earliest_arrival_time
+                <= route_dep[current_trip, position]
+                < LARGE_NUMBER
+            ):
+                # Trips in a FIFO route keep their order at every stop, so only
+                # trips before the current trip can be an earlier trip
+                earliest_trip = current_trip
+                while (
+                    earliest_trip > 0
+                    and route_dep[earliest_trip - 1, position]
+                    >= previous_earliest_arrival_time
+                ):
+                    earliest_trip -= 1
+            else:
+                earliest_trip = None
+            if earliest_trip is not None:
+                if earliest_trip != current_trip:
+                    current_trip = earliest_trip
+                    current_arrivals = route_arr[current_trip].tolist()
+                boarding_stop = current_stop
+
+        return new_stops
+
+    def traverse_route_overnight(
+        self, k: int, route: int, marked_position: int
+    ) -> List[int]:
+        """
+        Traverse route stop by stop from the first marked stop, with the trips of
+        the route on this day and on the next day. The times of trips on the next day
+        are offset by a day when read, so the trips are not copied.
+
+        :param k: current round
+        :param route: route index
+        :param marked_position: position of first marked stop in route
+        :return: indices of stops with improved earliest arrival time
+        """
+        compiled = self.compiled
+        tau_previous = self.tau[k - 1]
+        tau_k = self.tau[k]
+        parent_trip = self.parent_trip[k]
+        parent_stop = self.parent_stop[k]
+        target_time = self.target_time
+        new_stops = []
+
+        route_stops = compiled.stops_of_route(route).tolist()
+        fifo = compiled.route_fifo[route]
+
+        # Trips of route on this day and the next day
+        days = [compiled, self.next_compiled]
+        offsets = [0, SECONDS_PER_DAY]
+        first_trips = [
+            int(compiled.route_trips_ptr[route]),
+            compiled.n_trips + int(self.next_compiled.route_trips_ptr[route]),
+        ]
+        sorted_departures = [c.route_sorted_departures(route) for c in days]
+        route_deps = [c.route_departures(route) for c in days]
+        route_arrs = [c.route_arrivals(route) for c in days]
+
+        # Current trip for this marked stop, i.e. day and row in route matrices
+        current_day, current_trip = None, None
+        current_arrivals = None
+        boarding_stop = None
+
+        # Iterate over all stops after current stop within the current route
+        for position in range(marked_position, len(route_stops)):
+            current_stop = route_stops[position]
+
+            # t != _|_
+            if current_trip is not None:
+                # Arrival time at stop, i.e. arr(current_trip, next_stop)
+                new_arrival_time = current_arrivals[position]
+
+                if new_arrival_time < min(tau_k[current_stop], target_time):
+                    tau_k[current_stop] = new_arrival_time
+                    parent_trip[current_stop] = first_trips[current_day] + current_trip
+                    parent_stop[current_stop] = boarding_stop
+                    new_stops.append(current_stop)
+
+            # Earliest trip at p_i on either day
+            previous_earliest_arrival_time = tau_previous[current_stop]
+            earliest_day, earliest_trip = None, None
+            earliest_departure = LARGE_NUMBER
+            for day, (sorted_dep, sorted_trip) in enumerate(sorted_departures):
+                trip = earliest_trip_index(
+                    sorted_dep[position],
+                    sorted_trip[position],
+                    previous_earliest_arrival_time - offsets[day],
+                )
+                if trip is None:
+                    continue
+                departure = int(route_deps[day][trip, position]) + offsets[day]
+                if departure < earliest_departure:
+                    earliest_day, earliest_trip = day, trip
+                    earliest_departure = departure
+
+            # Trips in a FIFO route keep their order, so only catch an earlier trip
+            if earliest_trip is not None and current_trip is not None and fifo:
+                current_departure = int(route_deps[current_day][current_trip, position])
+                if (
+                    current_departure >= LARGE_NUMBER
+                    or earliest_departure > current_departure + offsets[current_day]
+                ):
+                    earliest_trip = None
+            if earliest_trip is not None:
+                if (earliest_day, earliest_trip) != (current_day, current_trip):
+                    current_day, current_trip = earliest_day, earliest_trip
+                    current_arrivals = [
+                        arrival + offsets[current_day]
+                        if arrival < LARGE_NUMBER
+                        else LARGE_NUMBER
+                        for arrival in route_arrs[current_day][current_trip].tolist()
+                    ]
+                boarding_stop = current_stop
+
+        return new_stops
+
+    def traverse_routes_numpy(
+        self, k: int, routes: np.ndarray, marked_positions: np.ndarray
+    ) -> Tuple[np.ndarray, int]:
+        """
+        Traverse FIFO routes from their first marked stop with array operations over
+        the stops of all routes at once, concatenated in segments per route.
+
+        The earliest trip that can be boarded at every stop follows from a binary
+        search in the sorted departures at the stop, with the earliest arrival time
+        of the previous round. The trip at a stop is the earliest trip boarded at any
+        stop before in the route, as trips of a FIFO route keep their order. If
+        several routes improve a stop, the earliest arrival time is kept.
+
+        :param k: current round
+        :param routes: route indices
+        :param marked_positions: position of first marked stop per route
+        :return: indices of stops with improved earliest arrival time, and the
+            number of evaluated stops
+        """
+        compiled = self.compiled
+        route_n_trips = (
+            compiled.route_trips_ptr[routes + 1] - compiled.route_trips_ptr[routes]
+        ).astype(np.int64)
+        has_trips = route_n_trips > 0
+        routes, marked_positions = routes[has_trips], marked_positions[has_trips]
+        route_n_trips = route_n_trips[has_trips]
+        route_n_stops = (
+            compiled.route_stops_ptr[routes + 1] - compiled.route_stops_ptr[routes]
+        ).astype(np.int64)
+        lengths = route_n_stops - marked_positions
+        n_evaluations = int(lengths.sum())
+        if n_evaluations == 0:
+            return np.empty(0, dtype=np.int32), 0
+
+        # Segment and position in route of every scanned stop, from the marked stop
+        segment = np.repeat(np.arange(len(routes)), lengths)
+        segment_start = np.cumsum(lengths) - lengths
+        positions = np.arange(n_evaluations) - segment_start[segment]
+        positions += marked_positions[segment]
+        column = compiled.route_stops_ptr[routes][segment] + positions
+        stops = compiled.route_stops[column]
+        n_trips = route_n_trips[segment]
+
+        # Earliest trip per stop, i.e. the first departure at or after tau_{k-1}(p)
+        boarding_times = self.tau[k - 1][stops].astype(np.int64)
+        first = compiled.route_times_ptr[routes][segment] + positions * n_trips
+        index = np.searchsorted(
+            departure_keys(compiled), column * (LARGE_NUMBER + 1) + boarding_times
+        )
+        boarded = (index < first + n_trips) & (boarding_times < LARGE_NUMBER)
+        boarded[boarded] &= compiled.dep_sorted[index[boarded]] < LARGE_NUMBER
+        no_trip = int(route_n_trips.max())
+        boarding_trip = np.full(n_evaluations, no_trip, dtype=np.int64)
+        boarding_trip[boarded] = compiled.dep_sorted_trip[index[boarded]]
+
+        # Trip at each stop is the earliest trip boarded at a previous stop of the
+        # route, i.e. a prefix minimum per segment. Later segments are offset to be
+        # smaller than earlier segments, so the minimum restarts at every segment.
+        offset = (len(routes) - 1 - segment) * (no_trip + 1)
+        earliest_trip = np.minimum.accumulate(boarding_trip + offset) - offset
+        trip = np.empty(n_evaluations, dtype=np.int64)
+        trip[1:] = earliest_trip[:-1]
+        trip[segment_start] = no_trip
+        has_trip = trip < no_trip
+
+        arrivals = np.full(n_evaluations, LARGE_NUMBER, dtype=np.int64)
+        route_times_ptr = compiled.route_times_ptr[routes][segment]
+        arrivals[has_trip] = compiled.arr[
+            route_times_ptr[has_trip]
+            + trip[has_trip] * route_n_stops[segment][has_trip]
+            + positions[has_trip]
+        ]
+        improved = np.flatnonzero(
+            arrivals < np.minimum(self.tau[k][stops], self.target_time)
+        )
+        if len(improved) == 0:
+            return np.empty(0, dtype=np.int32), n_evaluations
+
+        # Boarding stop is the last stop before where the trip could be boarded
+        boarding_position = np.maximum.accumulate(
+            np.where(
+                boarded & (boarding_trip == earliest_trip),
+                np.arange(n_evaluations),
+                -1,
+            )
+        )
+
+        # Earliest arrival per improved stop, as a stop can be served by many routes
+        order = np.lexsort((arrivals[improved], stops[improved]))
+        improved = improved[order]
+        unique = np.ones(len(improved), dtype=bool)
+        unique[1:] = stops[improved][1:] != stops[improved][:-1]
+        improved = improved[unique]
+
+        improved_stops = stops[improved]
+        self.tau[k][improved_stops] = arrivals[improved]
+        self.parent_trip[k][improved_stops] = (
+            compiled.route_trips_ptr[routes][segment[improved]] + trip[improved]
+        )
+        self.parent_stop[k][improved_stops] = stops[boarding_position[improved - 1]]
+        self.update_target_time(k)
+
+        return improved_stops, n_evaluations
+
+    def add_transfer_time(self, k: int, marked_stops: List[int]) -> List[int]:
         """
         Add transfers between platforms.
 
-        :param bag_round_stop: Label per round per stop
         :param k: current round
-        :param marked_stops: list of marked stops for evaluation
+        :param marked_stops: list of indices of marked stops for evaluation
+        :return: indices of stops with improved earliest arrival time
         """
+        if self.backend == "numpy":
+            return self.add_transfer_time_numpy(k, marked_stops)
 
+        compiled = self.compiled
+        tau_k = self.tau[k]
+        target_time = self.target_time
         new_stops = []
+        n_transfers = 0
 
         # Add in transfers to other platforms
         for current_stop in marked_stops:
-            other_station_stops = [
-                st for st in current_stop.station.stops if st != current_stop
-            ]
+            time_sofar = tau_k[current_stop]
 
-            time_sofar = bag_round_stop[k][current_stop].earliest_arrival_time
-            for arrive_stop in other_station_stops:
-                new_earliest_arrival = time_sofar + self.get_transfer_time(
-                    current_stop, arrive_stop
-                )
-                previous_earliest_arrival = self.bag_star[
-                    arrive_stop
-                ].earliest_arrival_time
+            arrive_stops, transfer_times = compiled.transfers_of_stop(current_stop)
+            n_transfers += len(arrive_stops)
+            for arrive_stop, transfer_time in zip(
+                arrive_stops.tolist(), transfer_times.tolist()
+            ):
+                new_earliest_arrival = time_sofar + transfer_time
 
                 # Domination criteria
-                if new_earliest_arrival < previous_earliest_arrival:
-                    bag_round_stop[k][arrive_stop].update(
-                        new_earliest_arrival,
-                        TRANSFER_TRIP,
-                        current_stop,
-                    )
-                    self.bag_star[arrive_stop].update(
-                        new_earliest_arrival, TRANSFER_TRIP, current_stop
-                    )
+                if new_earliest_arrival < min(tau_k[arrive_stop], target_time):
+                    tau_k[arrive_stop] = new_earliest_arrival
+                    self.parent_trip[k][arrive_stop] = -1  # i.e. TRANSFER_TRIP
+                    self.parent_stop[k][arrive_stop] = current_stop
                     new_stops.append(arrive_stop)
+        self.stats.rounds[-1].transfers = n_transfers
+        self.update_target_time(k)
+
+        return new_stops
+
+    def add_transfer_time_numpy(self, k: int, marked_stops: np.ndarray) -> np.ndarray:
+        """Add transfers between platforms with a vectorised scatter-min"""
+        compiled = self.compiled
+        marked_stops = np.unique(marked_stops)
+        edges = csr_gather(compiled.transfers_ptr, marked_stops)
+        from_stops = np.repeat(
+            marked_stops, np.diff(compiled.transfers_ptr)[marked_stops]
+        )
+        to_stops = compiled.transfers_to[edges]
+        self.stats.rounds[-1].transfers = len(edges)
+        arrivals = self.tau[k][from_stops] + compiled.transfers_time[edges]
+
+        # Earliest arrival per destination stop, i.e. scatter-min with argmin
+        order = np.lexsort((arrivals, to_stops))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = to_stops[order][1:] != to_stops[order][:-1]
+        best = order[first]
+        to_stops, arrivals, from_stops = to_stops[best], arrivals[best], from_stops[best]
+
+        # Domination criteria
+        improved = arrivals < np.minimum(self.tau[k][to_stops], self.target_time)
+        to_stops = to_stops[improved]
+        self.tau[k][to_stops] = arrivals[improved]
+        self.parent_trip[k][to_stops] = -1  # i.e. TRANSFER_TRIP
+        self.parent_stop[k][to_stops] = from_stops[improved]
+        self.update_target_time(k)
+
+        return to_stops
+
+
+def csr_gather(ptr: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    """Indices of all elements of rows in CSR format with row pointers ptr"""
+    rows = np.asarray(rows, dtype=np.int64)
+    starts = ptr[rows]
+    lengths = ptr[rows + 1] - starts
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return offsets + np.arange(lengths.sum())
+
+
+def first_round_with_arrival(station_tau: np.ndarray) -> np.ndarray:
+    """
+    Fewest trips per station with the earliest arrival time, i.e. the first round
+    with the arrival time of the last round, for station arrival times with rounds
+    on the first axis as given by station_arrival_times. -1 if unreachable.
+    """
+    arrivals = station_tau[-1]
+    first_round = np.argmax(station_tau == arrivals, axis=0)
+    return np.where(arrivals < LARGE_NUMBER, first_round, -1)
 
-        return bag_round_stop, new_stops
 
-    def get_transfer_time(self, stop_from: Stop, stop_to: Stop) -> int:
-        """
-        Calculate the transfer time from a stop to another stop (usually at one station)
-        """
-        transfers = self.timetable.transfers
-        return transfers.stop_to_stop_idx[(stop_from, stop_to)].layovertime
+def departure_keys(compiled: CompiledTimetable) -> np.ndarray:
+    """
+    Sorted departures per route stop as one sorted array of search keys, i.e. the
+    departure offset by the index of the route stop times LARGE_NUMBER + 1.
+
+    The result is cached on compiled, so the keys are computed once per timetable.
+    """
+    if compiled.departure_keys is None:
+        column_trips = np.repeat(
+            np.diff(compiled.route_trips_ptr), np.diff(compiled.route_stops_ptr)
+        )
+        column = np.repeat(
+            np.arange(len(column_trips), dtype=np.int64), column_trips
+        )
+        compiled.departure_keys = (
+            column * (LARGE_NUMBER + 1) + compiled.dep_sorted.astype(np.int64)
+        )
+    return compiled.departure_keys
+
+
+def earliest_trip_index(
+    sorted_departures: np.ndarray, sorted_trips: np.ndarray, dep_secs: int
+) -> int:
+    """
+    Row index of the trip with the earliest departure at or after dep_secs,
+    using binary search on the sorted departures at a stop
+    """
+    index = np.searchsorted(sorted_departures, dep_secs)
+    if index == len(sorted_departures) or sorted_departures[index] >= LARGE_NUMBER:
+        return None
+    return int(sorted_trips[index])
 
 
 def best_stop_at_target_station(to_stops: List[Stop], bag: Dict[Stop, Label]) -> Stop:
@@ -265,20 +832,38 @@ def best_stop_at_target_station(to_stops: List[Stop], bag: Dict[Stop, Label]) ->
     return final_stop
 
 
-def reconstruct_journey(destination: Stop, bag: Dict[Stop, Label]) -> Journey:
-    """Construct journey for destination from values in bag."""
+def reconstruct_journey(
+    destination: Stop, bag: Dict[int, Mapping[Stop, Label]], k: int = None
+) -> Journey:
+    """
+    Construct journey for destination from the labels of round k.
+
+    The stop where a trip is boarded is looked up in the labels of the previous
+    round, so the journey has at most k trips. Without k, bag holds the labels
+    of a single round, e.g. of the Connection Scan Algorithm or the last round.
+    """
+    if k is None:
+        bag_round_stop, k = {0: bag}, 0
+    else:
+        bag_round_stop = bag
 
     # Create journey with list of legs
     jrny = Journey()
     to_stop = destination
     while to_stop is not None:
-        from_stop = bag[to_stop].from_stop
-        bag_to_stop = bag[to_stop]
+        bag_to_stop = bag_round_stop[k][to_stop]
+        from_stop = bag_to_stop.from_stop
         leg = Leg(
-            from_stop, to_stop, bag_to_stop.trip, bag_to_stop.earliest_arrival_time
+            from_stop,
+            to_stop,
+            bag_to_stop.trip,
+            bag_to_stop.earliest_arrival_time,
+            day_offset=bag_to_stop.day_offset,
         )
         jrny = jrny.prepend_leg(leg)
         to_stop = from_stop
+        if bag_to_stop.trip is not None:
+            k = max(k - 1, 0)
 
     jrny = jrny.remove_transfer_legs()
 
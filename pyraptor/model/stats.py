@@ -0,0 +1,93 @@
+"""Statistics of the work done by a query"""
+from __future__ import annotations
+from typing import Dict, List
+from dataclasses import dataclass, field, asdict
+
+
+@dataclass
+class RoundStats:
+    """Work done in a round, times in seconds"""
+
+    round: int
+    marked_stops: int = 0  # stops marked at the start of the round
+    routes: int = 0  # routes scanned
+    evaluations: int = 0  # stops evaluated while scanning routes
+    improvements: int = 0  # labels improved by trips
+    transfers: int = 0  # footpaths relaxed
+    accumulate_time: float = 0.0
+    traverse_time: float = 0.0
+    transfers_time: float = 0.0
+
+
+@dataclass
+class QueryStats:
+    """
+    Statistics of a query, i.e. the work done per round and the time per phase.
+
+    Range queries consist of a run per departure time, the rounds of all runs are
+    appended in order of the runs.
+    """
+
+    runs: int = 0
+    rounds: List[RoundStats] = field(default_factory=list)
+    reconstruction_time: float = 0.0  # seconds to reconstruct journeys from labels
+
+    def add_round(self, k: int, marked_stops: int) -> RoundStats:
+        """Start statistics of round k"""
+        round_stats = RoundStats(round=k, marked_stops=marked_stops)
+        self.rounds.append(round_stats)
+        return round_stats
+
+    def merge(self, other: QueryStats) -> QueryStats:
+        """Add statistics of other runs"""
+        self.runs += other.runs
+        self.rounds.extend(other.rounds)
+        self.reconstruction_time += other.reconstruction_time
+        return self
+
+    @property
+    def routes(self) -> int:
+        """Routes scanned in all rounds"""
+        return sum(r.routes for r in self.rounds)
+
+    @property
+    def evaluations(self) -> int:
+        """Stops evaluated in all rounds"""
+        return sum(r.evaluations for r in self.rounds)
+
+    @property
+    def improvements(self) -> int:
+        """Labels improved by trips in all rounds"""
+        return sum(r.improvements for r in self.rounds)
+
+    @property
+    def transfers(self) -> int:
+        """Footpaths relaxed in all rounds"""
+        return sum(r.transfers for r in self.rounds)
+
+    @property
+    def phase_times(self) -> Dict[str, float]:
+        """Seconds per phase over all rounds"""
+        return dict(
+            accumulate=sum(r.accumulate_time for r in self.rounds),
+            traverse=sum(r.traverse_time for r in self.rounds),
+            transfers=sum(r.transfers_time for r in self.rounds),
+            reconstruction=self.reconstruction_time,
+        )
+
+    @property
+    def total_time(self) -> float:
+        """Seconds of all phases"""
+        return sum(self.phase_times.values())
+
+    def to_dict(self) -> Dict:
+        """Statistics with totals as builtin types, e.g. to write as JSON"""
+        return dict(
+            asdict(self),
+            routes=self.routes,
+            evaluations=self.evaluations,
+            improvements=self.improvements,
+            transfers=self.transfers,
+            phase_times=self.phase_times,
+            total_time=self.total_time,
+        )
@@ -2,9 +2,10 @@
 from __future__ import annotations
 
 from itertools import compress
+from math import isfinite
+from bisect import bisect_left, bisect_right
 from collections import defaultdict
-from operator import attrgetter
-from typing import List, Dict, Tuple
+from typing import TYPE_CHECKING, Iterable, List, Dict, Tuple
 from dataclasses import dataclass, field
 from copy import copy
 
@@ -12,7 +13,10 @@ import attr
 import numpy as np
 from loguru import logger
 
-from pyraptor.util import sec2str
+from pyraptor.util import sec2str, SECONDS_PER_DAY
+
+if TYPE_CHECKING:
+    from pyraptor.model.compiled import CompiledTimetable
 
 
 def same_type_and_id(first, second):
@@ -22,7 +26,13 @@ def same_type_and_id(first, second):
 
 @dataclass
 class Timetable:
-    """Timetable data"""
+    """
+    Timetable data
+
+    A timetable can contain the trips of multiple service dates (yyyymmdd). The
+    service days of a trip are a bitset over the indices of the service dates.
+    The version is set when the timetable is written and identifies its contents.
+    """
 
     stations: Stations = None
     stops: Stops = None
@@ -30,6 +40,9 @@ class Timetable:
     trip_stop_times: TripStopTimes = None
     routes: Routes = None
     transfers: Transfers = None
+    service_dates: List[str] = None
+    version: str = field(default=None, compare=False)
+    compiled: CompiledTimetable = field(default=None, repr=False, compare=False)
 
     def counts(self) -> None:
         """Print timetable counts"""
@@ -40,6 +53,26 @@ class Timetable:
         logger.debug("Stops      : {}", len(self.stops))
         logger.debug("Stop Times : {}", len(self.trip_stop_times))
         logger.debug("Transfers  : {}", len(self.transfers))
+        logger.debug("Dates      : {}", self.service_dates)
+
+    def day_index(self, date: str) -> int:
+        """Index of service date, None for all trips if no date is given"""
+        return day_index(self.service_dates, date)
+
+
+def day_index(service_dates: List[str], date: str) -> int:
+    """
+    Index of date in service dates.
+    No date is only allowed for timetables with a single service date and then
+    returns None, i.e. all trips are active.
+    """
+    if date is None:
+        if service_dates is not None and len(service_dates) > 1:
+            raise ValueError("Date is required for timetable with multiple dates")
+        return None
+    if service_dates is None or date not in service_dates:
+        raise ValueError(f"No service on date {date}, service dates {service_dates}")
+    return service_dates.index(date)
 
 
 @attr.s(repr=False, cmp=False)
@@ -251,6 +284,7 @@ class Trip:
     stop_times_index = attr.ib(default=attr.Factory(dict))
     hint = attr.ib(default=None)
     long_name = attr.ib(default=None)  # e.g., Sprinter
+    service_days = attr.ib(default=None)  # bitset of service date indices, None if all
 
     def __hash__(self):
         return hash(self.id)
@@ -281,22 +315,66 @@ class Trip:
         """Add stop time"""
         if np.isfinite(stop_time.dts_arr) and np.isfinite(stop_time.dts_dep):
             assert stop_time.dts_arr <= stop_time.dts_dep
-            assert (
-                not self.stop_times or self.stop_times[-1].dts_dep <= stop_time.dts_arr
+            # Departure at previous stop can be missing, i.e. NaN
+            assert not self.stop_times or not (
+                self.stop_times[-1].dts_dep > stop_time.dts_arr
             )
         self.stop_times.append(stop_time)
         self.stop_times_index[stop_time.stop] = len(self.stop_times) - 1
 
+    def is_active(self, day: int) -> bool:
+        """Trip runs on day, i.e. index of service date, or on all days if None"""
+        if day is None or self.service_days is None:
+            return True
+        return bool(self.service_days >> day & 1)
+
     def get_stop(self, stop: Stop) -> TripStopTime:
         """Get stop"""
         return self.stop_times[self.stop_times_index[stop]]
     
+    def precedes(self, other: Trip) -> bool:
+        """
+        Trip departs and arrives not later than other trip at every stop, i.e.
+        neither trip overtakes the other when this trip runs first.
+        Only times that both trips have are compared.
+        """
+        for first, second in zip(self.stop_times, other.stop_times):
+            # Comparisons with missing times, i.e. NaN, are False
+            if first.dts_arr > second.dts_arr or first.dts_dep > second.dts_dep:
+                return False
+        return True
+
+    def time_keys(self) -> set:
+        """(stop index, is departure) of every arrival and departure time of trip"""
+        return {
+            (stopidx, is_departure)
+            for stopidx, stop_time in enumerate(self.stop_times)
+            for is_departure, dts in enumerate((stop_time.dts_arr, stop_time.dts_dep))
+            if isfinite(dts)
+        }
+
     def get_fare(self, depart_stop: Stop) -> int:
         """Get fare from depart_stop"""
         stop_time = self.get_stop(depart_stop)
         return 0 if stop_time is None else stop_time.fare
 
 
+def nearest_trips_ordered(trip: Trip, trips: Iterable[Trip], before: bool) -> bool:
+    """
+    Trips, nearest to trip first, precede trip if before, or follow trip otherwise.
+    Trips are compared until every time of trip is compared with a trip that has
+    that time.
+    """
+    time_keys = trip.time_keys()
+    for other in trips:
+        if not (other.precedes(trip) if before else trip.precedes(other)):
+            return False
+        time_keys -= other.time_keys()
+        if not time_keys:
+            break
+    return True
+
+
 class Trips:
     """Trips"""
 
@@ -329,12 +407,25 @@ class Trips:
 
 @attr.s(repr=False, cmp=False)
 class Route:
-    """Route"""
+    """
+    Route
+
+    Trips are kept ordered by departure time at the first stop. For every stop in the
+    route the departure times of all trips are kept in sorted order, such that the
+    earliest trip from a stop is found with a binary search.
+
+    A route is FIFO if no trip overtakes another trip at any stop. Then the order of
+    the trips is the same at every stop, and a later trip never arrives earlier.
+    """
 
     id = attr.ib(default=None)
     trips = attr.ib(default=attr.Factory(list))
     stops = attr.ib(default=attr.Factory(list))
     stop_order = attr.ib(default=attr.Factory(dict))
+    stop_departures = attr.ib(default=attr.Factory(list))  # [[dts_dep]] per stop
+    stop_trip_stop_times = attr.ib(default=attr.Factory(list))  # [[TripStopTime]] per stop
+    trip_departures = attr.ib(default=attr.Factory(list))  # [dts_dep] at first stop
+    fifo = attr.ib(default=True)  # no trip overtakes another trip
 
     def __hash__(self):
         return hash(self.id)
@@ -355,12 +446,58 @@ class Route:
         return iter(self.trips)
 
     def add_trip(self, trip: Trip) -> None:
-        """Add trip"""
-        self.trips.append(trip)
+        """Add trip, keeping trips and departures per stop sorted"""
+        position = self.fifo_position(trip) if self.fifo else None
+        if position is None:
+            # Trip overtakes or is overtaken by another trip in route
+            self.fifo = False
+            position = bisect_right(
+                self.first_departures(), trip.stop_times[0].dts_dep
+            )
+        self.trips.insert(position, trip)
+        self.trip_departures.insert(position, trip.stop_times[0].dts_dep)
+
+        for stop_idx, trip_stop_time in enumerate(trip.stop_times):
+            # Trips cannot be boarded at stops without departure time
+            if not np.isfinite(trip_stop_time.dts_dep):
+                continue
+            departures = self.stop_departures[stop_idx]
+            index = bisect_right(departures, trip_stop_time.dts_dep)
+            departures.insert(index, trip_stop_time.dts_dep)
+            self.stop_trip_stop_times[stop_idx].insert(index, trip_stop_time)
+
+    def first_departures(self) -> List[int]:
+        """Departure times of trips at first stop"""
+        return self.trip_departures
+
+    def fifo_position(self, trip: Trip) -> int:
+        """
+        Position to insert trip in trips such that no trip overtakes another trip,
+        or None if there is no such position.
+
+        As the trips of a FIFO route with a time at a stop are ordered at that stop,
+        it is sufficient to compare every time of the trip with the nearest trips
+        before and after its position that have that time.
+        """
+        first_departures = self.first_departures()
+        dts_dep = trip.stop_times[0].dts_dep
+        for position in range(
+            bisect_left(first_departures, dts_dep),
+            bisect_right(first_departures, dts_dep) + 1,
+        ):
+            before = (self.trips[i] for i in range(position - 1, -1, -1))
+            after = (self.trips[i] for i in range(position, len(self.trips)))
+            if nearest_trips_ordered(trip, before, True) and nearest_trips_ordered(
+                trip, after, False
+            ):
+                return position
+        return None
 
     def add_stop(self, stop: Stop) -> None:
         """Add stop"""
         self.stops.append(stop)
+        self.stop_departures.append([])
+        self.stop_trip_stop_times.append([])
         # (re)make dict to save the order of the stops in the route
         self.stop_order = {stop: index for index, stop in enumerate(self.stops)}
 
@@ -368,21 +505,23 @@ class Route:
         """Stop index"""
         return self.stop_order[stop]
 
-    def earliest_trip(self, dts_arr: int, stop: Stop) -> Trip:
-        """Returns earliest trip after time dts (sec)"""
-        stop_idx = self.stop_index(stop)
-        trip_stop_times = [trip.stop_times[stop_idx] for trip in self.trips]
-        trip_stop_times = [tst for tst in trip_stop_times if tst.dts_dep >= dts_arr]
-        trip_stop_times = sorted(trip_stop_times, key=attrgetter("dts_dep"))
-        return trip_stop_times[0].trip if len(trip_stop_times) > 0 else None
+    def earliest_trip(self, dts_arr: int, stop: Stop, day: int = None) -> Trip:
+        """Returns earliest trip after time dts (sec) running on day"""
+        trip_stop_time = self.earliest_trip_stop_time(dts_arr, stop, day)
+        return trip_stop_time.trip if trip_stop_time is not None else None
 
-    def earliest_trip_stop_time(self, dts_arr: int, stop: Stop) -> TripStopTime:
-        """Returns earliest trip stop time after time dts (sec)"""
+    def earliest_trip_stop_time(
+        self, dts_arr: int, stop: Stop, day: int = None
+    ) -> TripStopTime:
+        """Returns earliest trip stop time after time dts (sec) running on day"""
         stop_idx = self.stop_index(stop)
-        trip_stop_times = [trip.stop_times[stop_idx] for trip in self.trips]
-        trip_stop_times = [tst for tst in trip_stop_times if tst.dts_dep >= dts_arr]
-        trip_stop_times = sorted(trip_stop_times, key=attrgetter("dts_dep"))
-        return trip_stop_times[0] if len(trip_stop_times) > 0 else None
+        index = bisect_left(self.stop_departures[stop_idx], dts_arr)
+        trip_stop_times = self.stop_trip_stop_times[stop_idx]
+        while index < len(trip_stop_times):
+            if trip_stop_times[index].trip.is_active(day):
+                return trip_stop_times[index]
+            index += 1
+        return None
 
 
 class Routes:
@@ -390,7 +529,7 @@ class Routes:
 
     def __init__(self):
         self.set_idx = dict()
-        self.set_stops_idx = dict()
+        self.set_stops_idx = dict()  # {(stop ids): [Route]}
         self.stop_to_routes = defaultdict(list)  # {Stop: [Route]}
         self.last_id = 1
 
@@ -407,13 +546,23 @@ class Routes:
         return iter(self.set_idx.values())
 
     def add(self, trip: Trip):
-        """Add trip to route. Make route if not exists."""
+        """
+        Add trip to route. Make route if not exists.
+
+        Trips with the same stops are split over multiple FIFO routes, i.e. a trip is
+        added to a new route with the same stops if it overtakes or is overtaken by
+        a trip in every existing route.
+        """
         trip_stop_ids = trip.trip_stop_ids()
 
-        if trip_stop_ids in self.set_stops_idx:
-            # Route already exists
-            route = self.set_stops_idx[trip_stop_ids]
-        else:
+        route = None
+        for candidate in self.set_stops_idx.get(trip_stop_ids, []):
+            if candidate.fifo and candidate.fifo_position(trip) is not None:
+                # Route already exists
+                route = candidate
+                break
+
+        if route is None:
             # Route does not exist yet, make new route
             route = Route()
             route.id = self.last_id
@@ -424,7 +573,7 @@ class Routes:
                 self.stop_to_routes[trip_stop_time.stop].append(route)
 
             # Efficient lookups
-            self.set_stops_idx[trip_stop_ids] = route
+            self.set_stops_idx.setdefault(trip_stop_ids, []).append(route)
             self.set_idx[route.id] = route
             self.last_id += 1
 
@@ -494,6 +643,7 @@ class Leg:
     earliest_arrival_time: int
     fare: int = 0
     n_trips: int = 0
+    day_offset: int = 0  # trip runs on the next day if 1
 
     @property
     def criteria(self):
@@ -505,14 +655,14 @@ class Leg:
         """Departure time"""
         return [
             tst.dts_dep for tst in self.trip.stop_times if self.from_stop == tst.stop
-        ][0]
+        ][0] + self.day_offset * SECONDS_PER_DAY
 
     @property
     def arr(self):
         """Arrival time"""
         return [
             tst.dts_arr for tst in self.trip.stop_times if self.to_stop == tst.stop
-        ][0]
+        ][0] + self.day_offset * SECONDS_PER_DAY
 
     def is_transfer(self):
         """Is transfer leg"""
@@ -562,7 +712,12 @@ class Leg:
 
 @dataclass(frozen=True)
 class Label:
-    """Label"""
+    """
+    Label
+
+    The parent is the label the leg of this label continues from, i.e. the label
+    at from_stop, so the journey of a label follows from its parents.
+    """
 
     earliest_arrival_time: int
     fare: int  # total fare
@@ -570,6 +725,7 @@ class Label:
     from_stop: Stop  # stop to hop-on the trip
     n_trips: int = 0
     infinite: bool = False
+    parent: Label = field(default=None, compare=False, repr=False)
 
     @property
     def criteria(self):
@@ -577,7 +733,10 @@ class Label:
         return [self.earliest_arrival_time, self.fare, self.n_trips]
 
     def update(self, earliest_arrival_time=None, fare_addition=None, from_stop=None):
-        """Update earliest arrival time and add fare_addition to fare"""
+        """
+        Update earliest arrival time and add fare_addition to fare.
+        A new from_stop starts a new leg, e.g. a transfer, from this label.
+        """
         return copy(
             Label(
                 earliest_arrival_time=earliest_arrival_time
@@ -590,11 +749,12 @@ class Label:
                 from_stop=from_stop if from_stop is not None else self.from_stop,
                 n_trips=self.n_trips,
                 infinite=self.infinite,
+                parent=self if from_stop is not None else self.parent,
             )
         )
 
     def update_trip(self, trip: Trip, current_stop: Stop):
-        """Update trip"""
+        """Update trip, a different trip is boarded at current_stop from this label"""
         return copy(
             Label(
                 earliest_arrival_time=self.earliest_arrival_time,
@@ -603,6 +763,7 @@ class Label:
                 from_stop=current_stop if self.trip != trip else self.from_stop,
                 n_trips=self.n_trips + 1 if self.trip != trip else self.n_trips,
                 infinite=self.infinite,
+                parent=self if self.trip != trip else self.parent,
             )
         )
 
@@ -627,13 +788,21 @@ class Bag:
         self.labels.append(label)
 
     def merge(self, other_bag: Bag) -> Bag:
-        """Merge other bag in bag and return true if bag is updated"""
-        pareto_labels = self.labels + other_bag.labels
-        if len(pareto_labels) == 0:
-            return Bag(labels=[], update=False)
-        pareto_labels = pareto_set(pareto_labels)
-        bag_update = True if pareto_labels != self.labels else False
-        return Bag(labels=pareto_labels, update=bag_update)
+        """
+        Merge other bag in bag, the merged bag is updated if its labels differ
+        from the labels of bag.
+
+        The labels are inserted one by one with pareto_insert, which gives the same
+        labels as pareto_set on all labels. Bags hold a few labels, for which plain
+        comparisons are much faster than building arrays of the criteria.
+        """
+        labels = []
+        for label in self.labels:
+            pareto_insert(labels, label)
+        bag_update = len(labels) != len(self.labels)
+        for label in other_bag.labels:
+            bag_update |= pareto_insert(labels, label)
+        return Bag(labels=labels, update=bag_update)
 
     def labels_with_trip(self):
         """All labels with trips, i.e. all labels that are reachable with a trip with given criterion"""
@@ -776,29 +945,85 @@ class Journey:
         """Convert journey to list of legs as dict"""
         return [leg.to_dict(leg_index=idx) for idx, leg in enumerate(self.legs)]
 
+def pareto_insert(labels: List[Label], label: Label) -> bool:
+    """
+    Insert label in list of pairwise non-dominating labels, in place.
+
+    The label is rejected if a label in the list is at least as good on all
+    criteria of Label.criteria, otherwise the labels it dominates are evicted and
+    the label is appended.
+
+    :return: true if label is inserted
+    """
+    arrival, fare, n_trips = label.earliest_arrival_time, label.fare, label.n_trips
+    dominates_other = False
+    for other in labels:
+        if (
+            other.earliest_arrival_time <= arrival
+            and other.fare <= fare
+            and other.n_trips <= n_trips
+        ):
+            return False
+        if (
+            arrival <= other.earliest_arrival_time
+            and fare <= other.fare
+            and n_trips <= other.n_trips
+        ):
+            dominates_other = True
+
+    if dominates_other:
+        labels[:] = [
+            other
+            for other in labels
+            if not (
+                arrival <= other.earliest_arrival_time
+                and fare <= other.fare
+                and n_trips <= other.n_trips
+            )
+        ]
+    labels.append(label)
+    return True
+
+
 def pareto_set(labels: List[Label], keep_equal=False):
     """
-    Find the pareto-efficient points
+    Find the pareto-efficient points with a sort-based skyline algorithm
     :param labels: list with labels
     :keep_equal return also labels with equal criteria
-    :return: list with pairwise non-dominating labels
+    :return: list with pairwise non-dominating labels, in order of labels
+
+    Labels are sorted on their criteria and swept in that order, so a label can
+    only be dominated by a label before it. The labels kept so far form a staircase
+    on the second and third criterion, i.e. the third criterion decreases with the
+    second, and a label is dominated if the step at or before its second criterion
+    is not higher than its third criterion. Of labels with equal criteria only the
+    first is kept, or all with keep_equal.
     """
-
-    is_efficient = np.ones(len(labels), dtype=bool)
-    labels_criteria = np.array([label.criteria for label in labels])
-    for i, label in enumerate(labels_criteria):
-        if is_efficient[i]:
-            # Keep any point with a lower cost
-            if keep_equal:
-                # keep point with all labels equal or one lower
-                is_efficient[is_efficient] = np.any(
-                    labels_criteria[is_efficient] < label, axis=1
-                ) + np.all(labels_criteria[is_efficient] == label, axis=1)
-            else:
-                is_efficient[is_efficient] = np.any(
-                    labels_criteria[is_efficient] < label, axis=1
-                )
-
-            is_efficient[i] = True  # And keep self
+    criteria = [tuple(label.criteria) for label in labels]
+    order = sorted(range(len(labels)), key=criteria.__getitem__)
+
+    steps_x, steps_y = [], []  # staircase of kept labels
+    is_efficient = [False] * len(labels)
+    previous, previous_index = None, None
+    for i in order:
+        _, x, y = criteria[i]
+        if criteria[i] == previous:
+            # Equal to previous label, which is kept if not dominated
+            is_efficient[i] = keep_equal and is_efficient[previous_index]
+            continue
+        previous, previous_index = criteria[i], i
+
+        step = bisect_right(steps_x, x) - 1
+        if step >= 0 and steps_y[step] <= y:
+            continue  # dominated
+        is_efficient[i] = True
+
+        # Add step, removing the steps it dominates
+        start = bisect_left(steps_x, x)
+        end = start
+        while end < len(steps_y) and steps_y[end] >= y:
+            end += 1
+        steps_x[start:end] = [x]
+        steps_y[start:end] = [y]
 
     return list(compress(labels, is_efficient))
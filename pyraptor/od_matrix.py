@@ -0,0 +1,334 @@
+"""Travel time matrix from origin stations to all stations with RAPTOR"""
+import argparse
+from pathlib import Path
+from dataclasses import dataclass
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+from pyraptor.dao.timetable import read_timetable
+from pyraptor.model.structures import Timetable
+from pyraptor.model.raptor import RaptorAlgorithm, BACKENDS, first_round_with_arrival
+from pyraptor.model.multi_raptor import MultiRaptorAlgorithm
+from pyraptor.util import str2sec, LARGE_NUMBER
+
+ORIGINS_PER_RUN = 256  # Origins routed at once, bounds the memory of the labels
+
+def parse_arguments():
+    """Parse arguments"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-i",
+        "--input",
+        type=str,
+        default="data/output",
+        help="Input directory",
+    )
+    parser.add_argument(
+        "-or",
+        "--origins",
+        type=str,
+        nargs="+",
+        default=["Hertogenbosch ('s)"],
+        help="Origin stations of the matrix",
+    )
+    parser.add_argument(
+        "-t", "--time", type=str, default="08:35:00", help="Departure time (hh:mm:ss)"
+    )
+    parser.add_argument(
+        "-et",
+        "--endtime",
+        type=str,
+        default=None,
+        help="End of departure time window (hh:mm:ss), gives the shortest travel times",
+    )
+    parser.add_argument(
+        "-r",
+        "--rounds",
+        type=int,
+        default=5,
+        help="Number of rounds to execute the RAPTOR algorithm",
+    )
+    parser.add_argument(
+        "-b",
+        "--backend",
+        type=str,
+        default="python",
+        choices=BACKENDS,
+        help="Backend of the RAPTOR algorithm",
+    )
+    parser.add_argument(
+        "-c",
+        "--compiled",
+        action="store_true",
+        help="Read memory-mapped compiled timetable",
+    )
+    parser.add_argument(
+        "-dt",
+        "--date",
+        type=str,
+        default=None,
+        help="Departure date (yyyymmdd), required for timetables with multiple dates",
+    )
+    parser.add_argument(
+        "--overnight",
+        action="store_true",
+        help="Continue journeys with trips of the next day",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        default="data/output/od_matrix.npz",
+        help="Output file, .npz or .parquet",
+    )
+    arguments = parser.parse_args()
+    return arguments
+
+
+def main(
+    input_folder: str,
+    origin_stations: List[str],
+    departure_time: str,
+    departure_end_time: str,
+    rounds: int,
+    backend: str = "python",
+    compiled: bool = False,
+    date: str = None,
+    overnight: bool = False,
+    output_file: str = "data/output/od_matrix.npz",
+):
+    """Calculate travel time matrix"""
+
+    logger.debug("Input directory      : {}", input_folder)
+    logger.debug("Origin stations      : {}", origin_stations)
+    logger.debug("Departure time       : {}", departure_time)
+    logger.debug("Departure end time   : {}", departure_end_time)
+    logger.debug("Rounds               : {}", str(rounds))
+    logger.debug("Backend              : {}", backend)
+    logger.debug("Compiled             : {}", compiled)
+    logger.debug("Date                 : {}", date)
+    logger.debug("Overnight            : {}", overnight)
+    logger.debug("Output file          : {}", output_file)
+
+    timetable = read_timetable(input_folder, compiled)
+
+    matrix = od_matrix(
+        timetable,
+        origin_stations,
+        str2sec(departure_time),
+        rounds,
+        backend,
+        date=date,
+        overnight=overnight,
+        dep_secs_max=str2sec(departure_end_time) if departure_end_time else None,
+    )
+    write_od_matrix(output_file, matrix)
+
+
+@dataclass
+class ODMatrix:
+    """
+    Earliest arrival times from origin stations to destination stations, as
+    origins x destinations matrices in seconds.
+
+    Unreachable destinations have departure and arrival time LARGE_NUMBER and
+    -1 trips.
+    """
+
+    origins: List[str]
+    destinations: List[str]
+    departure_times: np.ndarray
+    arrival_times: np.ndarray
+    n_trips: np.ndarray  # fewest trips to arrive at arrival time from departure time
+
+    @property
+    def reachable(self) -> np.ndarray:
+        """Mask of reachable destinations"""
+        return self.arrival_times < LARGE_NUMBER
+
+    @property
+    def travel_times(self) -> np.ndarray:
+        """Travel times in seconds, LARGE_NUMBER if unreachable"""
+        return np.where(
+            self.reachable, self.arrival_times - self.departure_times, LARGE_NUMBER
+        )
+
+    def to_dict(self) -> Dict:
+        """Matrices as nested lists, None if unreachable"""
+        reachable = self.reachable
+        return dict(
+            origins=self.origins,
+            destinations=self.destinations,
+            **{
+                name: np.where(reachable, values, None).tolist()
+                for name, values in [
+                    ("departure_times", self.departure_times),
+                    ("arrival_times", self.arrival_times),
+                    ("n_trips", self.n_trips),
+                ]
+            },
+        )
+
+    def to_frame(self) -> pd.DataFrame:
+        """Reachable origin and destination pairs in long format"""
+        origin, destination = np.nonzero(self.reachable)
+        return pd.DataFrame(
+            dict(
+                origin=np.asarray(self.origins, dtype=object)[origin],
+                destination=np.asarray(self.destinations, dtype=object)[destination],
+                departure_time=self.departure_times[origin, destination],
+                arrival_time=self.arrival_times[origin, destination],
+                travel_time=self.travel_times[origin, destination],
+                n_trips=self.n_trips[origin, destination],
+            )
+        )
+
+
+def od_matrix(
+    timetable: Timetable,
+    origin_stations: List[str],
+    dep_secs: int,
+    rounds: int,
+    backend: str = "python",
+    date: str = None,
+    overnight: bool = False,
+    dep_secs_max: int = None,
+) -> ODMatrix:
+    """
+    Calculate the earliest arrival times and number of trips from every origin
+    station to all stations. The arrival times are read from the labels of the
+    last round, so no journeys are reconstructed.
+
+    The labels of round k are the earliest arrival times with at most k trips, so
+    the number of trips is the first round with the earliest arrival time.
+    Without departure time window all origins are routed at once with
+    MultiRaptorAlgorithm. With a window every origin is routed with rRAPTOR, which
+    has the same labels per round as a new run for every departure time, so the
+    number of trips is that of the journey from the departure time taken.
+
+    :param timetable: timetable
+    :param origin_stations: Names of origin stations
+    :param dep_secs: Time of departure in seconds
+    :param rounds: Number of iterations to perform
+    :param backend: Backend of the RAPTOR algorithm for a departure time window,
+        i.e. python or numpy
+    :param date: Departure date (yyyymmdd), only trips running on date are used
+    :param overnight: Continue journeys with trips of the next day
+    :param dep_secs_max: End of departure time window in seconds. If given, the
+        journeys with the shortest travel time departing within the window are
+        taken, using rRAPTOR over the departures from each origin in the window.
+    """
+    origin_stops = []
+    for origin_station in origin_stations:
+        station = timetable.stations.get(origin_station)
+        if station is None:
+            raise ValueError(f"Unknown station '{origin_station}'")
+        origin_stops.append(station.stops)
+
+    if dep_secs_max is None:
+        raptor = MultiRaptorAlgorithm(timetable, date, overnight)
+    else:
+        raptor = RaptorAlgorithm(timetable, backend, date, overnight)
+    compiled = raptor.compiled
+    shape = (len(origin_stations), compiled.n_stations)
+    departure_times = np.full(shape, LARGE_NUMBER, dtype=np.int64)
+    arrival_times = np.full(shape, LARGE_NUMBER, dtype=np.int64)
+    n_trips = np.full(shape, -1, dtype=np.int64)
+
+    if dep_secs_max is None:
+        for start in range(0, len(origin_stops), ORIGINS_PER_RUN):
+            rows = slice(start, start + ORIGINS_PER_RUN)
+            raptor.run(origin_stops[rows], dep_secs, rounds)
+            station_tau = raptor.station_arrival_times()
+            arrivals = station_tau[rounds]
+            reachable = arrivals < LARGE_NUMBER
+
+            departure_times[rows][reachable] = dep_secs
+            arrival_times[rows] = arrivals
+            n_trips[rows] = first_round_with_arrival(station_tau)
+    else:
+        for row, from_stops in enumerate(origin_stops):
+            potential_dep_secs = compiled.departures_in_range(
+                from_stops, dep_secs, dep_secs_max
+            )
+            logger.debug(
+                f"Origin {origin_stations[row]} with "
+                f"{len(potential_dep_secs)} departure times"
+            )
+
+            travel_times = np.full(compiled.n_stations, LARGE_NUMBER, dtype=np.int64)
+            for dep_index, dep in enumerate(potential_dep_secs):
+                # Departure times from late to early, keeping labels of later ones
+                raptor.run(from_stops, dep, rounds, keep_labels=dep_index > 0)
+                station_tau = raptor.station_arrival_times()
+                arrivals = station_tau[rounds]
+
+                # Shortest travel time, departing later for equal travel times
+                improved = (arrivals < LARGE_NUMBER) & (arrivals - dep < travel_times)
+                travel_times[improved] = arrivals[improved] - dep
+                departure_times[row, improved] = dep
+                arrival_times[row, improved] = arrivals[improved]
+                n_trips[row, improved] = first_round_with_arrival(station_tau)[improved]
+
+    return ODMatrix(
+        origins=list(origin_stations),
+        destinations=[station.name for station in compiled.stations],
+        departure_times=departure_times,
+        arrival_times=arrival_times,
+        n_trips=n_trips,
+    )
+
+
+def write_od_matrix(output_file: str, matrix: ODMatrix) -> None:
+    """
+    Write matrix by extension of output file:
+    - .npz: the matrices and the names of the origins and destinations
+    - .parquet: the reachable pairs in long format, requires pyarrow or fastparquet
+    """
+    logger.info(f"Write travel time matrix to {output_file}")
+
+    suffix = Path(output_file).suffix
+    if suffix == ".npz":
+        np.savez_compressed(
+            output_file,
+            origins=np.asarray(matrix.origins, dtype=str),
+            destinations=np.asarray(matrix.destinations, dtype=str),
+            departure_times=matrix.departure_times,
+            arrival_times=matrix.arrival_times,
+            n_trips=matrix.n_trips,
+        )
+    elif suffix == ".parquet":
+        matrix.to_frame().to_parquet(output_file, index=False)
+    else:
+        raise ValueError(f"Unknown output format '{suffix}', use .npz or .parquet")
+
+
+def read_od_matrix(input_file: str) -> ODMatrix:
+    """Read matrix written as .npz"""
+    with np.load(input_file) as arrays:
+        return ODMatrix(
+            origins=arrays["origins"].tolist(),
+            destinations=arrays["destinations"].tolist(),
+            departure_times=arrays["departure_times"],
+            arrival_times=arrays["arrival_times"],
+            n_trips=arrays["n_trips"],
+        )
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    main(
+        args.input,
+        args.origins,
+        args.time,
+        args.endtime,
+        args.rounds,
+        args.backend,
+        args.compiled,
+        args.date,
+        args.overnight,
+        args.output,
+    )
@@ -11,7 +11,7 @@ from pyraptor.model.structures import Timetable, Journey, Station
 from pyraptor.model.mcraptor import (
     McRaptorAlgorithm,
     reconstruct_journeys,
-    best_legs_to_destination_station,
+    best_labels_to_destination_station,
 )
 from pyraptor.util import str2sec
 
@@ -50,6 +50,13 @@ def parse_arguments():
         default=5,
         help="Number of rounds to execute the RAPTOR algorithm",
     )
+    parser.add_argument(
+        "-dt",
+        "--date",
+        type=str,
+        default=None,
+        help="Departure date (yyyymmdd), required for timetables with multiple dates",
+    )
     arguments = parser.parse_args()
     return arguments
 
@@ -60,6 +67,7 @@ def main(
     destination_station,
     departure_time,
     rounds,
+    date=None,
 ):
     """Run RAPTOR algorithm"""
 
@@ -68,6 +76,7 @@ def main(
     logger.debug("Destination station : {}", destination_station)
     logger.debug("Departure time      : {}", departure_time)
     logger.debug("Rounds              : {}", str(rounds))
+    logger.debug("Date                : {}", date)
 
     timetable = read_timetable(input_folder)
 
@@ -83,6 +92,7 @@ def main(
         origin_station,
         dep_secs,
         rounds,
+        date=date,
     )
 
     # Output journey
@@ -97,6 +107,8 @@ def run_mcraptor(
     origin_station: str,
     dep_secs: int,
     rounds: int,
+    date: str = None,
+    return_stats: bool = False,
 ) -> Dict[Station, List[Journey]]:
     """
     Perform the McRaptor algorithm.
@@ -105,11 +117,14 @@ def run_mcraptor(
     :param origin_station: Name of origin station
     :param dep_secs: Time of departure in seconds
     :param rounds: Number of iterations to perform
+    :param date: Departure date (yyyymmdd), only trips running on date are used
+    :param return_stats: Return the QueryStats of the query as well, i.e.
+        (journeys, stats)
     """
 
     # Run Round-Based Algorithm for an origin station
     from_stops = timetable.stations.get(origin_station).stops
-    raptor = McRaptorAlgorithm(timetable)
+    raptor = McRaptorAlgorithm(timetable, date)
     bag_round_stop, actual_rounds = raptor.run(from_stops, dep_secs, rounds)
     last_round_bag = copy(bag_round_stop[rounds])
 
@@ -124,19 +139,22 @@ def run_mcraptor(
 
     journeys_to_destinations = dict()
     for destination_station_name, to_stops in destination_stops.items():
-        destination_legs = best_legs_to_destination_station(to_stops, last_round_bag)
+        destination_labels = best_labels_to_destination_station(
+            to_stops, last_round_bag
+        )
 
-        if len(destination_legs) == 0:
+        if len(destination_labels) == 0:
             logger.info("Destination unreachable with given parameters")
             continue
 
-        journeys = reconstruct_journeys(
-            from_stops, destination_legs, bag_round_stop, k=rounds
-        )
+        journeys = reconstruct_journeys(destination_labels)
         journeys_to_destinations[destination_station_name] = journeys
 
-    logger.info(f"Journey calculation time: {perf_counter() - s}")
+    raptor.stats.reconstruction_time = perf_counter() - s
+    logger.info(f"Journey calculation time: {raptor.stats.reconstruction_time}")
 
+    if return_stats:
+        return journeys_to_destinations, raptor.stats
     return journeys_to_destinations
 
 
@@ -148,4 +166,5 @@ if __name__ == "__main__":
         args.destination,
         args.time,
         args.rounds,
+        args.date,
     )
@@ -10,9 +10,10 @@ from pyraptor.dao.timetable import read_timetable
 from pyraptor.model.structures import Timetable, Journey, pareto_set
 from pyraptor.model.mcraptor import (
     McRaptorAlgorithm,
-    best_legs_to_destination_station,
+    best_labels_to_destination_station,
     reconstruct_journeys,
 )
+from pyraptor.model.stats import QueryStats
 from pyraptor.util import str2sec, sec2str
 
 
@@ -61,6 +62,13 @@ def parse_arguments():
         default=5,
         help="Number of rounds to execute the RAPTOR algorithm",
     )
+    parser.add_argument(
+        "-dt",
+        "--date",
+        type=str,
+        default=None,
+        help="Departure date (yyyymmdd), required for timetables with multiple dates",
+    )
     arguments = parser.parse_args()
 
     return arguments
@@ -73,6 +81,7 @@ def main(
     departure_start_time: str,
     departure_end_time: str,
     rounds: int,
+    date: str = None,
 ):
     """Run RAPTOR algorithm"""
 
@@ -82,6 +91,7 @@ def main(
     logger.debug("Departure start time : {}", departure_start_time)
     logger.debug("Departure end time   : {}", departure_end_time)
     logger.debug("Rounds               : {}", str(rounds))
+    logger.debug("Date                 : {}", date)
 
     timetable = read_timetable(input_folder)
 
@@ -99,6 +109,7 @@ def main(
         dep_secs_min,
         dep_secs_max,
         rounds,
+        date=date,
     )
 
     # All destinations are calculated, however, we only print one for logging purposes
@@ -113,9 +124,14 @@ def run_range_mcraptor(
     dep_secs_min: int,
     dep_secs_max: int,
     max_rounds: int,
+    date: str = None,
+    return_stats: bool = False,
 ) -> Dict[str, List[Journey]]:
     """
     Perform the McRAPTOR algorithm for a range query
+
+    With return_stats the QueryStats of all runs are returned as well, i.e.
+    (journeys, stats).
     """
 
     # Get stops for origins and destinations
@@ -125,12 +141,22 @@ def run_range_mcraptor(
     }
     destination_stops.pop(origin_station, None)
 
-    # Find all trips leaving from stops within time range
+    # Find all trips running on date leaving from stops within time range
+    day = timetable.day_index(date)
     potential_trip_stop_times = timetable.trip_stop_times.get_trip_stop_times_in_range(
         from_stops, dep_secs_min, dep_secs_max
     )
     potential_dep_secs = sorted(
-        list(set([tst.dts_dep for tst in potential_trip_stop_times])), reverse=True
+        list(
+            set(
+                [
+                    tst.dts_dep
+                    for tst in potential_trip_stop_times
+                    if tst.trip.is_active(day)
+                ]
+            )
+        ),
+        reverse=True,
     )
 
     logger.info(
@@ -145,6 +171,7 @@ def run_range_mcraptor(
 
     logger.info("Calculating journeys to all destinations")
     s = perf_counter()
+    stats = QueryStats()
 
     # Find Pareto-optimal journeys for all possible departure times
     for dep_index, dep_secs in enumerate(potential_dep_secs):
@@ -152,24 +179,25 @@ def run_range_mcraptor(
         logger.info(f"Analyzing best journey for departure time {sec2str(dep_secs)}")
 
         # Run Round-Based Algorithm
-        mcraptor = McRaptorAlgorithm(timetable)
+        mcraptor = McRaptorAlgorithm(timetable, date)
         if dep_index == 0:
             bag_round_stop, actual_rounds = mcraptor.run(from_stops, dep_secs, max_rounds)
         else:
             bag_round_stop, actual_rounds = mcraptor.run(from_stops, dep_secs, max_rounds, last_round_bag)
         last_round_bag = copy(bag_round_stop[actual_rounds])
+        stats.merge(mcraptor.stats)
 
         # Determine the best destination ID, destination is a platform
+        start = perf_counter()
         for destination_station_name, to_stops in destination_stops.items():
-            destination_legs = best_legs_to_destination_station(
+            destination_labels = best_labels_to_destination_station(
                 to_stops, last_round_bag
             )
 
-            if len(destination_legs) != 0:
-                journeys = reconstruct_journeys(
-                    from_stops, destination_legs, bag_round_stop, k=actual_rounds
-                )
+            if len(destination_labels) != 0:
+                journeys = reconstruct_journeys(destination_labels)
                 journeys_to_destinations[destination_station_name].extend(journeys)
+        stats.reconstruction_time += perf_counter() - start
 
     logger.info(f"Journey calculation time: {perf_counter() - s}")
 
@@ -181,7 +209,9 @@ def run_range_mcraptor(
                 unique_journeys.append(journey)
 
         journeys_to_destinations[destination_station_name] = unique_journeys
-        
+
+    if return_stats:
+        return journeys_to_destinations, stats
     return journeys_to_destinations
 
 
@@ -194,4 +224,5 @@ if __name__ == "__main__":
         args.starttime,
         args.endtime,
         args.rounds,
+        args.date,
     )
@@ -1,6 +1,7 @@
 """Run range query on RAPTOR algorithm"""
 import argparse
 from typing import Dict, List
+from time import perf_counter
 
 from loguru import logger
 
@@ -8,11 +9,13 @@ from pyraptor.dao.timetable import read_timetable
 from pyraptor.model.structures import Journey, Timetable
 from pyraptor.model.raptor import (
     RaptorAlgorithm,
+    BACKENDS,
     best_stop_at_target_station,
     reconstruct_journey,
     is_dominated,
 )
-from pyraptor.util import str2sec, sec2str
+from pyraptor.model.stats import QueryStats
+from pyraptor.util import str2sec, sec2str, LARGE_NUMBER
 
 
 def parse_arguments():
@@ -60,6 +63,32 @@ def parse_arguments():
         default=5,
         help="Number of rounds to execute the RAPTOR algorithm",
     )
+    parser.add_argument(
+        "-b",
+        "--backend",
+        type=str,
+        default="python",
+        choices=BACKENDS,
+        help="Backend of the RAPTOR algorithm",
+    )
+    parser.add_argument(
+        "-c",
+        "--compiled",
+        action="store_true",
+        help="Read memory-mapped compiled timetable",
+    )
+    parser.add_argument(
+        "-dt",
+        "--date",
+        type=str,
+        default=None,
+        help="Departure date (yyyymmdd), required for timetables with multiple dates",
+    )
+    parser.add_argument(
+        "--overnight",
+        action="store_true",
+        help="Continue journeys with trips of the next day",
+    )
     arguments = parser.parse_args()
 
     return arguments
@@ -72,6 +101,10 @@ def main(
     departure_start_time: str,
     departure_end_time: str,
     rounds: int,
+    backend: str = "python",
+    compiled: bool = False,
+    date: str = None,
+    overnight: bool = False,
 ):
     """Run RAPTOR algorithm"""
 
@@ -81,8 +114,12 @@ def main(
     logger.debug("Departure start time : {}", departure_start_time)
     logger.debug("Departure end time   : {}", departure_end_time)
     logger.debug("Rounds               : {}", str(rounds))
+    logger.debug("Backend              : {}", backend)
+    logger.debug("Compiled             : {}", compiled)
+    logger.debug("Date                 : {}", date)
+    logger.debug("Overnight            : {}", overnight)
 
-    timetable = read_timetable(input_folder)
+    timetable = read_timetable(input_folder, compiled)
 
     logger.info(f"Calculating network from : {origin_station}")
 
@@ -99,6 +136,9 @@ def main(
         dep_secs_min,
         dep_secs_max,
         rounds,
+        backend,
+        date=date,
+        overnight=overnight,
     )
 
     # All destinations are present in labels, so this is only for logging purposes
@@ -113,9 +153,20 @@ def run_range_raptor(
     dep_secs_min: int,
     dep_secs_max: int,
     rounds: int,
+    backend: str = "python",
+    date: str = None,
+    overnight: bool = False,
+    return_stats: bool = False,
 ) -> Dict[str, List[Journey]]:
     """
-    Perform the RAPTOR algorithm for a range query
+    Perform the RAPTOR algorithm for a range query, i.e. rRAPTOR.
+
+    Departure times are processed from late to early and the labels of later
+    departures are kept, so every run only explores the stops that can be reached
+    earlier by departing earlier.
+
+    With return_stats the QueryStats of all runs are returned as well, i.e.
+    (journeys, stats).
     """
 
     # Get stops for origins and destinations
@@ -125,13 +176,11 @@ def run_range_raptor(
     }
     destination_stops.pop(origin_station, None)
 
-    # Find all trips leaving from stops within time range
-    potential_trip_stop_times = timetable.trip_stop_times.get_trip_stop_times_in_range(
+    # Find all departure times from stops within time range
+    raptor = RaptorAlgorithm(timetable, backend, date, overnight)
+    potential_dep_secs = raptor.compiled.departures_in_range(
         from_stops, dep_secs_min, dep_secs_max
     )
-    potential_dep_secs = sorted(
-        list(set([tst.dts_dep for tst in potential_trip_stop_times])), reverse=True
-    )
 
     logger.info(
         "Potential departure times : {}".format(
@@ -145,28 +194,44 @@ def run_range_raptor(
     last_round_labels = {
         station_name: None for station_name, _ in destination_stops.items()
     }
+    last_arrival_times = {
+        station_name: LARGE_NUMBER for station_name, _ in destination_stops.items()
+    }
+    stats = QueryStats()
 
     for dep_index, dep_secs in enumerate(potential_dep_secs):
         logger.info(f"Processing {dep_index} / {len(potential_dep_secs)}")
         logger.info(f"Analyzing best journey for departure time {dep_secs}")
 
-        # Run Round-Based Algorithm
-        raptor = RaptorAlgorithm(timetable)
-        bag_round_stop = raptor.run(from_stops, dep_secs, rounds)
+        # Run Round-Based Algorithm, keeping labels of the later departure times
+        bag_round_stop = raptor.run(
+            from_stops, dep_secs, rounds, keep_labels=dep_index > 0
+        )
         best_labels = bag_round_stop[rounds]
+        stats.merge(raptor.stats)
 
         # Determine the best destination ID, destination is a platform
+        start = perf_counter()
         for destination_station_name, to_stops in destination_stops.items():
             dest_stop = best_stop_at_target_station(to_stops, best_labels)
 
             if dest_stop != 0:
-                journey = reconstruct_journey(dest_stop, best_labels)
+                # Journey is dominated if not arriving earlier than a later departure
+                arrival_time = best_labels[dest_stop].earliest_arrival_time
+                if arrival_time >= last_arrival_times[destination_station_name]:
+                    continue
+                last_arrival_times[destination_station_name] = arrival_time
+
+                journey = reconstruct_journey(dest_stop, bag_round_stop, rounds)
                 last_round_journey = last_round_labels[destination_station_name]
                 last_round_labels[destination_station_name] = journey
 
                 if not is_dominated(last_round_journey, journey):
                     journeys_to_destinations[destination_station_name].append(journey)
+        stats.reconstruction_time += perf_counter() - start
 
+    if return_stats:
+        return journeys_to_destinations, stats
     return journeys_to_destinations
 
 
@@ -179,4 +244,8 @@ if __name__ == "__main__":
         args.starttime,
         args.endtime,
         args.rounds,
+        args.backend,
+        args.compiled,
+        args.date,
+        args.overnight,
     )
@@ -1,6 +1,7 @@
 """Run query with RAPTOR algorithm"""
 import argparse
 from typing import Dict
+from time import perf_counter
 
 from loguru import logger
 
@@ -8,11 +9,15 @@ from pyraptor.dao.timetable import read_timetable
 from pyraptor.model.structures import Journey, Station, Timetable
 from pyraptor.model.raptor import (
     RaptorAlgorithm,
+    BACKENDS,
     reconstruct_journey,
     best_stop_at_target_station,
 )
+from pyraptor.model.csa import ConnectionScanAlgorithm
 from pyraptor.util import str2sec
 
+ENGINES = ("raptor", "csa")
+
 
 def parse_arguments():
     """Parse arguments"""
@@ -48,6 +53,40 @@ def parse_arguments():
         default=5,
         help="Number of rounds to execute the RAPTOR algorithm",
     )
+    parser.add_argument(
+        "-b",
+        "--backend",
+        type=str,
+        default="python",
+        choices=BACKENDS,
+        help="Backend of the RAPTOR algorithm",
+    )
+    parser.add_argument(
+        "-e",
+        "--engine",
+        type=str,
+        default="raptor",
+        choices=ENGINES,
+        help="Engine of the query, i.e. RAPTOR or the Connection Scan Algorithm",
+    )
+    parser.add_argument(
+        "-c",
+        "--compiled",
+        action="store_true",
+        help="Read memory-mapped compiled timetable",
+    )
+    parser.add_argument(
+        "-dt",
+        "--date",
+        type=str,
+        default=None,
+        help="Departure date (yyyymmdd), required for timetables with multiple dates",
+    )
+    parser.add_argument(
+        "--overnight",
+        action="store_true",
+        help="Continue journeys with trips of the next day",
+    )
     arguments = parser.parse_args()
     return arguments
 
@@ -58,6 +97,11 @@ def main(
     destination_station,
     departure_time,
     rounds,
+    backend="python",
+    compiled=False,
+    date=None,
+    overnight=False,
+    engine="raptor",
 ):
     """Run RAPTOR algorithm"""
 
@@ -66,8 +110,13 @@ def main(
     logger.debug("Destination station : {}", destination_station)
     logger.debug("Departure time      : {}", departure_time)
     logger.debug("Rounds              : {}", str(rounds))
+    logger.debug("Backend             : {}", backend)
+    logger.debug("Compiled            : {}", compiled)
+    logger.debug("Date                : {}", date)
+    logger.debug("Overnight           : {}", overnight)
+    logger.debug("Engine              : {}", engine)
 
-    timetable = read_timetable(input_folder)
+    timetable = read_timetable(input_folder, compiled)
 
     logger.info(f"Calculating network from: {origin_station}")
 
@@ -81,6 +130,11 @@ def main(
         origin_station,
         dep_secs,
         rounds,
+        backend,
+        destination_station,
+        date=date,
+        overnight=overnight,
+        engine=engine,
     )
 
     # Print journey to destination
@@ -92,6 +146,12 @@ def run_raptor(
     origin_station: str,
     dep_secs: int,
     rounds: int,
+    backend: str = "python",
+    destination_station: str = None,
+    date: str = None,
+    overnight: bool = False,
+    return_stats: bool = False,
+    engine: str = "raptor",
 ) -> Dict[Station, Journey]:
     """
     Run the Raptor algorithm.
@@ -100,7 +160,19 @@ def run_raptor(
     :param origin_station: Name of origin station
     :param dep_secs: Time of departure in seconds
     :param rounds: Number of iterations to perform
+    :param backend: Backend of the RAPTOR algorithm, i.e. python or numpy
+    :param destination_station: Name of destination station, if given only the
+        journey to this station is determined using target pruning
+    :param date: Departure date (yyyymmdd), only trips running on date are used
+    :param overnight: Continue journeys with trips of the next day
+    :param return_stats: Return the QueryStats of the query as well, i.e.
+        (journeys, stats)
+    :param engine: Engine of the query, i.e. raptor or csa. The Connection Scan
+        Algorithm does not limit the number of trips, so rounds and backend are
+        not used.
     """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine '{engine}', choose from {ENGINES}")
 
     # Get stops for origin and all destinations
     from_stops = timetable.stations.get(origin_station).stops
@@ -109,19 +181,34 @@ def run_raptor(
     }
     destination_stops.pop(origin_station, None)
 
-    # Run Round-Based Algorithm
-    raptor = RaptorAlgorithm(timetable)
-    bag_round_stop = raptor.run(from_stops, dep_secs, rounds)
+    # Only the destination station is a target when given
+    to_stops = None
+    if destination_station is not None:
+        to_stops = timetable.stations.get_stops(destination_station)
+        destination_stops = {destination_station: to_stops}
+
+    # Run Round-Based Algorithm, or scan connections
+    if engine == "csa":
+        algorithm = ConnectionScanAlgorithm(timetable, date, overnight)
+        bag_round_stop = {0: algorithm.run(from_stops, dep_secs, to_stops=to_stops)}
+        rounds = 0
+    else:
+        algorithm = RaptorAlgorithm(timetable, backend, date, overnight)
+        bag_round_stop = algorithm.run(from_stops, dep_secs, rounds, to_stops=to_stops)
     best_labels = bag_round_stop[rounds]
 
     # Determine the best journey to all possible destination stations
+    start = perf_counter()
     journey_to_destinations = dict()
     for destination_station_name, to_stops in destination_stops.items():
         dest_stop = best_stop_at_target_station(to_stops, best_labels)
         if dest_stop != 0:
-            journey = reconstruct_journey(dest_stop, best_labels)
+            journey = reconstruct_journey(dest_stop, bag_round_stop, rounds)
             journey_to_destinations[destination_station_name] = journey
+    algorithm.stats.reconstruction_time = perf_counter() - start
 
+    if return_stats:
+        return journey_to_destinations, algorithm.stats
     return journey_to_destinations
 
 
@@ -133,4 +220,9 @@ if __name__ == "__main__":
         args.destination,
         args.time,
         args.rounds,
+        args.backend,
+        args.compiled,
+        args.date,
+        args.overnight,
+        args.engine,
     )
@@ -0,0 +1,344 @@
+"""Serve queries over HTTP with the timetable kept in memory"""
+import json
+import asyncio
+import argparse
+from http import HTTPStatus
+from typing import Dict, List
+from urllib.parse import urlsplit, parse_qsl
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from loguru import logger
+
+from pyraptor.dao.timetable import read_timetable
+from pyraptor.model.structures import Journey
+from pyraptor.query_raptor import run_raptor
+from pyraptor.query_range_raptor import run_range_raptor
+from pyraptor.query_mcraptor import run_mcraptor
+from pyraptor.query_range_mcraptor import run_range_mcraptor
+from pyraptor.od_matrix import od_matrix
+from pyraptor.isochrone import run_isochrone
+from pyraptor.util import str2sec
+
+QUERIES = ["raptor", "range_raptor", "mcraptor", "range_mcraptor", "od_matrix", "isochrone"]
+REQUIRED_PARAMETERS = dict(
+    raptor=["origin", "time"],
+    range_raptor=["origin", "start_time", "end_time"],
+    mcraptor=["origin", "time"],
+    range_mcraptor=["origin", "start_time", "end_time"],
+    od_matrix=["origins", "time"],
+    isochrone=["origin", "time"],
+)
+
+_timetable = None  # Timetable of worker process
+
+
+def parse_arguments():
+    """Parse arguments"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-i",
+        "--input",
+        type=str,
+        default="data/output",
+        help="Input directory",
+    )
+    parser.add_argument(
+        "--host", type=str, default="127.0.0.1", help="Host to listen on"
+    )
+    parser.add_argument("-p", "--port", type=int, default=8000, help="Port to listen on")
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=4,
+        help="Number of worker processes running queries",
+    )
+    parser.add_argument(
+        "-q",
+        "--queue",
+        type=int,
+        default=16,
+        help="Number of queries waiting for a worker before queries are refused",
+    )
+    parser.add_argument(
+        "-c",
+        "--compiled",
+        action="store_true",
+        help="Read memory-mapped compiled timetable, only supports RAPTOR queries",
+    )
+    arguments = parser.parse_args()
+    return arguments
+
+
+def main(input_folder, host, port, workers, queue_size, compiled=False):
+    """Run query server"""
+
+    logger.debug("Input directory     : {}", input_folder)
+    logger.debug("Host                : {}", host)
+    logger.debug("Port                : {}", port)
+    logger.debug("Workers             : {}", workers)
+    logger.debug("Queue size          : {}", queue_size)
+    logger.debug("Compiled            : {}", compiled)
+
+    async def serve():
+        with QueryServer(input_folder, workers, queue_size, compiled) as server:
+            await server.start(host, port)
+            logger.info(f"Serving queries on http://{host}:{server.port}")
+            await server.serve_forever()
+
+    asyncio.run(serve())
+
+
+class QueryServer:
+    """
+    HTTP server for RAPTOR, McRAPTOR and range queries.
+
+    Queries are GET requests on /raptor, /range_raptor, /mcraptor and
+    /range_mcraptor with the arguments as query parameters, e.g.
+    `/raptor?origin=Breda&time=08:30:00&destination=Amsterdam Centraal`.
+    The response maps the destination stations to their journeys as lists of legs.
+    /od_matrix gives the travel time matrix of comma-separated origins, e.g.
+    `/od_matrix?origins=Breda,Utrecht Centraal&time=08:30:00`.
+    /isochrone gives the arrival times at all stations and optionally the
+    stations per travel time bucket in minutes, e.g.
+    `/isochrone?origin=Breda&time=08:30:00&thresholds=15,30,60`.
+
+    Queries run in a pool of worker processes that each read the timetable once.
+    At most `queue_size` queries wait for a worker, further queries are refused
+    with 503 Service Unavailable.
+    """
+
+    def __init__(
+        self, input_folder: str, workers: int = 4, queue_size: int = 16, compiled=False
+    ):
+        self.pool = ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(input_folder, compiled),
+        )
+        self.slots = asyncio.Semaphore(workers + queue_size)
+        self.server = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def port(self) -> int:
+        """Port the server listens on"""
+        return self.server.sockets[0].getsockname()[1]
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8000) -> None:
+        """
+        Start listening, port 0 picks a free port.
+
+        The workers are started and have read the timetable before listening, so
+        they do not inherit connections of the server.
+        """
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.pool, _worker_ready)
+        self.server = await asyncio.start_server(self.handle, host, port)
+
+    async def serve_forever(self) -> None:
+        """Serve until cancelled"""
+        async with self.server:
+            await self.server.serve_forever()
+
+    def close(self) -> None:
+        """Stop listening and shut down workers"""
+        if self.server is not None:
+            self.server.close()
+        self.pool.shutdown()
+
+    async def handle(self, reader, writer) -> None:
+        """Handle HTTP request"""
+        try:
+            status, body = await self.respond(reader)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+            return
+
+        content = json.dumps(body, default=_to_builtin).encode("utf-8")
+        writer.write(
+            (
+                f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                "Content-Type: application/json\r\n"
+                f"Content-Length: {len(content)}\r\n"
+                "Connection: close\r\n\r\n"
+            ).encode("latin-1")
+            + content
+        )
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def respond(self, reader):
+        """Status and body of response to request"""
+        request_line = (await reader.readline()).decode("latin-1").split()
+        while (await reader.readuntil(b"\n")).strip():
+            pass  # Headers are not used
+
+        if len(request_line) != 3:
+            return HTTPStatus.BAD_REQUEST, dict(error="Malformed request")
+        method, target, _ = request_line
+        if method != "GET":
+            return HTTPStatus.METHOD_NOT_ALLOWED, dict(error="Only GET is supported")
+
+        url = urlsplit(target)
+        query = url.path.strip("/")
+        if query not in QUERIES:
+            return HTTPStatus.NOT_FOUND, dict(error=f"Unknown query, use one of {QUERIES}")
+
+        if self.slots.locked():
+            return HTTPStatus.SERVICE_UNAVAILABLE, dict(error="Too many queries")
+
+        params = dict(parse_qsl(url.query))
+        async with self.slots:
+            loop = asyncio.get_running_loop()
+            try:
+                result = await loop.run_in_executor(self.pool, run_query, query, params)
+            except ValueError as ex:
+                return HTTPStatus.BAD_REQUEST, dict(error=str(ex))
+            except Exception as ex:  # pylint: disable=broad-except
+                logger.exception(ex)
+                return HTTPStatus.INTERNAL_SERVER_ERROR, dict(error="Query failed")
+
+        return HTTPStatus.OK, result
+
+
+def _init_worker(input_folder: str, compiled: bool) -> None:
+    """Read timetable once in worker process"""
+    global _timetable  # pylint: disable=global-statement
+    _timetable = read_timetable(input_folder, compiled)
+
+
+def _worker_ready() -> bool:
+    """Whether worker has read the timetable"""
+    return _timetable is not None
+
+
+def run_query(query: str, params: Dict[str, str]) -> Dict[str, List[List[Dict]]]:
+    """
+    Run query on timetable of worker process and return journeys per destination
+    station as lists of legs. Only the journeys to destination are returned if given.
+    """
+    missing = [name for name in REQUIRED_PARAMETERS[query] if name not in params]
+    if missing:
+        raise ValueError(f"Missing parameter {', '.join(map(repr, missing))}")
+
+    timetable = _timetable
+    if timetable.routes is None and query.endswith("mcraptor"):
+        raise ValueError("McRAPTOR queries are not supported on compiled timetable")
+
+    rounds = int(params.get("rounds", 5))
+    date = params.get("date")
+    overnight = params.get("overnight", "false").lower() in ("1", "true")
+    backend = params.get("backend", "python")
+
+    if query == "od_matrix":
+        end_time = params.get("end_time")
+        return od_matrix(
+            timetable,
+            params["origins"].split(","),
+            str2sec(params["time"]),
+            rounds,
+            backend,
+            date=date,
+            overnight=overnight,
+            dep_secs_max=str2sec(end_time) if end_time is not None else None,
+        ).to_dict()
+
+    origin = params["origin"]
+    destination = params.get("destination")
+    for station in [origin, destination]:
+        if station is not None and timetable.stations.get(station) is None:
+            raise ValueError(f"Unknown station '{station}'")
+
+    if query == "isochrone":
+        thresholds = params.get("thresholds")
+        return run_isochrone(
+            timetable,
+            origin,
+            str2sec(params["time"]),
+            rounds,
+            backend,
+            date=date,
+            overnight=overnight,
+        ).to_dict(
+            [60 * int(t) for t in thresholds.split(",")]
+            if thresholds is not None
+            else None
+        )
+
+    if query == "raptor":
+        journeys = run_raptor(
+            timetable,
+            origin,
+            str2sec(params["time"]),
+            rounds,
+            backend,
+            destination,
+            date=date,
+            overnight=overnight,
+            engine=params.get("engine", "raptor"),
+        )
+    elif query == "range_raptor":
+        journeys = run_range_raptor(
+            timetable,
+            origin,
+            str2sec(params["start_time"]),
+            str2sec(params["end_time"]),
+            rounds,
+            backend,
+            date=date,
+            overnight=overnight,
+        )
+    elif query == "mcraptor":
+        journeys = run_mcraptor(
+            timetable, origin, str2sec(params["time"]), rounds, date=date
+        )
+    else:
+        journeys = run_range_mcraptor(
+            timetable,
+            origin,
+            str2sec(params["start_time"]),
+            str2sec(params["end_time"]),
+            rounds,
+            date=date,
+        )
+
+    if destination is not None:
+        journeys = {destination: journeys.get(destination, [])}
+
+    return {
+        station: [journey.to_list() for journey in _as_list(station_journeys)]
+        for station, station_journeys in journeys.items()
+    }
+
+
+def _as_list(journeys) -> List[Journey]:
+    """RAPTOR gives a single journey per destination, the other queries a list"""
+    return [journeys] if isinstance(journeys, Journey) else journeys
+
+
+def _to_builtin(value):
+    """Convert numpy scalars in response to builtin types"""
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Cannot write {type(value)} to response")
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    main(
+        args.input,
+        args.host,
+        args.port,
+        args.workers,
+        args.queue,
+        args.compiled,
+    )
@@ -1,10 +1,12 @@
 """Utility functions"""
 import os
 import numpy as np
+import pandas as pd
 
 
 TRANSFER_COST = 2 * 60  # Default transfer time is 2 minutes
 LARGE_NUMBER = 2147483647  # Earliest arrival time at start of algorithm
+SECONDS_PER_DAY = 24 * 60 * 60  # Time offset of trips on the next day
 TRANSFER_TRIP = None
 
 
@@ -28,6 +30,46 @@ def str2sec(time_str: str) -> int:
     return int(hour) * 3600 + int(minutes) * 60
 
 
+def str2sec_series(time_series: pd.Series) -> pd.Series:
+    """
+    Convert hh:mm:ss or hh:mm to seconds since midnight for all values in series,
+    using vectorised string operations instead of str2sec per value.
+    Hours past 24 are allowed, missing values stay missing.
+    :param time_series: Series with strings in format hh:mm:ss
+    """
+    missing = time_series.isna()
+    if missing.all():
+        return pd.Series(np.nan, index=time_series.index)
+
+    split_time = (
+        time_series[~missing].astype(str).str.strip().str.split(":", expand=True)
+    )
+    if split_time.shape[1] not in (2, 3):
+        raise ValueError("Time should be in format hh:mm:ss or hh:mm")
+
+    hours, minutes = split_time[0].astype(np.int64), split_time[1].astype(np.int64)
+    seconds = hours * 3600 + minutes * 60
+    if split_time.shape[1] == 3:
+        # Has seconds
+        seconds += split_time[2].fillna("0").astype(np.int64)
+
+    if missing.any():
+        return seconds.reindex(time_series.index)
+    return seconds
+
+
+def sec2str_series(seconds: pd.Series) -> pd.Series:
+    """
+    Convert seconds since midnight to hh:mm:ss for all values in series,
+    the vectorised inverse of str2sec_series. Hours past 24 are kept.
+    :param seconds: Series with integer seconds
+    """
+    seconds = seconds.astype(np.int64)
+    hours = (seconds // 3600).astype(str).str.zfill(2)
+    minutes = (seconds % 3600 // 60).astype(str).str.zfill(2)
+    return hours + ":" + minutes + ":" + (seconds % 60).astype(str).str.zfill(2)
+
+
 def sec2str(scnds: int, show_sec: bool = False) -> str:
     """
     Convert hh:mm:ss to seconds since midnight
@@ -18,6 +18,18 @@ def default_timetable() -> Timetable:
     return timetable_
 
 
+@pytest.fixture(scope="session")
+def multi_day_timetable() -> Timetable:
+    """Default timetable for two dates, where the first trips only run on the second date"""
+    df = get_default_data()
+    stops, stop_times, trips = to_stops_and_trips(df)
+    timetable_ = to_timetable(stops, stop_times, trips)
+    timetable_.service_dates = ["20211201", "20211202"]
+    for trip in timetable_.trips:
+        trip.service_days = 0b10 if trip.hint % 100 < 10 else 0b11
+    return timetable_
+
+
 @pytest.fixture(scope="session")
 def timetable_with_transfers_and_fares() -> Timetable:
     """Timetable with fares"""
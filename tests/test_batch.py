@@ -0,0 +1,52 @@
+"""Test batch of RAPTOR queries"""
+import pickle
+from multiprocessing.shared_memory import SharedMemory
+
+import pytest
+
+from pyraptor.batch import SharedTimetable, BatchQueries, run_batch
+from pyraptor.gtfs.generator import generate_timetable
+from pyraptor.query_raptor import run_raptor
+
+
+def test_shared_timetable(default_timetable):
+    """Test timetable attached to shared memory gives same journeys"""
+    with SharedTimetable(default_timetable) as shared:
+        attached = pickle.loads(pickle.dumps(shared))
+        timetable = attached.attach()
+
+        journeys = run_raptor(timetable, "A", 0, 4)
+        expected = run_raptor(default_timetable, "A", 0, 4)
+        assert {s: j.to_list() for s, j in journeys.items()} == {
+            s: j.to_list() for s, j in expected.items()
+        }
+        with pytest.raises(ValueError):
+            timetable.compiled.dep[0] = 0
+        del timetable, journeys
+        attached.memory.close()
+
+    with pytest.raises(FileNotFoundError):
+        SharedMemory(name=shared.memory.name)
+
+
+def test_run_batch():
+    """Test batch gives the arrival times and journeys of single queries"""
+    timetable = generate_timetable(stations=100, routes=20, stops_per_route=8)
+    stations = [station.name for station in timetable.stations][:6]
+    queries = [(station, 7 * 3600 + 600 * i) for i, station in enumerate(stations)]
+
+    with BatchQueries(timetable, workers=2) as batch:
+        arrival_times = batch.run(queries, 4, backend="numpy")
+        journeys = batch.run(queries, 4, journeys=True)
+        with pytest.raises(ValueError):
+            batch.run([("Unknown", 0)], 4)
+
+    assert len(arrival_times) == len(journeys) == len(queries)
+    for (origin, dep_secs), query_arrivals, query_journeys in zip(
+        queries, arrival_times, journeys
+    ):
+        expected = run_raptor(timetable, origin, dep_secs, 4)
+        assert query_arrivals == {s: j.arr() for s, j in expected.items()}
+        assert query_journeys == {s: j.to_list() for s, j in expected.items()}
+
+    assert run_batch(timetable, queries[:2], 4, workers=1) == arrival_times[:2]
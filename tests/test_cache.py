@@ -0,0 +1,69 @@
+"""Test cache of query results"""
+from pyraptor.cache import QueryCache
+from pyraptor.dao import write_timetable
+from pyraptor.model.structures import Timetable
+from pyraptor.query_raptor import run_raptor
+from pyraptor.query_mcraptor import run_mcraptor
+
+
+def test_query_cache(default_timetable: Timetable, tmp_path):
+    """Test cached results per departure bucket, eviction and disk tier"""
+    cache = QueryCache(max_size=2, folder=tmp_path / "cache", bucket_secs=60)
+
+    journeys = cache.query(run_raptor, default_timetable, "A", 1, 4)
+    assert journeys["F"].to_list() == run_raptor(default_timetable, "A", 60, 4)["F"].to_list()
+    assert cache.query(run_raptor, default_timetable, "A", 59, 4) is journeys
+    assert cache.hits == 1 and cache.misses == 1
+
+    cache.query(run_raptor, default_timetable, "A", 61, 4)
+    cache.query(run_mcraptor, default_timetable, "A", 1, 4)
+    assert len(cache) == 2, "least recently used result should be evicted"
+
+    journeys_from_disk = cache.query(run_raptor, default_timetable, "A", 1, 4)
+    assert journeys_from_disk is not journeys, "result should be read from disk"
+    assert journeys_from_disk["F"].to_list() == journeys["F"].to_list()
+    assert cache.hits == 2
+
+
+def test_query_cache_invalidated_by_write(default_timetable: Timetable, tmp_path):
+    """Test results of earlier timetable version are not used"""
+    cache = QueryCache()
+    write_timetable(tmp_path, default_timetable)
+
+    journeys = cache.query(run_raptor, default_timetable, "A", 0, 4)
+    assert cache.query(run_raptor, default_timetable, "A", 0, 4) is journeys
+
+    write_timetable(tmp_path, default_timetable)
+    assert cache.query(run_raptor, default_timetable, "A", 0, 4) is not journeys
+    assert cache.misses == 2
+
+
+def test_query_cache_prunes_disk(default_timetable: Timetable, tmp_path):
+    """Test results on disk of earlier timetable versions are removed"""
+    folder = tmp_path / "cache"
+    cache = QueryCache(folder=folder)
+    write_timetable(tmp_path / "timetable", default_timetable)
+
+    cache.query(run_raptor, default_timetable, "A", 0, 4)
+    cache.query(run_raptor, default_timetable, "A", 60, 4)
+    assert [path.name for path in folder.iterdir()] == [default_timetable.version]
+
+    write_timetable(tmp_path / "timetable", default_timetable)
+    cache.query(run_raptor, default_timetable, "A", 0, 4)
+    assert [path.name for path in folder.iterdir()] == [default_timetable.version]
+    assert len(list(folder.glob("*/*.pcl"))) == 1
+
+
+def test_query_cache_departure_in_bucket(default_timetable: Timetable):
+    """Test departure inside the bucket is not missed by queries before it"""
+    cache = QueryCache(bucket_secs=300)
+
+    for dep_secs in [1, 100, 101, 299, 3500]:
+        journeys = cache.query(run_raptor, default_timetable, "A", dep_secs, 4)
+        expected = run_raptor(default_timetable, "A", dep_secs, 4)
+        assert journeys["F"].to_list() == expected["F"].to_list()
+
+    assert cache.query(run_raptor, default_timetable, "A", 50, 4) is cache.query(
+        run_raptor, default_timetable, "A", 1, 4
+    ), "departure times before the first departure share the result"
+    assert cache.misses == 3
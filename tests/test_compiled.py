@@ -0,0 +1,26 @@
+"""Test compiled timetable"""
+from pyraptor.model.compiled import compile_timetable
+from pyraptor.model.structures import Timetable
+
+
+def test_compile_timetable(default_timetable: Timetable):
+    """Test compiling timetable to arrays"""
+    compiled = compile_timetable(default_timetable)
+
+    assert compile_timetable(default_timetable) is compiled, "should be cached"
+    assert compiled.n_stops == len(default_timetable.stops)
+    assert compiled.n_routes == len(default_timetable.routes)
+    assert compiled.n_trips == len(default_timetable.trips)
+    assert len(compiled.dep) == len(default_timetable.trip_stop_times)
+
+    for route_index, route in enumerate(default_timetable.routes):
+        stops = [compiled.stops[s] for s in compiled.stops_of_route(route_index)]
+        assert stops == route.stops, "stops should be in order of travel"
+
+        departures = compiled.route_departures(route_index)
+        assert departures.shape == (len(route.trips), len(route.stops))
+        assert (departures[:, 0] == sorted(departures[:, 0])).all()
+
+        for position, stop in enumerate(stops):
+            routes, positions = compiled.routes_of_stop(compiled.stop_index[stop])
+            assert (route_index, position) in zip(routes, positions)
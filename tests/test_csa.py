@@ -0,0 +1,45 @@
+"""Test Connection Scan Algorithm"""
+import numpy as np
+
+from pyraptor.gtfs.generator import generate_timetable
+from pyraptor.model.raptor import RaptorAlgorithm
+from pyraptor.model.csa import ConnectionScanAlgorithm, compile_connections
+from pyraptor.model.compiled import compile_timetable
+
+
+def test_compile_connections(default_timetable):
+    """Test connections are sorted by departure time and connect trip stop times"""
+    compiled = compile_timetable(default_timetable)
+    connections = compile_connections(compiled)
+    assert compile_connections(compiled) is connections, "should be cached"
+
+    n_connections = sum(len(trip.stop_times) - 1 for trip in default_timetable.trips)
+    assert len(connections) == n_connections
+    assert np.all(np.diff(connections.dep) >= 0)
+    assert np.all(connections.arr >= connections.dep)
+
+    for from_stop, to_stop, dep, arr, trip in connections.iter_from(0):
+        stop_times = compiled.trips[trip].stop_times
+        position = [tst.stop for tst in stop_times].index(compiled.stops[from_stop])
+        assert stop_times[position].dts_dep == dep
+        assert stop_times[position + 1].stop == compiled.stops[to_stop]
+        assert stop_times[position + 1].dts_arr == arr
+
+
+def test_connection_scan_algorithm():
+    """Test arrival times equal RAPTOR with enough rounds"""
+    timetable = generate_timetable(stations=100, routes=20, stops_per_route=8)
+    csa = ConnectionScanAlgorithm(timetable)
+    raptor = RaptorAlgorithm(timetable)
+
+    for station in list(timetable.stations)[:10]:
+        csa.run(station.stops, 7 * 3600)
+        raptor.run(station.stops, 7 * 3600, 20)
+        assert csa.tau == raptor.tau[20]
+
+        # Early termination keeps the earliest arrival time at the target
+        to_stops = list(timetable.stations)[-1].stops
+        labels = csa.run(station.stops, 7 * 3600, to_stops=to_stops)
+        assert min(labels[stop].earliest_arrival_time for stop in to_stops) == min(
+            raptor.tau[20][raptor.compiled.stop_index[stop]] for stop in to_stops
+        )
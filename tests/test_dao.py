@@ -0,0 +1,54 @@
+"""Test data access object for timetable"""
+import numpy as np
+
+from pyraptor.dao import read_timetable, write_timetable
+from pyraptor.model.structures import Timetable
+from pyraptor.model.compiled import compile_timetable
+from pyraptor.query_raptor import run_raptor
+from pyraptor.query_range_raptor import run_range_raptor
+
+
+def test_write_timetable(default_timetable: Timetable, tmp_path):
+    """Test pickled timetable does not contain the compiled timetable"""
+    compile_timetable(default_timetable)
+    write_timetable(tmp_path, default_timetable)
+    timetable = read_timetable(tmp_path)
+
+    assert default_timetable.compiled is not None, "cache should be kept"
+    assert timetable.compiled is None
+    assert timetable.version == default_timetable.version
+    assert run_raptor(timetable, "A", 0, 4).keys() == run_raptor(
+        default_timetable, "A", 0, 4
+    ).keys()
+
+
+def test_compiled_timetable(default_timetable: Timetable, tmp_path):
+    """Test writing and reading memory-mapped compiled timetable"""
+    write_timetable(tmp_path, default_timetable, compiled=True)
+    timetable = read_timetable(tmp_path, compiled=True)
+
+    assert isinstance(timetable.compiled.dep, np.memmap), "should be memory-mapped"
+    assert [s.id for s in timetable.stops] == [s.id for s in default_timetable.stops]
+    assert len(timetable.trips) == len(default_timetable.trips)
+
+    expected = run_raptor(default_timetable, "A", 0, 4)
+    journeys = run_raptor(timetable, "A", 0, 4)
+    assert expected.keys() == journeys.keys()
+    for station, journey in journeys.items():
+        assert journey.to_list() == expected[station].to_list()
+
+    expected = run_range_raptor(default_timetable, "A", 60, 4000, 4)
+    journeys = run_range_raptor(timetable, "A", 60, 4000, 4)
+    assert [j.to_list() for j in journeys["F"]] == [j.to_list() for j in expected["F"]]
+
+
+def test_compiled_timetable_dates(multi_day_timetable: Timetable, tmp_path):
+    """Test service dates of memory-mapped compiled timetable"""
+    write_timetable(tmp_path, multi_day_timetable, compiled=True)
+    timetable = read_timetable(tmp_path, compiled=True)
+
+    assert timetable.service_dates == multi_day_timetable.service_dates
+    for date in timetable.service_dates:
+        expected = run_raptor(multi_day_timetable, "A", 0, 4, date=date)
+        journeys = run_raptor(timetable, "A", 0, 4, date=date)
+        assert journeys["F"].to_list() == expected["F"].to_list()
@@ -0,0 +1,75 @@
+"""Test parsing timetable from GTFS files"""
+from pyraptor.gtfs.generator import (
+    generate_gtfs,
+    generate_timetable,
+    to_gtfs_timetable,
+    write_gtfs,
+)
+from pyraptor.gtfs.timetable import (
+    read_stop_times,
+    read_gtfs_timetable,
+    gtfs_to_pyraptor_timetable,
+)
+
+
+def test_read_stop_times(tmp_path):
+    """Test reading stop times of trips in chunks"""
+    (tmp_path / "stop_times.txt").write_text(
+        "trip_id,stop_sequence,stop_id,arrival_time,departure_time,pickup_type\n"
+        "1,1,100,08:00:00,08:00:00,0\n"
+        "2,1,100,08:10:00,08:10:00,0\n"
+        "1,2,200,08:30:00,08:31:00,0\n"
+        "3,1,100,25:00:00,25:00:00,0\n"
+        "2,2,200,08:40:00,08:41:00,0\n"
+    )
+
+    stop_times = read_stop_times(tmp_path, ["1", "3"], chunksize=2)
+
+    assert list(stop_times.columns) == [
+        "trip_id",
+        "stop_sequence",
+        "stop_id",
+        "arrival_time",
+        "departure_time",
+    ]
+    assert stop_times.trip_id.tolist() == ["1", "1", "3"]
+    assert stop_times.stop_id.tolist() == ["100", "200", "100"]
+    assert stop_times.arrival_time.tolist() == [28800, 30600, 90000]
+    assert stop_times.departure_time.tolist() == [28800, 30660, 90000]
+
+
+def test_generate_timetable(tmp_path):
+    """Test synthetic timetable is deterministic and equals reading its GTFS files"""
+    kwargs = dict(stations=25, routes=6, stops_per_route=5, trips_per_route=4, days=2)
+
+    timetable = generate_timetable(**kwargs)
+    assert len(timetable.trips) == 6 * 2 * 4, "routes should run in both directions"
+    assert timetable.service_dates == ["20211201", "20211202"]
+    assert all(route.fifo for route in timetable.routes)
+
+    write_gtfs(tmp_path, generate_gtfs(**kwargs))
+    gtfs_timetable = read_gtfs_timetable(tmp_path, "20211201", ["SYN"], days=2)
+    expected = gtfs_to_pyraptor_timetable(gtfs_timetable)
+
+    def stop_times(timetable_):
+        return [(st.stop.id, st.dts_arr, st.dts_dep) for st in timetable_.trip_stop_times]
+
+    assert [s.id for s in timetable.stops] == [s.id for s in expected.stops]
+    assert [t.hint for t in timetable.trips] == [t.hint for t in expected.trips]
+    assert stop_times(timetable) == stop_times(expected)
+    assert stop_times(timetable) == stop_times(generate_timetable(**kwargs))
+
+
+def test_gtfs_to_pyraptor_timetable_without_service_days():
+    """Test trips without service days run on every date"""
+    gtfs_timetable = to_gtfs_timetable(
+        generate_gtfs(stations=25, routes=6, stops_per_route=5, trips_per_route=4)
+    )
+    first_trip = gtfs_timetable.trips.trip_id.iloc[0]
+    del gtfs_timetable.service_days[first_trip]
+    timetable = gtfs_to_pyraptor_timetable(gtfs_timetable)
+    assert next(iter(timetable.trips)).service_days is None
+
+    gtfs_timetable.service_days = None
+    timetable = gtfs_to_pyraptor_timetable(gtfs_timetable)
+    assert all(trip.service_days is None for trip in timetable.trips)
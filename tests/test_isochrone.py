@@ -0,0 +1,76 @@
+"""Test isochrone query"""
+import numpy as np
+import pytest
+
+from pyraptor import isochrone
+from pyraptor.gtfs.generator import generate_timetable
+from pyraptor.model.raptor import BACKENDS
+from pyraptor.model.multi_raptor import MultiRaptorAlgorithm
+from pyraptor.query_raptor import run_raptor
+from pyraptor.util import LARGE_NUMBER
+
+
+def test_has_main():
+    """Has main"""
+    assert isochrone.main
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_run_isochrone(backend: str):
+    """Test isochrone has the arrival times of the journeys of RAPTOR"""
+    timetable = generate_timetable(stations=100, routes=20, stops_per_route=8)
+    origin = next(iter(timetable.stations)).name
+    dep_secs = 7 * 3600
+
+    result = isochrone.run_isochrone(timetable, origin, dep_secs, 4, backend)
+    assert result.round_arrival_times.shape == (5, len(result.stations))
+    assert np.all(np.diff(result.round_arrival_times, axis=0) <= 0)
+
+    journeys = run_raptor(timetable, origin, dep_secs, 4)
+    for station, arrival_time, n_trips in zip(
+        result.stations, result.arrival_times, result.n_trips
+    ):
+        if station == origin:
+            assert arrival_time == dep_secs
+            assert n_trips == 0
+        elif station in journeys:
+            assert arrival_time == journeys[station].arr()
+            assert n_trips >= 1
+        else:
+            assert arrival_time == LARGE_NUMBER
+            assert n_trips == -1
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_run_isochrone_rounds(backend: str):
+    """Test every round has the arrival times with at most k trips of multi RAPTOR"""
+    timetable = generate_timetable(stations=200, routes=40, stops_per_route=8)
+    multi = MultiRaptorAlgorithm(timetable)
+    rounds = 4
+
+    for station in list(timetable.stations)[:10]:
+        result = isochrone.run_isochrone(
+            timetable, station.name, 7 * 3600, rounds, backend
+        )
+        multi.run([station.stops], 7 * 3600, rounds)
+        np.testing.assert_array_equal(
+            result.round_arrival_times, multi.station_arrival_times()[:, 0]
+        )
+
+
+def test_run_isochrone_unknown_station(default_timetable):
+    """Test unknown origin station"""
+    with pytest.raises(ValueError, match="Unknown station"):
+        isochrone.run_isochrone(default_timetable, "Unknown", 0, 4)
+
+
+def test_bucket_stations():
+    """Test stations are bucketed by travel time up to and including threshold"""
+    stations = ["A", "B", "C", "D", "E"]
+    travel_times = np.array([0, 600, 900, 901, LARGE_NUMBER])
+
+    buckets = isochrone.bucket_stations(stations, travel_times, [600, 1800])
+    assert buckets == {600: ["A", "B"], 1800: ["C", "D"]}
+
+    with pytest.raises(ValueError, match="not ascending"):
+        isochrone.bucket_stations(stations, travel_times, [1800, 600])
@@ -0,0 +1,89 @@
+"""Test RAPTOR for many origins at once"""
+import numpy as np
+import pytest
+
+from pyraptor.gtfs.generator import generate_timetable
+from pyraptor.model.structures import Timetable
+from pyraptor.model.raptor import RaptorAlgorithm
+from pyraptor.model.multi_raptor import MultiRaptorAlgorithm
+from pyraptor.util import LARGE_NUMBER
+
+
+@pytest.fixture(name="timetable")
+def fixture_timetable():
+    """Generated timetable"""
+    return generate_timetable(stations=100, routes=20, stops_per_route=8)
+
+
+def test_multi_raptor(timetable: Timetable):
+    """Test arrival times of all origins equal RAPTOR per origin"""
+    stations = list(timetable.stations)[:10]
+    dep_secs = 7 * 3600
+    rounds = 20
+
+    multi = MultiRaptorAlgorithm(timetable)
+    tau = multi.run([station.stops for station in stations], dep_secs, rounds)
+    assert tau.shape == (rounds + 1, len(stations), multi.compiled.n_stops)
+    assert np.all(np.diff(tau, axis=0) <= 0), "rounds should not get later"
+    assert multi.stats.routes > 0
+
+    raptor = RaptorAlgorithm(timetable, "numpy")
+    for origin, station in enumerate(stations):
+        raptor.run(station.stops, dep_secs, rounds)
+        np.testing.assert_array_equal(raptor.tau, tau[:, origin])
+
+
+def test_multi_raptor_origins(timetable: Timetable):
+    """Test every origin is routed independently, with its own departure time"""
+    stations = list(timetable.stations)[:5]
+    dep_secs = [7 * 3600 + 600 * i for i in range(len(stations))]
+
+    multi = MultiRaptorAlgorithm(timetable)
+    tau = multi.run([station.stops for station in stations], dep_secs, 4).copy()
+    station_tau = multi.station_arrival_times()
+
+    for origin, station in enumerate(stations):
+        single = multi.run([station.stops], dep_secs[origin], 4)
+        np.testing.assert_array_equal(tau[:, origin], single[:, 0])
+        index = multi.compiled.station_index[station.id]
+        assert station_tau[0, origin, index] == dep_secs[origin]
+
+
+def test_multi_raptor_scan_route(timetable: Timetable):
+    """Test scanning route with overtaking trips equals scanning FIFO route"""
+    multi = MultiRaptorAlgorithm(timetable)
+    compiled = multi.compiled
+    rng = np.random.default_rng(0)
+
+    for route in range(compiled.n_routes):
+        route_dep = compiled.route_departures(route)[:, 1:]
+        n_stops = route_dep.shape[1]
+        boarding_times = rng.integers(6 * 3600, 9 * 3600, size=(3, n_stops))
+        boarding_times[rng.random((3, n_stops)) < 0.5] = LARGE_NUMBER
+
+        np.testing.assert_array_equal(
+            multi.scan_route_fifo(route, 1, boarding_times),
+            multi.scan_route(
+                route_dep, compiled.route_arrivals(route)[:, 1:], boarding_times
+            ),
+        )
+
+
+def test_multi_raptor_overnight(multi_day_timetable: Timetable):
+    """Test multi RAPTOR only uses trips running on date and the next day"""
+    stations = [multi_day_timetable.stations.get(name) for name in ["A", "C"]]
+    from_stops = [station.stops for station in stations]
+
+    for date, overnight in [("20211201", False), ("20211201", True), ("20211202", True)]:
+        multi = MultiRaptorAlgorithm(multi_day_timetable, date, overnight)
+        multi.run(from_stops, 20000, 4)
+        raptor = RaptorAlgorithm(multi_day_timetable, "python", date, overnight)
+        for origin, station in enumerate(stations):
+            raptor.run(station.stops, 20000, 4)
+            np.testing.assert_array_equal(
+                raptor.station_arrival_times()[4],
+                multi.station_arrival_times()[4, origin],
+            )
+
+    index = multi.compiled.station_index[multi_day_timetable.stations.get("F").id]
+    assert multi.station_arrival_times()[4, 0, index] == LARGE_NUMBER
@@ -0,0 +1,122 @@
+"""Test travel time matrix"""
+import numpy as np
+import pytest
+
+from pyraptor import od_matrix
+from pyraptor.gtfs.generator import generate_timetable
+from pyraptor.model.compiled import compile_timetable
+from pyraptor.model.raptor import BACKENDS
+from pyraptor.query_raptor import run_raptor
+from pyraptor.util import LARGE_NUMBER
+
+
+def test_has_main():
+    """Has main"""
+    assert od_matrix.main
+
+
+@pytest.fixture(name="timetable")
+def fixture_timetable():
+    """Generated timetable"""
+    return generate_timetable(stations=100, routes=20, stops_per_route=8)
+
+
+def test_od_matrix(timetable):
+    """Test matrix has the arrival times of the journeys of RAPTOR"""
+    origins = [station.name for station in timetable.stations][:4]
+    dep_secs = 7 * 3600
+
+    # All origins are routed at once with at most k trips in round k, like RAPTOR
+    matrix = od_matrix.od_matrix(timetable, origins, dep_secs, 20)
+    assert matrix.arrival_times.shape == (len(origins), len(matrix.destinations))
+
+    for row, origin in enumerate(origins):
+        journeys = run_raptor(timetable, origin, dep_secs, 20)
+        for column, destination in enumerate(matrix.destinations):
+            if destination == origin:
+                assert matrix.travel_times[row, column] == 0
+                assert matrix.n_trips[row, column] == 0
+            elif destination in journeys:
+                assert matrix.arrival_times[row, column] == journeys[destination].arr()
+            else:
+                assert matrix.arrival_times[row, column] == LARGE_NUMBER
+                assert matrix.n_trips[row, column] == -1
+
+
+def test_od_matrix_n_trips(timetable):
+    """Test number of trips is the fewest rounds with the earliest arrival time"""
+    origins = [station.name for station in timetable.stations][:4]
+    matrix = od_matrix.od_matrix(timetable, origins, 7 * 3600, 4)
+
+    n_trips = np.full(matrix.n_trips.shape, -1)
+    for rounds in range(4, -1, -1):
+        arrival_times = od_matrix.od_matrix(timetable, origins, 7 * 3600, rounds)
+        earliest = arrival_times.reachable & (
+            arrival_times.arrival_times == matrix.arrival_times
+        )
+        n_trips[earliest] = rounds
+    np.testing.assert_array_equal(matrix.n_trips, n_trips)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_od_matrix_window(timetable, backend: str):
+    """Test matrix with window has the shortest travel times of all departures"""
+    origin = next(iter(timetable.stations))
+    dep_secs, dep_secs_max = 7 * 3600, 8 * 3600
+
+    matrix = od_matrix.od_matrix(
+        timetable, [origin.name], dep_secs, 20, backend, dep_secs_max=dep_secs_max
+    )
+
+    departures = compile_timetable(timetable).departures_in_range(
+        origin.stops, dep_secs, dep_secs_max
+    )
+    assert len(departures) > 1
+    travel_times = np.full(len(matrix.destinations), LARGE_NUMBER)
+    for dep in departures:
+        single = od_matrix.od_matrix(timetable, [origin.name], dep, 20)
+        travel_times = np.minimum(travel_times, single.travel_times[0])
+    np.testing.assert_array_equal(matrix.travel_times[0], travel_times)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_od_matrix_window_n_trips(backend: str):
+    """Test matrix with window has the trips of the departure time taken"""
+    timetable = generate_timetable(stations=100, routes=40, stops_per_route=8)
+    origins = [station.name for station in timetable.stations][:5]
+    rounds = 3
+
+    matrix = od_matrix.od_matrix(
+        timetable, origins, 7 * 3600, rounds, backend, dep_secs_max=8 * 3600
+    )
+
+    for row, origin in enumerate(origins):
+        for dep in np.unique(matrix.departure_times[row][matrix.reachable[row]]):
+            single = od_matrix.od_matrix(timetable, [origin], int(dep), rounds)
+            columns = matrix.reachable[row] & (matrix.departure_times[row] == dep)
+            np.testing.assert_array_equal(
+                matrix.arrival_times[row, columns], single.arrival_times[0, columns]
+            )
+            np.testing.assert_array_equal(
+                matrix.n_trips[row, columns], single.n_trips[0, columns]
+            )
+
+
+def test_write_od_matrix(timetable, tmp_path):
+    """Test writing matrix"""
+    origins = [station.name for station in timetable.stations][:2]
+    matrix = od_matrix.od_matrix(timetable, origins, 7 * 3600, 4)
+
+    od_matrix.write_od_matrix(tmp_path / "matrix.npz", matrix)
+    read_matrix = od_matrix.read_od_matrix(tmp_path / "matrix.npz")
+    assert read_matrix.origins == matrix.origins
+    assert read_matrix.destinations == matrix.destinations
+    np.testing.assert_array_equal(read_matrix.arrival_times, matrix.arrival_times)
+    np.testing.assert_array_equal(read_matrix.n_trips, matrix.n_trips)
+
+    frame = matrix.to_frame()
+    assert len(frame) == matrix.reachable.sum()
+    assert (frame.arrival_time - frame.departure_time == frame.travel_time).all()
+
+    with pytest.raises(ValueError):
+        od_matrix.write_od_matrix(tmp_path / "matrix.csv", matrix)
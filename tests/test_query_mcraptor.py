@@ -1,7 +1,19 @@
 """Test Query McRaptor"""
+import random
 from bdb import set_trace
+
+import numpy as np
+import pytest
+
 from pyraptor import query_mcraptor
-from pyraptor.model.mcraptor import pareto_set
+from pyraptor.gtfs.generator import generate_timetable
+from pyraptor.model.mcraptor import (
+    McRaptorAlgorithm,
+    pareto_set,
+    best_labels_to_destination_station,
+    best_legs_to_destination_station,
+    reconstruct_journeys,
+)
 from pyraptor.model.structures import Stop, Label
 
 
@@ -98,3 +110,101 @@ def test_pareto_set():
     expected2 = [label_0, label_1, label_2, label_3]
 
     assert labels1 == expected1 and labels2 == expected2
+
+
+def pareto_set_quadratic(labels, keep_equal=False):
+    """Pareto set by comparing every label with all efficient labels"""
+    is_efficient = np.ones(len(labels), dtype=bool)
+    labels_criteria = np.array([label.criteria for label in labels])
+    for i, label in enumerate(labels_criteria):
+        if is_efficient[i]:
+            is_efficient[is_efficient] = np.any(
+                labels_criteria[is_efficient] < label, axis=1
+            ) + keep_equal * np.all(labels_criteria[is_efficient] == label, axis=1)
+            is_efficient[i] = True
+    return [label for label, efficient in zip(labels, is_efficient) if efficient]
+
+
+def test_pareto_set_large():
+    """Test pareto set of many labels equals quadratic pareto set"""
+    rng = random.Random(0)
+    stop = Stop(1, 1, "UT", "13")
+
+    for n_labels, spread in [(10, 3), (100, 10), (500, 1000), (500, 50)]:
+        labels = [
+            Label(rng.randint(0, spread), rng.randint(0, spread), 0, stop, rng.randint(0, 4))
+            for _ in range(n_labels)
+        ]
+        for keep_equal in [False, True]:
+            expected = pareto_set_quadratic(labels, keep_equal)
+            actual = pareto_set(labels, keep_equal)
+            assert [id(l) for l in actual] == [id(l) for l in expected]
+
+
+def test_run_mcraptor_date(multi_day_timetable):
+    """Test run mcraptor only uses trips running on date"""
+    for date, first_hour in [("20211201", False), ("20211202", True)]:
+        journeys_to_destinations = query_mcraptor.run_mcraptor(
+            multi_day_timetable, "A", 0, 4, date=date
+        )
+        arrivals = [jrny.arr() for jrny in journeys_to_destinations["F"]]
+
+        assert min(arrivals) < 3600 if first_hour else min(arrivals) > 3600
+
+
+def test_run_mcraptor_stats(default_timetable):
+    """Test run mcraptor returns statistics of the query"""
+    journeys_to_destinations, stats = query_mcraptor.run_mcraptor(
+        default_timetable, "A", 0, 4, return_stats=True
+    )
+    assert len(journeys_to_destinations["F"]) > 0
+
+    assert stats.runs == 1
+    assert len(stats.rounds) > 0 and stats.rounds[0].routes > 0
+    assert 0 < stats.improvements <= stats.evaluations
+    assert stats.reconstruction_time > 0
+
+
+def test_reconstruct_journeys():
+    """Test a journey is reconstructed for every Pareto-optimal destination label"""
+    timetable = generate_timetable(stations=100, routes=20, stops_per_route=8)
+    origin = next(iter(timetable.stations))
+    rounds = 4
+
+    bag_round_stop, _ = McRaptorAlgorithm(timetable).run(origin.stops, 7 * 3600, rounds)
+    for station in timetable.stations:
+        if station == origin:
+            continue
+        destination_labels = best_labels_to_destination_station(
+            station.stops, bag_round_stop[rounds]
+        )
+        journeys = reconstruct_journeys(destination_labels)
+        assert len(journeys) == len(destination_labels)
+
+        for jrny, (_, label) in zip(journeys, destination_labels):
+            assert jrny.is_valid()
+            assert jrny.from_stop() in origin.stops
+            assert jrny.to_stop().station == station
+            assert jrny.arr() == label.earliest_arrival_time
+            assert jrny.fare() == label.fare
+            assert jrny.number_of_trips() == label.n_trips
+
+
+def test_best_legs_to_destination_station_deprecated():
+    """Test the deprecated best legs give the last legs of the best labels"""
+    timetable = generate_timetable(stations=50, routes=10, stops_per_route=8)
+    origin, destination = list(timetable.stations)[:2]
+    rounds = 4
+
+    bag_round_stop, _ = McRaptorAlgorithm(timetable).run(origin.stops, 7 * 3600, rounds)
+    destination_labels = best_labels_to_destination_station(
+        destination.stops, bag_round_stop[rounds]
+    )
+    with pytest.warns(DeprecationWarning):
+        legs = best_legs_to_destination_station(destination.stops, bag_round_stop[rounds])
+
+    assert len(legs) == len(destination_labels)
+    for leg, (to_stop, label) in zip(legs, destination_labels):
+        assert leg.to_stop == to_stop
+        assert leg.trip == label.trip
+        assert leg.earliest_arrival_time == label.earliest_arrival_time
@@ -35,3 +35,12 @@ def test_query_range_mcraptor(default_timetable: Timetable):
 
     for journey in journeys_to_destinations[destination_station][::-1]:
         assert len(journey) == 2, "should use 2 trips from A to F"
+
+
+def test_query_range_mcraptor_stats(default_timetable: Timetable):
+    """Test statistics of range query are summed over runs"""
+    _, stats = query_range_mcraptor.run_range_mcraptor(
+        default_timetable, "A", 60, 4000, 4, return_stats=True
+    )
+    assert stats.runs > 1
+    assert len(stats.rounds) >= stats.runs
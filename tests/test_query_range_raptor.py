@@ -1,6 +1,11 @@
 """Test Range Query for Raptor"""
+import numpy as np
+import pytest
+
 from pyraptor import query_range_raptor
+from pyraptor.gtfs.generator import generate_timetable
 from pyraptor.model.structures import Timetable
+from pyraptor.model.raptor import RaptorAlgorithm, BACKENDS
 
 
 def test_has_main():
@@ -8,7 +13,8 @@ def test_has_main():
     assert query_range_raptor.main
 
 
-def test_query_range_raptor(default_timetable: Timetable):
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_query_range_raptor(default_timetable: Timetable, backend: str):
     """Test perform range raptor"""
     origin_station = "A"
     destination_station = "F"
@@ -22,6 +28,7 @@ def test_query_range_raptor(default_timetable: Timetable):
         dep_secs_min,
         dep_secs_max,
         rounds,
+        backend,
     )
     for jrny in journeys_to_destinations[destination_station]:
         jrny.print()
@@ -34,4 +41,49 @@ def test_query_range_raptor(default_timetable: Timetable):
     ), "should have 2 travel options"
 
     for journey in journeys_to_destinations[destination_station][::-1]:
-        assert len(journey) == 3, "should use 3 stops from A to F"
+        assert len(journey) == 2, "should use 2 trips from A to F via C"
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_raptor_keep_labels(default_timetable: Timetable, backend: str):
+    """Test keeping labels of later departure equals running from scratch"""
+    from_stops = default_timetable.stations.get_stops("A")
+    rounds = 4
+
+    raptor = RaptorAlgorithm(default_timetable, backend)
+    raptor.run(from_stops, 3000, rounds)
+    bag_round_stop = raptor.run(from_stops, 60, rounds, keep_labels=True)
+    expected = RaptorAlgorithm(default_timetable, backend).run(from_stops, 60, rounds)
+
+    for stop in default_timetable.stops:
+        assert (
+            bag_round_stop[rounds][stop].earliest_arrival_time
+            == expected[rounds][stop].earliest_arrival_time
+        )
+
+    with pytest.raises(ValueError):
+        raptor.run(from_stops, 3000, rounds, keep_labels=True)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_raptor_keep_labels_generated(backend: str):
+    """Test kept labels equal labels of a new run in every round on generated network"""
+    timetable = generate_timetable(stations=100, routes=40, stops_per_route=8)
+    rounds = 3
+    fresh = RaptorAlgorithm(timetable, backend)
+
+    for station in list(timetable.stations)[:10]:
+        raptor = RaptorAlgorithm(timetable, backend)
+        previous = None
+        for dep_secs in range(9 * 3600, 6 * 3600, -600):
+            raptor.run(
+                station.stops, dep_secs, rounds, keep_labels=previous is not None
+            )
+            fresh.run(station.stops, dep_secs, rounds)
+            labels = np.asarray(raptor.tau)
+            np.testing.assert_array_equal(labels[1:], np.asarray(fresh.tau)[1:])
+            if previous is not None:
+                assert np.all(
+                    labels <= previous
+                ), "earlier departure should not arrive later"
+            previous = labels.copy()
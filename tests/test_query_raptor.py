@@ -1,6 +1,18 @@
 """Test Query Raptor"""
+import numpy as np
+import pytest
+
 from pyraptor import query_raptor
+from pyraptor.gtfs.generator import generate_timetable
 from pyraptor.model.structures import Timetable
+from pyraptor.model.raptor import (
+    RaptorAlgorithm,
+    BACKENDS,
+    best_stop_at_target_station,
+    first_round_with_arrival,
+    reconstruct_journey,
+)
+from pyraptor.util import LARGE_NUMBER
 
 
 def test_has_main():
@@ -8,7 +20,8 @@ def test_has_main():
     assert query_raptor.main
 
 
-def test_query_raptor(default_timetable: Timetable):
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_query_raptor(default_timetable: Timetable, backend: str):
     """Test query raptor"""
     origin_station = "A"
     destination_station = "F"
@@ -20,10 +33,195 @@ def test_query_raptor(default_timetable: Timetable):
         origin_station,
         dep_secs,
         rounds,
+        backend,
     )
     journey = journey_to_destinations[destination_station]
     assert journey is not None, "destination should be reachable"
 
     journey.print(dep_secs=dep_secs)
 
-    assert len(journey) == 3, "should have 3 trips in journey"
+    assert len(journey) == 2, "should have 2 trips in journey"
+
+
+def test_reconstruct_journey_single_round(default_timetable: Timetable):
+    """Test journey is reconstructed from the labels of a single round"""
+    raptor = RaptorAlgorithm(default_timetable)
+    bag_round_stop = raptor.run(default_timetable.stations.get("A").stops, 0, 4)
+    dest_stop = best_stop_at_target_station(
+        default_timetable.stations.get("F").stops, bag_round_stop[4]
+    )
+
+    journey = reconstruct_journey(dest_stop, bag_round_stop[4])
+    assert journey.arr() == reconstruct_journey(dest_stop, bag_round_stop, 4).arr()
+    assert journey[0].from_stop.station.name == "A"
+    assert journey[-1].to_stop is dest_stop
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_query_raptor_destination(default_timetable: Timetable, backend: str):
+    """Test query raptor with target pruning for destination station"""
+    journey_to_destinations = query_raptor.run_raptor(
+        default_timetable, "A", 0, 4, backend, destination_station="F"
+    )
+    expected = query_raptor.run_raptor(default_timetable, "A", 0, 4, backend)
+
+    assert list(journey_to_destinations.keys()) == ["F"], "should only query F"
+    assert journey_to_destinations["F"].arr() == expected["F"].arr()
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_query_raptor_date(multi_day_timetable: Timetable, backend: str):
+    """Test query raptor only uses trips running on date"""
+    journeys = {
+        date: query_raptor.run_raptor(
+            multi_day_timetable, "A", 0, 4, backend, date=date
+        )["F"]
+        for date in multi_day_timetable.service_dates
+    }
+
+    assert journeys["20211201"].arr() > 3600, "should take trips of second hour"
+    assert journeys["20211202"].arr() < 3600, "should take trips of first hour"
+
+    with pytest.raises(ValueError):
+        query_raptor.run_raptor(multi_day_timetable, "A", 0, 4, backend)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_query_raptor_overnight(multi_day_timetable: Timetable, backend: str):
+    """Test query raptor continues with trips of the next day"""
+    dep_secs = 20000  # after the last trip
+
+    journeys = query_raptor.run_raptor(
+        multi_day_timetable, "A", dep_secs, 4, backend, date="20211201"
+    )
+    assert "F" not in journeys, "should have no trips after departure"
+
+    journeys = query_raptor.run_raptor(
+        multi_day_timetable, "A", dep_secs, 4, backend, date="20211201", overnight=True
+    )
+    journey = journeys["F"]
+    assert journey.dep() == 86400 + 100, "should take first trip of next day"
+    assert journey.arr() < 86400 + 3600
+
+    journeys = query_raptor.run_raptor(
+        multi_day_timetable, "A", dep_secs, 4, backend, date="20211202", overnight=True
+    )
+    assert "F" not in journeys, "should have no next day in timetable"
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_query_raptor_stats(default_timetable: Timetable, backend: str):
+    """Test query raptor returns statistics of the query"""
+    journey_to_destinations, stats = query_raptor.run_raptor(
+        default_timetable, "A", 0, 4, backend, return_stats=True
+    )
+    assert journey_to_destinations["F"].to_list() == (
+        query_raptor.run_raptor(default_timetable, "A", 0, 4, backend)["F"].to_list()
+    )
+
+    assert stats.runs == 1
+    assert [r.round for r in stats.rounds] == list(range(1, len(stats.rounds) + 1))
+    assert stats.rounds[0].marked_stops == len(default_timetable.stations.get("A").stops)
+    assert stats.routes > 0 and stats.transfers > 0
+    assert 0 < stats.improvements <= stats.evaluations
+    assert stats.total_time == pytest.approx(sum(stats.phase_times.values()))
+    assert stats.to_dict()["evaluations"] == stats.evaluations
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_query_raptor_trips_per_round(backend: str):
+    """Test journeys of round k have at most k trips"""
+    timetable = generate_timetable(stations=100, routes=20, stops_per_route=8)
+    origins = [station.name for station in timetable.stations][:5]
+
+    for rounds in range(1, 5):
+        for origin in origins:
+            journeys = query_raptor.run_raptor(
+                timetable, origin, 7 * 3600, rounds, backend
+            )
+            for journey in journeys.values():
+                assert all(leg.trip is not None for leg in journey)
+                assert 1 <= len(journey) <= rounds
+
+
+def test_query_raptor_backends():
+    """Test backends have equal labels in every round on a generated timetable"""
+    timetable = generate_timetable(stations=200, routes=30, stops_per_route=10)
+    stations = list(timetable.stations)
+    python = RaptorAlgorithm(timetable, "python")
+    numpy = RaptorAlgorithm(timetable, "numpy")
+
+    for origin, destination in zip(stations[:10], stations[-10:]):
+        for to_stops in [None, destination.stops]:
+            python.run(origin.stops, 7 * 3600, 4, to_stops=to_stops)
+            numpy.run(origin.stops, 7 * 3600, 4, to_stops=to_stops)
+            if to_stops is None:
+                np.testing.assert_array_equal(python.tau, numpy.tau)
+            else:
+                target = python.compiled.stop_indices(to_stops)
+                np.testing.assert_array_equal(
+                    np.asarray(python.tau)[:, target], numpy.tau[:, target]
+                )
+
+
+@pytest.mark.parametrize("destination_station", [None, "F"])
+def test_query_raptor_csa(default_timetable: Timetable, destination_station: str):
+    """Test query with Connection Scan Algorithm gives the journeys of RAPTOR"""
+    journeys = query_raptor.run_raptor(
+        default_timetable, "A", 0, 4, destination_station=destination_station
+    )
+    csa_journeys, stats = query_raptor.run_raptor(
+        default_timetable,
+        "A",
+        0,
+        4,
+        destination_station=destination_station,
+        return_stats=True,
+        engine="csa",
+    )
+
+    assert csa_journeys.keys() == journeys.keys()
+    for station, journey in csa_journeys.items():
+        assert journey.arr() == journeys[station].arr()
+    assert stats.evaluations > 0
+
+    with pytest.raises(ValueError):
+        query_raptor.run_raptor(default_timetable, "A", 0, 4, engine="unknown")
+
+
+def test_query_raptor_csa_overnight(multi_day_timetable: Timetable):
+    """Test query with Connection Scan Algorithm continues with trips of the next day"""
+    journeys = query_raptor.run_raptor(
+        multi_day_timetable, "A", 20000, 4, date="20211201", engine="csa"
+    )
+    assert "F" not in journeys, "should have no trips after departure"
+
+    journeys = query_raptor.run_raptor(
+        multi_day_timetable,
+        "A",
+        20000,
+        4,
+        date="20211201",
+        overnight=True,
+        engine="csa",
+    )
+    assert journeys["F"].dep() == 86400 + 100, "should take first trip of next day"
+
+
+def test_first_round_with_arrival():
+    """Test the fewest trips is the first round with the earliest arrival time"""
+    station_tau = np.array(
+        [
+            [0, LARGE_NUMBER, LARGE_NUMBER, LARGE_NUMBER],
+            [0, 500, LARGE_NUMBER, LARGE_NUMBER],
+            [0, 500, 900, LARGE_NUMBER],
+            [0, 400, 900, LARGE_NUMBER],
+        ]
+    )
+    np.testing.assert_array_equal(first_round_with_arrival(station_tau), [0, 3, 2, -1])
+
+    # Rounds stay on the first axis with an axis per origin
+    multi_tau = np.stack([station_tau, station_tau[:, ::-1]], axis=1)
+    np.testing.assert_array_equal(
+        first_round_with_arrival(multi_tau), [[0, 3, 2, -1], [-1, 2, 3, 0]]
+    )
@@ -0,0 +1,106 @@
+"""Test query server"""
+import json
+import asyncio
+from http import HTTPStatus
+from concurrent.futures import ThreadPoolExecutor
+
+from pyraptor import server, od_matrix, isochrone
+from pyraptor.dao import write_timetable
+from pyraptor.model.structures import Timetable
+from pyraptor.query_raptor import run_raptor
+from pyraptor.query_mcraptor import run_mcraptor
+
+
+def test_has_main():
+    """Has main"""
+    assert server.main
+
+
+async def get(port, target):
+    """Status and JSON body of GET request"""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"GET {target} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, body = response.split(b"\r\n\r\n", 1)
+    return int(head.split()[1]), json.loads(body)
+
+
+def test_query_server(default_timetable: Timetable, tmp_path):
+    """Test queries served from worker process"""
+    write_timetable(tmp_path, default_timetable)
+
+    async def queries():
+        with server.QueryServer(tmp_path, workers=1, queue_size=5) as query_server:
+            await query_server.start("127.0.0.1", 0)
+            port = query_server.port
+            return await asyncio.gather(
+                get(port, "/raptor?origin=A&time=00:00:00&rounds=4&destination=F"),
+                get(port, "/mcraptor?origin=A&time=00:00:00&rounds=4"),
+                get(port, "/raptor?origin=Unknown&time=00:00:00"),
+                get(port, "/raptor?origin=A"),
+                get(port, "/unknown"),
+                get(port, "/od_matrix?origins=A,C&time=00:00:00&rounds=4"),
+                get(port, "/isochrone?origin=A&time=00:00:00&thresholds=10,20"),
+            )
+
+    (
+        raptor,
+        mcraptor,
+        unknown_station,
+        missing_time,
+        unknown_query,
+        matrix,
+        isochrone_,
+    ) = asyncio.run(queries())
+
+    expected = run_raptor(default_timetable, "A", 0, 4)["F"].to_list()
+    assert raptor == (200, {"F": [expected]})
+
+    expected = [j.to_list() for j in run_mcraptor(default_timetable, "A", 0, 4)["F"]]
+    assert mcraptor[0] == 200
+    assert mcraptor[1]["F"] == expected
+
+    assert unknown_station[0] == 400
+    assert missing_time == (400, {"error": "Missing parameter 'time'"})
+    assert unknown_query[0] == 404
+
+    expected = od_matrix.od_matrix(default_timetable, ["A", "C"], 0, 4).to_dict()
+    assert matrix == (200, expected)
+
+    expected = isochrone.run_isochrone(default_timetable, "A", 0, 5)
+    assert isochrone_ == (200, json.loads(json.dumps(expected.to_dict([600, 1200]))))
+
+
+def test_query_server_errors(default_timetable: Timetable, tmp_path, monkeypatch):
+    """Test missing parameters are client errors, errors of the query are not"""
+    monkeypatch.setattr(server, "_timetable", default_timetable)
+
+    def failing_query(*args, **kwargs):
+        raise KeyError("stop")
+
+    monkeypatch.setattr(server, "run_raptor", failing_query)
+
+    async def respond(target):
+        reader = asyncio.StreamReader()
+        reader.feed_data(f"GET {target} HTTP/1.1\r\n\r\n".encode())
+        return await query_server.respond(reader)
+
+    async def queries():
+        return await asyncio.gather(
+            respond("/range_raptor?origin=A"),
+            respond("/raptor?origin=A&time=00:00:00"),
+        )
+
+    with server.QueryServer(tmp_path, workers=1) as query_server:
+        # Run queries in this process, so the patched query is used
+        query_server.pool.shutdown()
+        query_server.pool = ThreadPoolExecutor(max_workers=1)
+        missing, failed = asyncio.run(queries())
+
+    assert missing == (
+        HTTPStatus.BAD_REQUEST,
+        {"error": "Missing parameter 'start_time', 'end_time'"},
+    )
+    assert failed == (HTTPStatus.INTERNAL_SERVER_ERROR, {"error": "Query failed"})
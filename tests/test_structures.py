@@ -0,0 +1,94 @@
+"""Test structures"""
+import random
+
+import numpy as np
+
+from pyraptor.model.structures import (
+    Stop,
+    Trip,
+    TripStopTime,
+    Routes,
+    Bag,
+    Label,
+    pareto_set,
+)
+
+
+def to_trip(stops, times, hint=None) -> Trip:
+    """Trip along stops with (arrival, departure) times"""
+    trip = Trip(hint=hint)
+    for stopidx, (stop, (dts_arr, dts_dep)) in enumerate(zip(stops, times)):
+        trip.add_stop_time(TripStopTime(trip, stopidx, stop, dts_arr, dts_dep))
+    return trip
+
+
+def test_routes_split_overtaking_trips():
+    """Test splitting trips with same stops in FIFO routes"""
+    stops = [Stop(i, i) for i in range(3)]
+
+    slow = to_trip(stops, [(0, 0), (600, 600), (1200, 1200)], hint="slow")
+    fast = to_trip(stops, [(60, 60), (300, 300), (500, 500)], hint="fast")
+    late = to_trip(stops, [(900, 900), (1500, 1500), (2100, 2100)], hint="late")
+    early = to_trip(stops, [(-600, -600), (0, 0), (600, 600)], hint="early")
+
+    routes = Routes()
+    for trip in [late, slow, fast, early]:
+        routes.add(trip)
+
+    assert len(routes) == 2, "fast trip overtakes slow trip"
+    for route in routes:
+        assert route.fifo
+        assert route.stops == stops
+
+    route = routes.get_routes_of_stop(stops[0])[0]
+    assert route.trips == [early, slow, late], "trips should be ordered"
+    assert route.earliest_trip(1, stops[0]) is late
+    assert route.earliest_trip(0, stops[1]) is early
+    assert route.earliest_trip(601, stops[2]) is slow
+    assert route.earliest_trip(2101, stops[2]) is None
+
+
+def test_routes_trips_without_times():
+    """Test trips with missing times are compared on the times of both trips"""
+    stops = [Stop(i, i) for i in range(3)]
+
+    first = to_trip(stops, [(0, 0), (600, 600), (1200, 1200)], hint="first")
+    skips = to_trip(stops, [(300, 300), (np.nan, np.nan), (1500, 1500)], hint="skips")
+    fast = to_trip(stops, [(400, 400), (500, 500), (1800, 1800)], hint="fast")
+
+    routes = Routes()
+    for trip in [first, skips]:
+        routes.add(trip)
+    assert len(routes) == 1, "trip without time at a stop does not overtake"
+    assert routes.get_routes_of_stop(stops[0])[0].trips == [first, skips]
+
+    # Fast trip overtakes the first trip at the stop without time of skips
+    routes.add(fast)
+    assert len(routes) == 2
+    for route in routes:
+        assert route.fifo
+        assert route.first_departures() == [
+            trip.stop_times[0].dts_dep for trip in route.trips
+        ]
+
+
+def test_bag_merge():
+    """Test merging bags gives the pareto set of all labels"""
+    rng = random.Random(0)
+
+    def random_labels(n):
+        return [
+            Label(rng.randint(0, 4), rng.randint(0, 4), None, None, rng.randint(0, 2))
+            for _ in range(n)
+        ]
+
+    for _ in range(1000):
+        bag = Bag(labels=pareto_set(random_labels(5)))
+        other_bag = Bag(labels=random_labels(rng.randint(0, 5)))
+
+        merged = bag.merge(other_bag)
+        expected = pareto_set(bag.labels + other_bag.labels)
+        assert [id(l) for l in merged.labels] == [id(l) for l in expected]
+        assert merged.update == (expected != bag.labels)
+
+    assert not Bag().merge(Bag()).update
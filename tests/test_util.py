@@ -0,0 +1,23 @@
+"""Test utility functions"""
+import pandas as pd
+
+from pyraptor.util import str2sec, str2sec_series, sec2str_series
+
+
+def test_str2sec_series():
+    """Test vectorised conversion of times equals str2sec"""
+    times = ["08:00:00", "23:59:59", "25:13:07", " 7:05:09", "00:00", "123:45"]
+
+    seconds = str2sec_series(pd.Series(times))
+
+    assert seconds.tolist() == [str2sec(time) for time in times]
+
+    seconds = str2sec_series(pd.Series(["08:00", None, "10:00:01"]))
+    assert seconds[0] == 28800 and pd.isna(seconds[1]) and seconds[2] == 36001
+
+
+def test_sec2str_series():
+    """Test vectorised conversion of seconds is inverse of str2sec_series"""
+    times = pd.Series(["00:00:00", "08:05:09", "23:59:59", "25:13:07", "123:45:00"])
+
+    assert sec2str_series(str2sec_series(times)).tolist() == times.tolist()